@@ -0,0 +1,193 @@
+#!/usr/bin/python3
+
+import numpy as np
+import bitboard
+import evaluation
+import position_store
+
+# Scores many positions at once with NumPy, term for term the same as
+# evaluation.evaluation_terms; evaluate_batch totals just the terms the search
+# uses, so it matches evaluation.evaluate. A batch of N positions is packed
+# into an (N, 12) array of piece planes: one 64-bit bitboard per colour and
+# piece type, white's six first, in bitboard.PIECE_NAMES order. Every term is then worked out with
+# whole-array operations - sliding piece attacks by Kogge-Stone fills, which
+# spread every piece of a type along a direction at once - so there is no
+# Python loop over positions or pieces.
+# NumPy is only needed by this module.
+
+PLANES = tuple((colour, name) for colour in ("white", "black") for name in bitboard.PIECE_NAMES)
+PLANE_INDEX = {plane: index for index, plane in enumerate(PLANES)}
+
+# Bits set in each byte value, for counting bits a byte at a time
+BYTE_COUNTS = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.int64)
+
+# What the pieces of a plane are worth, piece-square bonus included, for
+# every value of every byte of the plane's bitboard. Signed for black, so a
+# position's score is the sum of one lookup per plane and byte.
+SQUARE_VALUES = np.array([evaluation.SQUARE_VALUES[colour][name] for colour, name in PLANES], dtype=np.int64)
+BYTE_BITS = (np.arange(256)[:, None] >> np.arange(8)) & 1
+BYTE_VALUES = np.einsum("pbk,vk->pbv", SQUARE_VALUES.reshape(len(PLANES), 8, 8), BYTE_BITS)
+MATERIAL_VALUES = np.array([(1 if colour == "white" else -1) * evaluation.PIECE_VALUES[name]
+                            for colour, name in PLANES], dtype=np.int64)
+
+KNIGHT_JUMPS = ((17, bitboard.NOT_FILE_A), (15, bitboard.NOT_FILE_H), (10, bitboard.NOT_FILE_AB),
+                (6, bitboard.NOT_FILE_GH), (-6, bitboard.NOT_FILE_AB), (-10, bitboard.NOT_FILE_GH),
+                (-15, bitboard.NOT_FILE_A), (-17, bitboard.NOT_FILE_H))
+ROOK_DIRECTIONS = ("north", "south", "east", "west")
+BISHOP_DIRECTIONS = ("north_east", "north_west", "south_east", "south_west")
+SLIDER_DIRECTIONS = {"Queen": ROOK_DIRECTIONS + BISHOP_DIRECTIONS, "Rook": ROOK_DIRECTIONS,
+                     "Bishop": BISHOP_DIRECTIONS}
+
+
+def pack_planes(game_states):
+    """Packs GameStates into an (N, 12) array of piece planes."""
+    boards = [[game_state.bitboards.pieces[colour][name] for colour, name in PLANES]
+              for game_state in game_states]
+    return np.array(boards, dtype=np.uint64).reshape(-1, len(PLANES))
+
+
+def store_planes(store):
+    """Packs every position in a position_store.PositionStore into an (N, 12)
+    array of piece planes, straight from the mapped records without building
+    any GameStates."""
+    records = np.frombuffer(store.map, dtype=np.uint8, count=len(store) * position_store.RECORD_SIZE,
+                            offset=position_store.HEADER_SIZE).reshape(-1, position_store.RECORD_SIZE)
+    occupied = records[:, :8].copy().view("<u8")[:, 0]
+    # Piece codes, one per nibble, for the set bits of the occupancy in order
+    packed_codes = records[:, 8:24]
+    codes = np.empty((len(records), 32), dtype=np.uint8)
+    codes[:, 0::2] = packed_codes & 0xF
+    codes[:, 1::2] = packed_codes >> 4
+
+    squares = square_bits(occupied)
+    # The nth set square gets the nth code
+    ordinals = np.cumsum(squares, axis=1) - 1
+    square_codes = np.where(squares, np.take_along_axis(codes, np.clip(ordinals, 0, 31), axis=1), 0)
+
+    planes = np.zeros((len(records), len(PLANES)), dtype=np.uint64)
+    square_masks = np.left_shift(np.uint64(1), np.arange(64, dtype=np.uint64))
+    for code, piece_type in position_store.PIECE_TYPES.items():
+        for colour, colour_bit in (("white", 0), ("black", 8)):
+            plane = PLANE_INDEX[(colour, piece_type.name)]
+            on_square = square_codes == code | colour_bit
+            planes[:, plane] = np.bitwise_or.reduce(np.where(on_square, square_masks, np.uint64(0)), axis=1)
+    return planes
+
+
+def square_bits(boards):
+    """Turns an array of bitboards into an array with a trailing axis of 64 0/1
+    values, one per bit index."""
+    boards = np.ascontiguousarray(boards, dtype="<u8")
+    bits = np.unpackbits(boards.view(np.uint8).reshape(boards.shape + (8,)), axis=-1, bitorder="little")
+    return bits.reshape(boards.shape + (64,))
+
+
+def count_bits(boards):
+    """Counts the set bits of every bitboard in an array."""
+    if hasattr(np, "bitwise_count"):
+        # NumPy 2 counts bits itself
+        return np.bitwise_count(boards).astype(np.int64)
+    boards = np.ascontiguousarray(boards, dtype="<u8")
+    return BYTE_COUNTS[boards.view(np.uint8).reshape(boards.shape + (8,))].sum(axis=-1)
+
+
+def shift(boards, amount):
+    """Shifts bitboards towards h8 (positive amounts) or a1 (negative ones)."""
+    if amount > 0:
+        return np.left_shift(boards, np.uint64(amount))
+    return np.right_shift(boards, np.uint64(-amount))
+
+
+def slide(boards, empty, direction):
+    """Gives the squares pieces on bitboards attack along one direction, up to
+    and including the first occupied square, by a Kogge-Stone fill."""
+    step, wrap = bitboard.DIRECTIONS[direction]
+    wrap = np.uint64(wrap)
+    propagators = empty & wrap
+    boards = boards | (propagators & shift(boards, step))
+    propagators = propagators & shift(propagators, step)
+    boards = boards | (propagators & shift(boards, 2 * step))
+    propagators = propagators & shift(propagators, 2 * step)
+    boards = boards | (propagators & shift(boards, 4 * step))
+    return shift(boards, step) & wrap
+
+
+def front_spans(pawns, colour):
+    """Gives the squares in front of a colour's pawns, on their own files and
+    the files either side."""
+    step = 8 if colour == "white" else -8
+    span = shift(pawns, step)
+    for fill in (step, 2 * step, 4 * step):
+        span = span | shift(span, fill)
+    return (span | (shift(span, 1) & np.uint64(bitboard.NOT_FILE_A))
+            | (shift(span, -1) & np.uint64(bitboard.NOT_FILE_H)))
+
+
+def mobility(planes, colour):
+    """Mobility term of one colour for every position in a batch."""
+    offset = 0 if colour == "white" else 6
+    occupied = np.bitwise_or.reduce(planes, axis=1)
+    available = ~np.bitwise_or.reduce(planes[:, offset:offset + 6], axis=1)
+    empty = ~occupied
+    score = np.zeros(len(planes), dtype=np.int64)
+    for name, weight in evaluation.MOBILITY_WEIGHTS.items():
+        pieces = planes[:, PLANE_INDEX[(colour, name)]]
+        if name == "Knight":
+            # Each jump takes every knight to at most one square, so counting
+            # jump by jump counts each knight's squares separately
+            for step, wrap in KNIGHT_JUMPS:
+                score += weight * count_bits(shift(pieces, step) & np.uint64(wrap) & available)
+        else:
+            # Rays along one direction from different pieces never overlap, as
+            # each stops at the first piece in its way
+            for direction in SLIDER_DIRECTIONS[name]:
+                score += weight * count_bits(slide(pieces, empty, direction) & available)
+    return score
+
+
+def pawn_structure(planes, colour):
+    """Pawn structure term of one colour for every position in a batch."""
+    enemy = "black" if colour == "white" else "white"
+    pawns = planes[:, PLANE_INDEX[(colour, "Pawn")]]
+    files = np.array(evaluation.FILES, dtype=np.uint64)
+    neighbours = np.array(evaluation.NEIGHBOUR_FILES, dtype=np.uint64)
+    ranks = np.array(evaluation.RANKS, dtype=np.uint64)
+
+    on_file = count_bits(pawns[:, None] & files)
+    score = evaluation.DOUBLED_PAWN * np.maximum(on_file - 1, 0).sum(axis=1)
+    isolated = (pawns[:, None] & neighbours) == 0
+    score += evaluation.ISOLATED_PAWN * np.where(isolated, on_file, 0).sum(axis=1)
+
+    passed = pawns & ~front_spans(planes[:, PLANE_INDEX[(enemy, "Pawn")]], enemy)
+    passed_bonus = np.array(evaluation.PASSED_PAWN if colour == "white" else evaluation.PASSED_PAWN[::-1],
+                            dtype=np.int64)
+    score += (count_bits(passed[:, None] & ranks) * passed_bonus).sum(axis=1)
+    return score
+
+
+def evaluation_terms(planes):
+    """Scores a batch of positions term by term from white's point of view.
+    Gives a dict from each name in evaluation.TERMS to an array of scores in
+    centipawns, one per position, matching evaluation.evaluation_terms."""
+    planes = np.asarray(planes, dtype=np.uint64)
+    material = count_bits(planes) @ MATERIAL_VALUES
+    plane_bytes = np.ascontiguousarray(planes, dtype="<u8").view(np.uint8).reshape(len(planes), len(PLANES), 8)
+    values = BYTE_VALUES[np.arange(len(PLANES))[:, None], np.arange(8), plane_bytes]
+    piece_square = values.sum(axis=(1, 2)) - material
+    return {"material": material,
+            "piece_square": piece_square,
+            "mobility": mobility(planes, "white") - mobility(planes, "black"),
+            "pawn_structure": pawn_structure(planes, "white") - pawn_structure(planes, "black")}
+
+
+def evaluate_batch(planes, white_to_move=None):
+    """Scores each position in a batch as the search does, with material and
+    piece-square terms only: the same as evaluation.evaluate_white, from
+    white's point of view. Given white_to_move, a boolean per position, the
+    scores are for the side to move instead, the same as evaluation.evaluate.
+    (Adding up evaluation_terms gives a fuller score the search doesn't use.)"""
+    terms = evaluation_terms(planes)
+    scores = terms["material"] + terms["piece_square"]
+    if white_to_move is not None:
+        scores = np.where(np.asarray(white_to_move, dtype=bool), scores, -scores)
+    return scores
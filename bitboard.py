@@ -0,0 +1,397 @@
+#!/usr/bin/python3
+
+import os
+import struct
+import sys
+from array import array
+import mapped_file
+
+# Bitboards are Python ints used as 64-bit sets of squares. Bit number
+# j * 8 + i stands for the square at position (i,j), so a1 is bit 0, h1 is
+# bit 7 and h8 is bit 63.
+
+FULL_BOARD = 0xFFFFFFFFFFFFFFFF
+FILE_A = 0x0101010101010101
+FILE_B = FILE_A << 1
+FILE_G = FILE_A << 6
+FILE_H = FILE_A << 7
+RANK_1 = 0xFF
+RANK_8 = RANK_1 << 56
+NOT_FILE_A = FULL_BOARD ^ FILE_A
+NOT_FILE_H = FULL_BOARD ^ FILE_H
+NOT_FILE_AB = FULL_BOARD ^ (FILE_A | FILE_B)
+NOT_FILE_GH = FULL_BOARD ^ (FILE_G | FILE_H)
+
+PIECE_NAMES = ("King", "Queen", "Rook", "Bishop", "Knight", "Pawn")
+
+# (i,j) position of every bit index, so move generation can reuse the same
+# tuples instead of building new ones for every target square
+POSITIONS = tuple((index & 7, index >> 3) for index in range(64))
+
+# Shift amount and wrap-around mask for a single step in each direction.
+# Positive shifts move towards h8, negative shifts towards a1.
+DIRECTIONS = {"north": (8, FULL_BOARD),
+              "south": (-8, FULL_BOARD),
+              "east": (1, NOT_FILE_A),
+              "west": (-1, NOT_FILE_H),
+              "north_east": (9, NOT_FILE_A),
+              "north_west": (7, NOT_FILE_H),
+              "south_east": (-7, NOT_FILE_A),
+              "south_west": (-9, NOT_FILE_H)}
+
+
+def square_index(position):
+    """Gives the bit index of a position (i,j)."""
+    return position[1] * 8 + position[0]
+
+
+def square_mask(position):
+    """Gives a bitboard with only the bit for position (i,j) set."""
+    return 1 << (position[1] * 8 + position[0])
+
+
+def indices(bitboard):
+    """Yields the bit index of every set bit in a bitboard, lowest first."""
+    while bitboard:
+        lowest_bit = bitboard & -bitboard
+        yield lowest_bit.bit_length() - 1
+        bitboard ^= lowest_bit
+
+
+def ray_attacks(bitboard, direction, empty):
+    """Slides every set bit of a bitboard along one direction until it
+    leaves the board or hits an occupied square, and returns all the squares
+    passed through. The blocking square itself is included, so captures can
+    be found by masking with the enemy pieces."""
+    shift, mask = DIRECTIONS[direction]
+    attacks = 0
+    if shift > 0:
+        while bitboard:
+            bitboard = (bitboard << shift) & mask & FULL_BOARD
+            attacks |= bitboard
+            bitboard &= empty
+    else:
+        shift = -shift
+        while bitboard:
+            bitboard = (bitboard >> shift) & mask
+            attacks |= bitboard
+            bitboard &= empty
+    return attacks
+
+
+def rook_attacks(bitboard, occupied):
+    """Gives all squares attacked by rook-like movement from a bitboard."""
+    empty = FULL_BOARD ^ occupied
+    attacks = 0
+    # north
+    ray = bitboard
+    while ray:
+        ray = (ray << 8) & FULL_BOARD
+        attacks |= ray
+        ray &= empty
+    # south
+    ray = bitboard
+    while ray:
+        ray >>= 8
+        attacks |= ray
+        ray &= empty
+    # east
+    ray = bitboard
+    while ray:
+        ray = (ray << 1) & NOT_FILE_A
+        attacks |= ray
+        ray &= empty
+    # west
+    ray = bitboard
+    while ray:
+        ray = (ray >> 1) & NOT_FILE_H
+        attacks |= ray
+        ray &= empty
+    return attacks
+
+
+def bishop_attacks(bitboard, occupied):
+    """Gives all squares attacked by bishop-like movement from a bitboard."""
+    empty = FULL_BOARD ^ occupied
+    attacks = 0
+    # north east
+    ray = bitboard
+    while ray:
+        ray = (ray << 9) & NOT_FILE_A
+        attacks |= ray
+        ray &= empty
+    # north west
+    ray = bitboard
+    while ray:
+        ray = (ray << 7) & NOT_FILE_H
+        attacks |= ray
+        ray &= empty
+    # south east
+    ray = bitboard
+    while ray:
+        ray = (ray >> 7) & NOT_FILE_A
+        attacks |= ray
+        ray &= empty
+    # south west
+    ray = bitboard
+    while ray:
+        ray = (ray >> 9) & NOT_FILE_H
+        attacks |= ray
+        ray &= empty
+    return attacks
+
+
+def knight_attacks(bitboard):
+    """Gives all squares a knight could jump to from a bitboard."""
+    return ((((bitboard << 17) | (bitboard >> 15)) & NOT_FILE_A)
+            | (((bitboard << 15) | (bitboard >> 17)) & NOT_FILE_H)
+            | (((bitboard << 10) | (bitboard >> 6)) & NOT_FILE_AB)
+            | (((bitboard << 6) | (bitboard >> 10)) & NOT_FILE_GH)) & FULL_BOARD
+
+
+def king_attacks(bitboard):
+    """Gives all squares a king could step to from a bitboard."""
+    sideways = ((bitboard << 1) & NOT_FILE_A) | ((bitboard >> 1) & NOT_FILE_H)
+    row = bitboard | sideways
+    return (sideways | (row << 8) | (row >> 8)) & FULL_BOARD
+
+
+def pawn_attacks(bitboard, colour):
+    """Gives all squares a pawn of the given colour attacks from a bitboard."""
+    if colour == "white":
+        return (((bitboard << 9) & NOT_FILE_A) | ((bitboard << 7) & NOT_FILE_H)) & FULL_BOARD
+    elif colour == "black":
+        return ((bitboard >> 7) & NOT_FILE_A) | ((bitboard >> 9) & NOT_FILE_H)
+    else:
+        raise ValueError("Given colour must be white or black.")
+
+
+# Attack tables. These are worked out once from the shift-and-mask functions
+# above, then saved next to this file so later runs can just load them.
+# The cache file is plain numbers, never anything that gets executed: an
+# 8 byte header of magic and version, then little-endian unsigned 64-bit
+# bitboards - the knight, king, white and black pawn attacks and each
+# direction's rays (64 each, by bit index), the rook then bishop masks, then
+# for every square in turn the rook attacks for each subset of its mask in the
+# order occupancy_subsets gives them, then the same for bishops.
+
+TABLES_VERSION = 2
+TABLES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "attack_tables.cache")
+TABLES_HEADER = struct.Struct("<4sI")
+TABLES_MAGIC = b"PCAT"
+# A rook in the corner has the most blocking squares
+MAX_MASK_SQUARES = 12
+
+
+def occupancy_subsets(mask):
+    """Yields every subset of the squares in a mask, starting with the empty set."""
+    subset = 0
+    while True:
+        yield subset
+        subset = (subset - mask) & mask
+        if subset == 0:
+            break
+
+
+def build_tables():
+    """Works out every attack table from scratch and returns them as a dictionary.
+    Sliding pieces get one lookup dictionary per square, from the occupancy of
+    the squares that could block them to the squares they attack."""
+    edges = {"north": RANK_8, "south": RANK_1, "east": FILE_H, "west": FILE_A}
+    edges["north_east"] = edges["north"] | edges["east"]
+    edges["north_west"] = edges["north"] | edges["west"]
+    edges["south_east"] = edges["south"] | edges["east"]
+    edges["south_west"] = edges["south"] | edges["west"]
+
+    tables = {"version": TABLES_VERSION,
+              "knight": [], "king": [], "pawn": {"white": [], "black": []},
+              "rays": {direction: [] for direction in DIRECTIONS},
+              "rook_masks": [], "bishop_masks": [], "rook": [], "bishop": []}
+    for index in range(64):
+        bit = 1 << index
+        tables["knight"].append(knight_attacks(bit))
+        tables["king"].append(king_attacks(bit))
+        for colour in ("white", "black"):
+            tables["pawn"][colour].append(pawn_attacks(bit, colour))
+        for direction in DIRECTIONS:
+            tables["rays"][direction].append(ray_attacks(bit, direction, FULL_BOARD))
+
+        # A piece on the last square of a ray attacks it whatever is there, so
+        # the edge squares never change the lookup and are left out of the mask
+        for name, directions, slide in (("rook", ("north", "south", "east", "west"), rook_attacks),
+                                        ("bishop", ("north_east", "north_west", "south_east", "south_west"),
+                                         bishop_attacks)):
+            mask = 0
+            for direction in directions:
+                mask |= tables["rays"][direction][index] & ~edges[direction]
+            tables[name + "_masks"].append(mask)
+            tables[name].append({occupied: slide(bit, occupied)
+                                 for occupied in occupancy_subsets(mask)})
+    return tables
+
+
+def flat_tables(tables):
+    """Gives the tables of one bitboard per square - all but the rook and
+    bishop lookups - in the order they're saved in."""
+    return ([tables["knight"], tables["king"], tables["pawn"]["white"], tables["pawn"]["black"]]
+            + [tables["rays"][direction] for direction in DIRECTIONS]
+            + [tables["rook_masks"], tables["bishop_masks"]])
+
+
+def write_tables(path, tables):
+    """Saves attack tables to a cache file."""
+    numbers = array("Q")
+    for table in flat_tables(tables):
+        numbers.extend(table)
+    for name in ("rook", "bishop"):
+        for index in range(64):
+            lookup = tables[name][index]
+            numbers.extend(lookup[occupied] for occupied in occupancy_subsets(tables[name + "_masks"][index]))
+    if sys.byteorder == "big":
+        numbers.byteswap()
+    # A worker starting up at the same time never reads a half written cache
+    with mapped_file.replacing(path) as f:
+        f.write(TABLES_HEADER.pack(TABLES_MAGIC, TABLES_VERSION))
+        numbers.tofile(f)
+
+
+def read_tables(path):
+    """Loads attack tables from a cache file. Raises ValueError if the file
+    isn't a cache of this version or is cut short."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < TABLES_HEADER.size:
+        raise ValueError("Not an attack table cache: {}".format(path))
+    magic, version = TABLES_HEADER.unpack_from(data, 0)
+    if magic != TABLES_MAGIC or version != TABLES_VERSION:
+        raise ValueError("Not a version {} attack table cache: {}".format(TABLES_VERSION, path))
+    numbers = array("Q")
+    numbers.frombytes(data[TABLES_HEADER.size:])
+    if sys.byteorder == "big":
+        numbers.byteswap()
+
+    flat = []
+    for table in range(len(DIRECTIONS) + 6):
+        flat.append(numbers[table * 64:(table + 1) * 64].tolist())
+    if len(flat[-1]) != 64:
+        raise ValueError("Attack table cache cut short: {}".format(path))
+    tables = {"version": TABLES_VERSION,
+              "knight": flat[0], "king": flat[1], "pawn": {"white": flat[2], "black": flat[3]},
+              "rays": dict(zip(DIRECTIONS, flat[4:-2])),
+              "rook_masks": flat[-2], "bishop_masks": flat[-1], "rook": [], "bishop": []}
+    position = len(flat) * 64
+    for name in ("rook", "bishop"):
+        for mask in tables[name + "_masks"]:
+            if bin(mask).count("1") > MAX_MASK_SQUARES:
+                raise ValueError("Corrupt attack table cache: {}".format(path))
+            count = 1 << bin(mask).count("1")
+            attacks = numbers[position:position + count].tolist()
+            if len(attacks) != count:
+                raise ValueError("Attack table cache cut short: {}".format(path))
+            position += count
+            tables[name].append(dict(zip(occupancy_subsets(mask), attacks)))
+    if position != len(numbers):
+        raise ValueError("Corrupt attack table cache: {}".format(path))
+    return tables
+
+
+def load_tables():
+    """Loads the attack tables from the cache file, building and saving them
+    instead if the file is missing, unreadable or out of date."""
+    try:
+        return read_tables(TABLES_PATH)
+    except (OSError, ValueError):
+        pass
+
+    tables = build_tables()
+    try:
+        write_tables(TABLES_PATH, tables)
+    except OSError:
+        # Read-only install - just rebuild the tables every run
+        pass
+    return tables
+
+
+tables = load_tables()
+KNIGHT_ATTACKS = tables["knight"]
+KING_ATTACKS = tables["king"]
+PAWN_ATTACKS = tables["pawn"]
+RAYS = tables["rays"]
+ROOK_MASKS = tables["rook_masks"]
+BISHOP_MASKS = tables["bishop_masks"]
+ROOK_TABLE = tables["rook"]
+BISHOP_TABLE = tables["bishop"]
+del tables
+
+
+def rook_lookup(index, occupied):
+    """Gives the squares a rook on a bit index attacks, given the occupied squares."""
+    return ROOK_TABLE[index][occupied & ROOK_MASKS[index]]
+
+
+def bishop_lookup(index, occupied):
+    """Gives the squares a bishop on a bit index attacks, given the occupied squares."""
+    return BISHOP_TABLE[index][occupied & BISHOP_MASKS[index]]
+
+
+def queen_lookup(index, occupied):
+    """Gives the squares a queen on a bit index attacks, given the occupied squares."""
+    return (ROOK_TABLE[index][occupied & ROOK_MASKS[index]]
+            | BISHOP_TABLE[index][occupied & BISHOP_MASKS[index]])
+
+
+def ray_lookup(direction, index, occupied):
+    """Gives the squares along one direction from a bit index up to and
+    including the first occupied square."""
+    ray = RAYS[direction][index]
+    blockers = ray & occupied
+    if blockers:
+        if DIRECTIONS[direction][0] > 0:
+            # Ray heads towards h8, so the nearest blocker is the lowest bit
+            first_blocker = (blockers & -blockers).bit_length() - 1
+        else:
+            first_blocker = blockers.bit_length() - 1
+        ray ^= RAYS[direction][first_blocker]
+    return ray
+
+
+class Bitboards:
+    """A Bitboards object holds one bitboard per piece type and colour, plus
+    an occupancy mask for each colour. It is built from a piece list and kept
+    alongside it in the GameState."""
+    def __init__(self, piece_list):
+        self.pieces = {"white": dict.fromkeys(PIECE_NAMES, 0),
+                       "black": dict.fromkeys(PIECE_NAMES, 0)}
+        self.occupied = {"white": 0, "black": 0}
+        # Kept up to date alongside the colour masks, since nearly every move
+        # generator needs it
+        self.all = 0
+        for piece in piece_list:
+            position = piece.position
+            self.pieces[piece.colour][piece.name] |= 1 << (position[1] * 8 + position[0])
+        for colour in ("white", "black"):
+            for piece_bitboard in self.pieces[colour].values():
+                self.occupied[colour] |= piece_bitboard
+        self.all = self.occupied["white"] | self.occupied["black"]
+
+    def add(self, name, colour, position):
+        """Sets the bit for a piece placed at position (i,j)."""
+        bit = 1 << (position[1] * 8 + position[0])
+        self.pieces[colour][name] |= bit
+        self.occupied[colour] |= bit
+        self.all |= bit
+
+    def remove(self, name, colour, position):
+        """Clears the bit for a piece taken off position (i,j)."""
+        bit = 1 << (position[1] * 8 + position[0])
+        self.pieces[colour][name] &= ~bit
+        self.occupied[colour] &= ~bit
+        self.all &= ~bit
+
+    def move(self, name, colour, old_position, new_position):
+        """Moves the bit for a piece from one position to another."""
+        bits = ((1 << (old_position[1] * 8 + old_position[0]))
+                | (1 << (new_position[1] * 8 + new_position[0])))
+        self.pieces[colour][name] ^= bits
+        self.occupied[colour] ^= bits
+        self.all ^= bits
@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+
+import random
+import struct
+import moves
+import state
+import bitboard
+import zobrist
+import polyglot_keys
+import mapped_file
+
+# A Polyglot opening book is nothing but 16 byte entries, sorted by position
+# key, all big-endian:
+#   8 bytes  Polyglot key of the position (see polyglot_key)
+#   2 bytes  move: to file (bits 0-2), to rank (bits 3-5), from file (bits
+#            6-8), from rank (bits 9-11) and promotion piece (bits 12-14,
+#            0 for none, then N, B, R, Q). Castling is written as the King
+#            taking its own rook, e.g. e1h1.
+#   2 bytes  weight - how often to play the move, relative to the others
+#   4 bytes  learning data, not used here
+# A position's moves are next to each other, so they are found by a binary
+# search on the key through the memory-mapped file. Nothing else is read.
+
+ENTRY = struct.Struct(">QHHI")
+ENTRY_SIZE = ENTRY.size
+KEY = struct.Struct(">Q")
+
+# Kind numbers of the pieces in the Polyglot key: black is even, white odd
+KINDS = {"Pawn": 0, "Knight": 2, "Bishop": 4, "Rook": 6, "Queen": 8, "King": 10}
+CASTLING_OFFSET = 768
+CASTLING_RIGHTS = (("white", "o-o"), ("white", "o-o-o"), ("black", "o-o"), ("black", "o-o-o"))
+EN_PASSANT_OFFSET = 772
+TURN_OFFSET = 780
+
+
+def polyglot_key(game_state):
+    """Gives the Polyglot key of a GameState, which is what books are keyed by.
+    It's made like the zobrist key, but from Polyglot's own random numbers."""
+    key = 0
+    for colour, boards in game_state.bitboards.pieces.items():
+        colour_kind = 1 if colour == "white" else 0
+        for name, board in boards.items():
+            offset = 64 * (KINDS[name] + colour_kind)
+            for index in bitboard.indices(board):
+                key ^= polyglot_keys.RANDOM[offset + index]
+
+    rights = state.castling_rights(game_state)
+    for number, (colour, castle) in enumerate(CASTLING_RIGHTS):
+        if rights[colour][castle]:
+            key ^= polyglot_keys.RANDOM[CASTLING_OFFSET + number]
+    # Like the zobrist key, the en passant file only counts if a pawn stands
+    # ready to capture
+    if zobrist.en_passant_key(game_state):
+        key ^= polyglot_keys.RANDOM[EN_PASSANT_OFFSET + game_state.en_passant[0]]
+    if game_state.whose_turn == "white":
+        key ^= polyglot_keys.RANDOM[TURN_OFFSET]
+    return key
+
+
+def polyglot_move(code):
+    """Gives the Polyglot book move for an encoded move."""
+    flags = code >> 12
+    from_index = code & 0x3F
+    to_index = (code >> 6) & 0x3F
+    if flags == moves.KING_CASTLE:
+        to_index = from_index + 3
+    elif flags == moves.QUEEN_CASTLE:
+        to_index = from_index - 4
+    promotion = (flags & 3) + 1 if flags & moves.PROMOTION else 0
+    return (promotion << 12) | (from_index << 6) | to_index
+
+
+class OpeningBook(mapped_file.MappedFile):
+    """An OpeningBook reads a Polyglot book file through a read-only memory map,
+    so only the pages the binary searches land on are ever read in."""
+    kind = "Polyglot book"
+    min_size = ENTRY_SIZE
+
+    def read_header(self, size):
+        if size % ENTRY_SIZE:
+            raise ValueError("Not a Polyglot book: {}".format(self.path))
+        self.length = size // ENTRY_SIZE
+
+    def __len__(self):
+        return self.length
+
+    def entries(self, key):
+        """Gives the (Polyglot move, weight) of every entry for a position key."""
+        # Find the first entry with the key
+        low = 0
+        high = self.length
+        while low < high:
+            middle = (low + high) // 2
+            if KEY.unpack_from(self.map, middle * ENTRY_SIZE)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        results = []
+        for index in range(low, self.length):
+            entry_key, move, weight, learn = ENTRY.unpack_from(self.map, index * ENTRY_SIZE)
+            if entry_key != key:
+                break
+            results.append((move, weight))
+        return results
+
+    def moves(self, game_state):
+        """Gives (encoded move, weight) for each book move in a GameState. Book
+        moves that aren't legal in the position are left out."""
+        entries = self.entries(polyglot_key(game_state))
+        if not entries:
+            return []
+        legal_codes = {polyglot_move(code): code
+                       for code in state.all_legal_codes(game_state, game_state.whose_turn)}
+        return [(legal_codes[move], weight) for move, weight in entries if move in legal_codes]
+
+    def choose_move(self, game_state, generator=random):
+        """Picks a book move for a GameState at random, more often the more
+        weight it has, as an encoded move. Gives None when the position isn't
+        in the book."""
+        book_moves = [(code, weight) for code, weight in self.moves(game_state) if weight > 0]
+        if not book_moves:
+            return None
+        return generator.choices([code for code, weight in book_moves],
+                                 weights=[weight for code, weight in book_moves])[0]
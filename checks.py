@@ -0,0 +1,257 @@
+#!/usr/bin/python3
+
+import argparse
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+import moves
+import state
+import fen
+import evaluation
+import position_store
+import tablebases
+import perft
+import pieces
+import test_states
+
+# Consistency checks for the parts of the engine which work the same thing out
+# two ways, one fast and one plain, and must always agree. Each plays random
+# games from the standard perft positions, with a fixed seed so a failure can
+# be repeated, and compares the two ways on the positions they pass through.
+# Run them after changing either side.
+
+
+def random_positions(generator, games, max_plies=150, chance=0.1):
+    """Plays random legal moves from each standard perft position, games times
+    over, and gives a fresh GameState (built from its FEN) for roughly chance
+    of the positions passed through."""
+    positions = []
+    for fen_string, counts in perft.POSITIONS.values():
+        for game in range(games):
+            game_state = fen.state_from_fen(fen_string)
+            for ply in range(generator.randrange(1, max_plies)):
+                codes = state.all_legal_codes(game_state, game_state.whose_turn)
+                if not codes:
+                    break
+                moves.make_move(game_state, generator.choice(codes))
+                if generator.random() < chance:
+                    positions.append(fen.state_from_fen(fen.fen_from_state(game_state)))
+    return positions
+
+
+def check_batch_evaluation(generator, games):
+    """Checks batch_evaluation.evaluation_terms against evaluation_terms term
+    for term, evaluate_batch against the search's evaluate, and store_planes
+    against pack_planes. Gives the number of positions which don't match."""
+    try:
+        import batch_evaluation
+    except ImportError:
+        print("batch evaluation: skipped, NumPy isn't installed")
+        return 0
+    positions = random_positions(generator, games)
+    planes = batch_evaluation.pack_planes(positions)
+    start = time.perf_counter()
+    batch_terms = batch_evaluation.evaluation_terms(planes)
+    elapsed = time.perf_counter() - start
+    # The totals have to be what the search scores the positions as
+    batch_scores = batch_evaluation.evaluate_batch(
+        planes, [game_state.whose_turn == "white" for game_state in positions])
+    failures = 0
+    for number, game_state in enumerate(positions):
+        terms = evaluation.evaluation_terms(game_state)
+        wrong = [term for term in evaluation.TERMS if terms[term] != batch_terms[term][number]]
+        if batch_scores[number] != evaluation.evaluate(game_state):
+            wrong.append("the total")
+        if wrong:
+            failures += 1
+            print("batch evaluation differs on {} for {}".format(", ".join(wrong), fen.fen_from_state(game_state)))
+
+    # The same positions read straight from a position store
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "positions.store")
+        position_store.write_store(path, positions)
+        with position_store.PositionStore(path) as store:
+            store_planes = batch_evaluation.store_planes(store)
+    for number in (store_planes != planes).any(axis=1).nonzero()[0]:
+        failures += 1
+        print("store planes differ for {}".format(fen.fen_from_state(positions[number])))
+    print("batch evaluation: {} positions, {} wrong ({:.1f} us per position)".format(
+        len(positions), failures, elapsed / max(len(positions), 1) * 1e6))
+    return failures
+
+
+def check_piece_score(generator, games):
+    """Checks the piece_score kept up to date by make_move and unmake_move
+    against evaluate_white after every move and take-back of random games.
+    Gives the number of positions which don't match."""
+    checked = 0
+    failures = 0
+    for fen_string, counts in perft.POSITIONS.values():
+        for game in range(games):
+            game_state = fen.state_from_fen(fen_string)
+            undos = []
+            for ply in range(200):
+                codes = state.all_legal_codes(game_state, game_state.whose_turn)
+                if not codes:
+                    break
+                code = generator.choice(codes)
+                undos.append((code, moves.make_move(game_state, code)))
+                # Take a move back now and then, so unmake_move is checked
+                # in the middle of games as well as at the end
+                if generator.random() < 0.2:
+                    code, undo = undos.pop()
+                    moves.unmake_move(game_state, code, undo)
+                checked += 1
+                if game_state.piece_score != evaluation.evaluate_white(game_state):
+                    failures += 1
+                    print("piece_score is {} instead of {} for {}".format(
+                        game_state.piece_score, evaluation.evaluate_white(game_state),
+                        fen.fen_from_state(game_state)))
+            while undos:
+                code, undo = undos.pop()
+                moves.unmake_move(game_state, code, undo)
+            checked += 1
+            if game_state.piece_score != evaluation.evaluate_white(fen.state_from_fen(fen_string)):
+                failures += 1
+                print("piece_score not restored for {}".format(fen_string))
+    print("piece score: {} positions, {} wrong".format(checked, failures))
+    return failures
+
+
+def random_ending(generator, name):
+    """Gives the FEN of a random legal position of a tablebase ending, with the
+    stronger side either colour."""
+    piece_letter = {"Queen": "Q", "Rook": "R", "Pawn": "P"}[tablebases.ENDINGS[name]]
+    while True:
+        turn = generator.choice((tablebases.WHITE_TO_MOVE, tablebases.BLACK_TO_MOVE))
+        strong_king, weak_king, piece = (generator.randrange(64) for square in range(3))
+        if tablebases.legal_position(tablebases.ENDINGS[name], turn, strong_king, weak_king, piece):
+            break
+    letters = {strong_king: "K", weak_king: "k", piece: piece_letter}
+    if generator.random() < 0.5:
+        # The same position with the board turned round
+        letters = {square ^ 56: letter.swapcase() for square, letter in letters.items()}
+        turn = 1 - turn
+    ranks = []
+    for j in range(7, -1, -1):
+        rank = ""
+        for i in range(8):
+            rank += letters.get(j * 8 + i, "1")
+        ranks.append(rank)
+    return "{} {} - - 0 1".format("/".join(ranks), "w" if turn == tablebases.WHITE_TO_MOVE else "b")
+
+
+def minimax_result(tables, game_state):
+    """Works out the result a tablebase should give a position from what it
+    gives every position one move on."""
+    codes = state.all_legal_codes(game_state, game_state.whose_turn)
+    if not codes:
+        return (tablebases.LOSS, 0) if state.in_check(game_state, game_state.whose_turn) else (tablebases.DRAW, 0)
+    results = []
+    for code in codes:
+        undo = moves.make_move(game_state, code)
+        results.append(tables.probe(game_state))
+        moves.unmake_move(game_state, code, undo)
+    losses = [plies for result, plies in results if result == tablebases.LOSS]
+    if losses:
+        return tablebases.WIN, min(losses) + 1
+    if any(result == tablebases.DRAW for result, plies in results):
+        return tablebases.DRAW, 0
+    return tablebases.LOSS, max(plies for result, plies in results) + 1
+
+
+def check_tablebases(generator, games):
+    """Checks the tablebases against a one ply search over them, on random
+    positions of each ending: a position's result has to follow from its
+    children's. Uses tablebases.bin if it's there and generates the tables
+    otherwise. Gives the number of positions which don't match."""
+    checked = 0
+    failures = 0
+    with tempfile.TemporaryDirectory() as directory:
+        path = tablebases.DEFAULT_PATH
+        if not os.path.exists(path):
+            path = os.path.join(directory, "tablebases.bin")
+            tablebases.write_tablebases(path, out=io.StringIO())
+        with tablebases.Tablebases(path) as tables:
+            for name in tablebases.ENDINGS:
+                for position in range(games * 50):
+                    fen_string = random_ending(generator, name)
+                    game_state = fen.state_from_fen(fen_string)
+                    expected = minimax_result(tables, game_state)
+                    checked += 1
+                    if tables.probe(game_state) != expected:
+                        failures += 1
+                        print("tablebase gives {} instead of {} for {}".format(
+                            tables.probe(game_state), expected, fen_string))
+    print("tablebases: {} positions, {} wrong".format(checked, failures))
+    return failures
+
+
+def check_game_end(generator, games):
+    """Checks that state.in_stalemate calls only two Kings, or two Kings and a
+    Bishop or Knight, a draw by material, and that the tablebase endings are
+    played on until the side to move has none. Gives the number of positions it gets
+    wrong."""
+    failures = 0
+    drawn = {"two Kings": test_states.two_kings,
+             "King and Bishop": test_states.stalemate_test,
+             "King and Knight": [pieces.King((3,3), "white"), pieces.Knight((0,0), "white"),
+                                 pieces.King((5,5), "black")]}
+    played_on = {"King and Queen": test_states.king_queen_and_king,
+                 "King and Rook": [pieces.King((2,1), "white"), pieces.Rook((5,0), "white"),
+                                   pieces.King((1,4), "black")],
+                 "King and Pawn": [pieces.King((2,1), "white"), pieces.Pawn((5,1), "white"),
+                                   pieces.King((1,4), "black")]}
+    for expected, positions in ((True, drawn), (False, played_on)):
+        for name, piece_list in positions.items():
+            game_state = test_states.state_maker(list(piece_list))
+            if state.in_stalemate(game_state, "white") != expected:
+                failures += 1
+                print("{} against King {} a draw".format(name, "isn't" if expected else "is"))
+
+    checked = len(drawn) + len(played_on)
+    for name in tablebases.ENDINGS:
+        for position in range(games * 10):
+            game_state = state.update_state(fen.state_from_fen(random_ending(generator, name)))
+            colour = game_state.whose_turn
+            # in_stalemate doesn't look at check - callers ask about checkmate first
+            expected = not state.all_legal_codes(game_state, colour)
+            checked += 1
+            if state.in_stalemate(game_state, colour) != expected:
+                failures += 1
+                print("in_stalemate gives {} for {}".format(not expected, fen.fen_from_state(game_state)))
+    print("game end: {} positions, {} wrong".format(checked, failures))
+    return failures
+
+
+CHECKS = {"batch": check_batch_evaluation, "piece_score": check_piece_score, "tablebases": check_tablebases,
+          "game_end": check_game_end}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that the fast and plain ways of working things out "
+                                                 "agree, on random games.")
+    parser.add_argument("checks", nargs="*",
+                        help="checks to run, from {} (default all)".format(", ".join(CHECKS)))
+    parser.add_argument("-s", "--seed", type=int, default=1,
+                        help="seed for the random games (default 1)")
+    parser.add_argument("-g", "--games", type=int, default=20,
+                        help="random games from each perft position (default 20)")
+    args = parser.parse_args(argv)
+    if args.games < 1:
+        parser.error("need at least one game")
+    for name in args.checks:
+        if name not in CHECKS:
+            parser.error("no such check: {}".format(name))
+
+    failures = 0
+    for name in args.checks or CHECKS:
+        failures += CHECKS[name](random.Random(args.seed), args.games)
+    return 0 if failures == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -16,7 +16,7 @@ class Game:
         self.game_state = state.GameState([])
         self.history = []
         # one player by default
-        self.player_list = [players.Human("white"), players.AI("black", "random")]
+        self.player_list = [players.Human("white"), players.AI("black", "search", nodes=20000)]
     
     def new_game(self):
         """Sets up a GameState object for a new game."""
@@ -51,7 +51,9 @@ if __name__ == "__main__":
         while not game.game_state.game_over:
             for player in game.player_list:
                 if player.colour == game.game_state.whose_turn and not game.game_state.game_over:
-                    game.game_state = game.engine.turn(player, game.game_state)
+                    # The AI is told the positions played before this one, to see repetitions
+                    history = [past.zobrist_key for past in game.history[:-1]]
+                    game.game_state = game.engine.turn(player, game.game_state, history)
                     # Once move made, save GameState object into history for undos
                     if game.engine.undo:
                         game.undo()
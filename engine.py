@@ -5,7 +5,6 @@ import os
 import players
 import moves
 import state
-import random
 import time
 
 pygame.init()
@@ -154,7 +153,7 @@ class GfxEngine:
                 if event.key == pygame.K_u:
                     self.undo = True
                     
-    def turn(self, player: players.Player, game_state: state.GameState) -> state.GameState:
+    def turn(self, player: players.Player, game_state: state.GameState, history=()) -> state.GameState:
         player.my_turn = True
         
         if len([piece for piece in game_state.piece_list if piece.colour == player.colour]) == 0:
@@ -217,14 +216,10 @@ class GfxEngine:
                             # Check for promotion before applying move
                             move = player.promotion_handler(move)
                             if move is not None:
-                                # Apply move, deselect piece, turn is over
+                                # Apply move (which passes the turn over), deselect piece
                                 game_state = move.apply_move(game_state)
                                 self.piece_selected = None
                                 player.my_turn = False
-                                if game_state.whose_turn == "white":
-                                    game_state.whose_turn = "black"
-                                else:
-                                    game_state.whose_turn = "white"
                                 self.refresh(game_state)
                                 return game_state
                         else:
@@ -246,31 +241,27 @@ class GfxEngine:
                     self.refresh(game_state)
 
         elif isinstance(player, players.AI):
-            mode = player.mode
-            colour = player.colour
-
-            if mode == "random":
-                # Find all legal moves
-                legal_moves = game_state.legal_moves[colour]
-                number_of_legal_moves = len(legal_moves)
-
-                # Make a random choice of legal move
-                choice = random.randrange(0, number_of_legal_moves)
-                move = legal_moves[choice]
-
-                # Check for promotion
-                move = player.promotion_handler(move)
-                if move is not None:
-                    # Apply move, deselect piece, turn is over
-                    game_state = move.apply_move(game_state)
-                    self.piece_selected = None
+            # The AI thinks in the background, so keep drawing and listening
+            # for the window closing or an undo until it's done
+            thinking = player.think(game_state, history)
+            while not thinking.done():
+                self.input_handler(game_state)
+                if self.done or self.undo:
+                    thinking.cancel()
                     player.my_turn = False
-                    if game_state.whose_turn == "white":
-                        game_state.whose_turn = "black"
-                    else:
-                        game_state.whose_turn = "white"
-                    self.refresh(game_state)
+                    if self.done:
+                        game_state.game_over = True
                     return game_state
+                self.refresh(game_state)
+
+            move = thinking.move()
+            if move is not None:
+                # Apply move (which passes the turn over), deselect piece
+                game_state = move.apply_move(game_state)
+                self.piece_selected = None
+                player.my_turn = False
+                self.refresh(game_state)
+                return game_state
             pass
 
     def refresh(self, game_state):
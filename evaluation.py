@@ -0,0 +1,174 @@
+#!/usr/bin/python3
+
+import bitboard
+
+# Positions are scored in centipawns (a pawn is worth 100) from white's point
+# of view: each piece is worth its material value plus a bonus or penalty for
+# the square it stands on. The piece-square tables below are laid out as the
+# board looks from white's side, rank 8 at the top, and are mirrored for black.
+
+PIECE_VALUES = {"King": 0, "Queen": 900, "Rook": 500, "Bishop": 330, "Knight": 320, "Pawn": 100}
+
+PIECE_SQUARE_TABLES = {
+    "Pawn": (0,   0,   0,   0,   0,   0,   0,   0,
+             50,  50,  50,  50,  50,  50,  50,  50,
+             10,  10,  20,  30,  30,  20,  10,  10,
+             5,   5,   10,  25,  25,  10,  5,   5,
+             0,   0,   0,   20,  20,  0,   0,   0,
+             5,   -5,  -10, 0,   0,   -10, -5,  5,
+             5,   10,  10,  -20, -20, 10,  10,  5,
+             0,   0,   0,   0,   0,   0,   0,   0),
+    "Knight": (-50, -40, -30, -30, -30, -30, -40, -50,
+               -40, -20, 0,   0,   0,   0,   -20, -40,
+               -30, 0,   10,  15,  15,  10,  0,   -30,
+               -30, 5,   15,  20,  20,  15,  5,   -30,
+               -30, 0,   15,  20,  20,  15,  0,   -30,
+               -30, 5,   10,  15,  15,  10,  5,   -30,
+               -40, -20, 0,   5,   5,   0,   -20, -40,
+               -50, -40, -30, -30, -30, -30, -40, -50),
+    "Bishop": (-20, -10, -10, -10, -10, -10, -10, -20,
+               -10, 0,   0,   0,   0,   0,   0,   -10,
+               -10, 0,   5,   10,  10,  5,   0,   -10,
+               -10, 5,   5,   10,  10,  5,   5,   -10,
+               -10, 0,   10,  10,  10,  10,  0,   -10,
+               -10, 10,  10,  10,  10,  10,  10,  -10,
+               -10, 5,   0,   0,   0,   0,   5,   -10,
+               -20, -10, -10, -10, -10, -10, -10, -20),
+    "Rook": (0,   0,   0,   0,   0,   0,   0,   0,
+             5,   10,  10,  10,  10,  10,  10,  5,
+             -5,  0,   0,   0,   0,   0,   0,   -5,
+             -5,  0,   0,   0,   0,   0,   0,   -5,
+             -5,  0,   0,   0,   0,   0,   0,   -5,
+             -5,  0,   0,   0,   0,   0,   0,   -5,
+             -5,  0,   0,   0,   0,   0,   0,   -5,
+             0,   0,   0,   5,   5,   0,   0,   0),
+    "Queen": (-20, -10, -10, -5,  -5,  -10, -10, -20,
+              -10, 0,   0,   0,   0,   0,   0,   -10,
+              -10, 0,   5,   5,   5,   5,   0,   -10,
+              -5,  0,   5,   5,   5,   5,   0,   -5,
+              0,   0,   5,   5,   5,   5,   0,   -5,
+              -10, 5,   5,   5,   5,   5,   0,   -10,
+              -10, 0,   5,   0,   0,   0,   0,   -10,
+              -20, -10, -10, -5,  -5,  -10, -10, -20),
+    "King": (-30, -40, -40, -50, -50, -40, -40, -30,
+             -30, -40, -40, -50, -50, -40, -40, -30,
+             -30, -40, -40, -50, -50, -40, -40, -30,
+             -30, -40, -40, -50, -50, -40, -40, -30,
+             -20, -30, -30, -40, -40, -30, -30, -20,
+             -10, -20, -20, -20, -20, -20, -20, -10,
+             20,  20,  0,   0,   0,   0,   20,  20,
+             20,  30,  10,  0,   0,   10,  30,  20)}
+
+# Terms only the full evaluation (evaluation_terms) adds, for analysis and
+# tuning. Mobility counts the squares each piece attacks which aren't taken
+# by its own side, and is weighted by piece type.
+MOBILITY_WEIGHTS = {"Queen": 1, "Rook": 2, "Bishop": 3, "Knight": 4}
+# Per pawn: one more on a file than the first, with no friendly pawn on
+# either neighbouring file, and with no enemy pawn in front of it on its own
+# or a neighbouring file (by how many ranks it has come from its own side)
+DOUBLED_PAWN = -10
+ISOLATED_PAWN = -15
+PASSED_PAWN = (0, 5, 10, 20, 35, 60, 100, 0)
+TERMS = ("material", "piece_square", "mobility", "pawn_structure")
+
+FILES = tuple(bitboard.FILE_A << file for file in range(8))
+# Files either side of each file
+NEIGHBOUR_FILES = tuple((FILES[file - 1] if file > 0 else 0) | (FILES[file + 1] if file < 7 else 0)
+                        for file in range(8))
+RANKS = tuple(bitboard.RANK_1 << (8 * rank) for rank in range(8))
+
+# colour -> piece name -> what a piece is worth on each bit index, signed so
+# black pieces count against white. Bit index ^ 56 flips the rank, which turns
+# a bit index into a place in a table laid out from rank 8 down.
+SQUARE_VALUES = {"white": {name: [PIECE_VALUES[name] + table[index ^ 56] for index in range(64)]
+                           for name, table in PIECE_SQUARE_TABLES.items()},
+                 "black": {name: [-PIECE_VALUES[name] - table[index] for index in range(64)]
+                           for name, table in PIECE_SQUARE_TABLES.items()}}
+
+
+def evaluate_white(game_state):
+    """Scores a GameState in centipawns from white's point of view, working it
+    out from scratch. GameStates keep this score up to date as piece_score, so
+    this is only needed to set it up."""
+    score = 0
+    for colour, boards in game_state.bitboards.pieces.items():
+        values = SQUARE_VALUES[colour]
+        for name, board in boards.items():
+            name_values = values[name]
+            for index in bitboard.indices(board):
+                score += name_values[index]
+    return score
+
+
+def front_spans(pawns, colour):
+    """Gives the squares in front of a colour's pawns, on their own files and
+    the files either side - where an enemy pawn stops them being passed."""
+    span = 0
+    if colour == "white":
+        while pawns:
+            pawns = (pawns << 8) & bitboard.FULL_BOARD
+            span |= pawns
+    else:
+        while pawns:
+            pawns >>= 8
+            span |= pawns
+    return span | ((span << 1) & bitboard.NOT_FILE_A) | ((span >> 1) & bitboard.NOT_FILE_H)
+
+
+def pawn_structure(game_state, colour):
+    """Scores a colour's doubled, isolated and passed pawns."""
+    boards = game_state.bitboards.pieces
+    pawns = boards[colour]["Pawn"]
+    enemy = "black" if colour == "white" else "white"
+    score = 0
+    for file in range(8):
+        on_file = bin(pawns & FILES[file]).count("1")
+        if on_file > 1:
+            score += DOUBLED_PAWN * (on_file - 1)
+        if on_file and not pawns & NEIGHBOUR_FILES[file]:
+            score += ISOLATED_PAWN * on_file
+    passed = pawns & ~front_spans(boards[enemy]["Pawn"], enemy)
+    for rank in range(8):
+        ranks_advanced = rank if colour == "white" else 7 - rank
+        score += PASSED_PAWN[ranks_advanced] * bin(passed & RANKS[rank]).count("1")
+    return score
+
+
+def mobility(game_state, colour):
+    """Scores how many squares a colour's pieces (other than the King and
+    pawns) attack, not counting squares taken by its own side."""
+    bitboards = game_state.bitboards
+    occupied = bitboards.all
+    available = bitboard.FULL_BOARD & ~bitboards.occupied[colour]
+    attack_functions = {"Queen": bitboard.queen_lookup, "Rook": bitboard.rook_lookup,
+                        "Bishop": bitboard.bishop_lookup}
+    score = 0
+    for name, weight in MOBILITY_WEIGHTS.items():
+        for index in bitboard.indices(bitboards.pieces[colour][name]):
+            if name == "Knight":
+                attacks = bitboard.KNIGHT_ATTACKS[index]
+            else:
+                attacks = attack_functions[name](index, occupied)
+            score += weight * bin(attacks & available).count("1")
+    return score
+
+
+def evaluation_terms(game_state):
+    """Scores a GameState term by term, from white's point of view, with the
+    mobility and pawn structure terms the search leaves out for speed. Gives a
+    dict from each name in TERMS to its score in centipawns."""
+    material = 0
+    for colour, sign in (("white", 1), ("black", -1)):
+        for name, board in game_state.bitboards.pieces[colour].items():
+            material += sign * PIECE_VALUES[name] * bin(board).count("1")
+    return {"material": material,
+            "piece_square": evaluate_white(game_state) - material,
+            "mobility": mobility(game_state, "white") - mobility(game_state, "black"),
+            "pawn_structure": pawn_structure(game_state, "white") - pawn_structure(game_state, "black")}
+
+
+def evaluate(game_state):
+    """Scores a GameState in centipawns from the point of view of the side to
+    move, which is what the search wants."""
+    score = game_state.piece_score
+    return score if game_state.whose_turn == "white" else -score
@@ -0,0 +1,161 @@
+#!/usr/bin/python3
+
+import pieces
+import moves
+import state
+import bitboard
+import zobrist
+
+# FEN (Forsyth-Edwards Notation) writes a whole position on one line, as six
+# fields separated by spaces:
+#   rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1
+# 1. the pieces, rank 8 down to rank 1, with white pieces in capitals and runs
+#    of empty squares as a digit
+# 2. whose turn it is, w or b
+# 3. the castles each side still has the right to make, or -
+# 4. the en passant square, or -
+# 5. the halfmove clock (plies since the last capture or pawn move)
+# 6. the fullmove number
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# FEN letter -> (piece type, colour)
+PIECE_LETTERS = {"K": (pieces.King, "white"), "Q": (pieces.Queen, "white"),
+                 "R": (pieces.Rook, "white"), "B": (pieces.Bishop, "white"),
+                 "N": (pieces.Knight, "white"), "P": (pieces.Pawn, "white"),
+                 "k": (pieces.King, "black"), "q": (pieces.Queen, "black"),
+                 "r": (pieces.Rook, "black"), "b": (pieces.Bishop, "black"),
+                 "n": (pieces.Knight, "black"), "p": (pieces.Pawn, "black")}
+# (colour, piece name) -> FEN letter
+FEN_LETTERS = {(colour, piece_type.name): letter
+               for letter, (piece_type, colour) in PIECE_LETTERS.items()}
+
+# Turns each digit in the piece field into that many dots, so every rank
+# becomes exactly 8 characters, one per square
+EXPAND_DIGITS = str.maketrans({digit: "." * int(digit) for digit in "12345678"})
+
+# Castling letter -> (colour, castle, King's home square, rook's home square)
+CASTLING_LETTERS = {"K": ("white", "o-o", (4,0), (7,0)), "Q": ("white", "o-o-o", (4,0), (0,0)),
+                    "k": ("black", "o-o", (4,7), (7,7)), "q": ("black", "o-o-o", (4,7), (0,7))}
+
+
+def state_from_fen(fen_string):
+    """Builds a GameState from a FEN string. The move clocks may be left off, as
+    they are in EPD records, in which case they start at 0 and 1.
+    FEN only records castling rights, so Kings and rooks are marked as moved
+    unless a castling right says otherwise. Pawns are marked as moved once they
+    are off their starting rank."""
+    fields = fen_string.split()
+    if len(fields) == 4:
+        fields += ["0", "1"]
+    elif len(fields) != 6:
+        raise ValueError("FEN must have 6 fields: {}".format(fen_string))
+    placement, side, castling, en_passant, halfmove_clock, fullmove_number = fields
+
+    # Expanding the digits (done in C by translate) turns the piece field into
+    # 8 ranks of 8 squares, from a8 to h1
+    ranks = placement.translate(EXPAND_DIGITS).split("/")
+    if len(ranks) != 8 or any(len(rank_string) != 8 for rank_string in ranks):
+        raise ValueError("FEN must describe 8 ranks of 8 squares: {}".format(fen_string))
+    piece_list = []
+    for row, rank_string in enumerate(ranks):
+        if rank_string == "........":
+            continue
+        j = 7 - row
+        for i, letter in enumerate(rank_string):
+            if letter == ".":
+                continue
+            if letter not in PIECE_LETTERS:
+                raise ValueError("Invalid piece letter '{}': {}".format(letter, fen_string))
+            piece_type, colour = PIECE_LETTERS[letter]
+            if piece_type is pieces.Pawn:
+                moved = j != (1 if colour == "white" else 6)
+            else:
+                moved = piece_type is pieces.King or piece_type is pieces.Rook
+            piece_list.append(piece_type(bitboard.POSITIONS[j * 8 + i], colour, moved))
+
+    if side == "w":
+        whose_turn = "white"
+    elif side == "b":
+        whose_turn = "black"
+    else:
+        raise ValueError("Side to move must be w or b: {}".format(fen_string))
+
+    if castling == "-":
+        castling = ""
+    elif any(letter not in CASTLING_LETTERS for letter in castling):
+        raise ValueError("Invalid castling rights '{}': {}".format(castling, fen_string))
+    en_passant = None if en_passant == "-" else moves.square_position(en_passant)
+    try:
+        halfmove_clock = int(halfmove_clock)
+        fullmove_number = int(fullmove_number)
+    except ValueError:
+        raise ValueError("Invalid move clocks: {}".format(fen_string)) from None
+
+    return state_from_parts(piece_list, whose_turn, castling, en_passant, halfmove_clock, fullmove_number)
+
+
+def state_from_parts(piece_list, whose_turn, castling, en_passant, halfmove_clock, fullmove_number):
+    """Builds a GameState from the parts of a position FEN describes: a piece
+    list with Kings and rooks marked as moved, whose turn it is, a string of
+    castling letters, the en passant position or None, and the move clocks.
+    Kings and rooks the castling letters refer to are marked as unmoved."""
+    pieces_by_position = {piece.position: piece for piece in piece_list}
+    for letter in castling:
+        colour, castle, king_square, rook_square = CASTLING_LETTERS[letter]
+        king = pieces_by_position.get(king_square)
+        rook = pieces_by_position.get(rook_square)
+        # A right with no King or rook to back it up can't be used, so is dropped
+        if (king and king.name == "King" and king.colour == colour
+                and rook and rook.name == "Rook" and rook.colour == colour):
+            king.moved = False
+            rook.moved = False
+
+    game_state = state.GameState(piece_list, whose_turn)
+    if en_passant is not None:
+        if en_passant[1] != (5 if whose_turn == "white" else 2):
+            raise ValueError("Invalid en passant square: {}".format(moves.square_str(en_passant)))
+        # The pawn that just moved two squares passed over the (empty) square
+        # and stands on the one behind it
+        enemy = "black" if whose_turn == "white" else "white"
+        pawn = pieces_by_position.get((en_passant[0], en_passant[1] - 1 if whose_turn == "white"
+                                       else en_passant[1] + 1))
+        if en_passant in pieces_by_position or not (pawn and pawn.name == "Pawn" and pawn.colour == enemy):
+            raise ValueError("No pawn could have just passed over en passant square {}".format(
+                moves.square_str(en_passant)))
+        game_state.en_passant = en_passant
+        game_state.zobrist_key ^= zobrist.en_passant_key(game_state)
+    game_state.halfmove_clock = halfmove_clock
+    game_state.fullmove_number = fullmove_number
+
+    return game_state
+
+
+def fen_from_state(game_state):
+    """Writes a GameState out as a FEN string."""
+    pieces_by_position = game_state.pieces_by_position
+    rows = []
+    for j in range(7, -1, -1):
+        row = ""
+        empty_squares = 0
+        for i in range(8):
+            piece = pieces_by_position.get(bitboard.POSITIONS[j * 8 + i])
+            if piece is None:
+                empty_squares += 1
+                continue
+            if empty_squares:
+                row += str(empty_squares)
+                empty_squares = 0
+            row += FEN_LETTERS[(piece.colour, piece.name)]
+        if empty_squares:
+            row += str(empty_squares)
+        rows.append(row)
+
+    rights = state.castling_rights(game_state)
+    castling = "".join(letter for letter, (colour, castle, king_square, rook_square) in CASTLING_LETTERS.items()
+                       if rights[colour][castle])
+    en_passant = moves.square_str(game_state.en_passant) if game_state.en_passant else "-"
+
+    return "{} {} {} {} {} {}".format("/".join(rows), "w" if game_state.whose_turn == "white" else "b",
+                                      castling or "-", en_passant,
+                                      game_state.halfmove_clock, game_state.fullmove_number)
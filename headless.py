@@ -0,0 +1,163 @@
+#!/usr/bin/python3
+
+import argparse
+import sys
+import time
+import fen
+import pgn
+import state
+import players
+
+# Plays games between AIs straight on a GameState, without a window: nothing
+# here loads pygame (players only needs it for a Human) and nothing waits on a
+# frame clock, so games go as fast as the AIs think and run on machines with
+# no display. Besides checkmate and stalemate, which are all the windowed game
+# looks for, games end in a draw by the fifty-move rule, threefold repetition
+# or insufficient material, or after a cap on the number of plies.
+
+# Why a game ended
+CHECKMATE = "checkmate"
+STALEMATE = "stalemate"
+FIFTY_MOVES = "fifty-move rule"
+REPETITION = "threefold repetition"
+INSUFFICIENT_MATERIAL = "insufficient material"
+PLY_LIMIT = "ply limit"
+
+
+def player_name(mode, depth=None, nodes=None):
+    """Describes an AI by how it picks its moves, for game records: its mode,
+    and for a search its depth and node limits."""
+    if mode != "search":
+        return "AI ({})".format(mode)
+    limits = []
+    if depth is not None:
+        limits.append("{} plies".format(depth))
+    if nodes is not None:
+        limits.append("{} nodes".format(nodes))
+    return "AI (search, {})".format(", ".join(limits))
+
+
+class HeadlessGame:
+    """A HeadlessGame plays one game between two players.AI objects from a FEN,
+    the standard starting position by default. After play, result is "1-0",
+    "0-1" or "1/2-1/2", reason says why it ended, and times holds the seconds
+    each colour took over each of its moves. The moves played are in
+    game_state.move_history."""
+    def __init__(self, white, black, fen_string=fen.START_FEN, max_plies=None):
+        for colour, player in (("white", white), ("black", black)):
+            if not isinstance(player, players.AI):
+                raise ValueError("A headless game needs AI players.")
+            if player.colour != colour:
+                raise ValueError("The {} player is playing {}.".format(colour, player.colour))
+        self.players = {"white": white, "black": black}
+        self.starting_fen = fen_string
+        self.game_state = fen.state_from_fen(fen_string)
+        self.max_plies = max_plies
+        self.result = "*"
+        self.reason = None
+        self.times = {"white": [], "black": []}
+        # Position keys since the last capture or pawn move, for repetitions
+        self.keys = [self.game_state.zobrist_key]
+
+    def play(self):
+        """Plays the game to its end, and returns the result."""
+        game_state = self.game_state
+        self.finish()
+        while self.result == "*":
+            colour = game_state.whose_turn
+            start = time.perf_counter()
+            # The keys before this position, which can't be repeated past the
+            # last capture or pawn move anyway
+            move = self.players[colour].choose_move(game_state, history=self.keys[:-1])
+            self.times[colour].append(time.perf_counter() - start)
+            if move is None:
+                # The AI only gives up when it has no moves, which finish
+                # has already caught
+                break
+            move.make(game_state)
+            if game_state.halfmove_clock == 0:
+                self.keys = []
+            self.keys.append(game_state.zobrist_key)
+            self.finish()
+        game_state.game_over = True
+        return self.result
+
+    def finish(self):
+        """Sets the result and reason if the game is over in its current
+        position."""
+        game_state = self.game_state
+        colour = game_state.whose_turn
+        # Checkmate, stalemate and insufficient material are the same tests
+        # the windowed game makes
+        if state.in_checkmate(game_state, colour):
+            self.result, self.reason = ("0-1" if colour == "white" else "1-0"), CHECKMATE
+        elif state.in_stalemate(game_state, colour):
+            reason = INSUFFICIENT_MATERIAL if state.insufficient_material(game_state) else STALEMATE
+            self.result, self.reason = "1/2-1/2", reason
+        elif game_state.halfmove_clock >= 100:
+            self.result, self.reason = "1/2-1/2", FIFTY_MOVES
+        elif self.keys.count(game_state.zobrist_key) >= 3:
+            self.result, self.reason = "1/2-1/2", REPETITION
+        elif self.max_plies is not None and len(game_state.move_history) >= self.max_plies:
+            self.result, self.reason = "1/2-1/2", PLY_LIMIT
+
+    def write_pgn(self, f, tags=None):
+        """Writes the game to an open text file as PGN."""
+        all_tags = {colour.capitalize(): player_name(player.mode, player.depth, player.nodes)
+                    for colour, player in self.players.items()}
+        if self.reason is not None:
+            all_tags["Termination"] = self.reason
+        if tags:
+            all_tags.update(tags)
+        pgn.write_game(f, self.game_state.move_history, all_tags, self.starting_fen, self.result)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play AI against AI without a window, as fast as they think.")
+    parser.add_argument("-n", "--nodes", type=int, default=20000,
+                        help="positions each AI searches per move (default 20000)")
+    parser.add_argument("-d", "--depth", type=int,
+                        help="plies each AI searches per move, instead of a node limit")
+    parser.add_argument("-g", "--games", type=int, default=1,
+                        help="number of games to play (default 1)")
+    parser.add_argument("-f", "--fen", default=fen.START_FEN,
+                        help="position to start each game from (default the starting position)")
+    parser.add_argument("-m", "--max-plies", type=int,
+                        help="call a game drawn after this many plies")
+    parser.add_argument("-b", "--book",
+                        help="Polyglot opening book for both AIs")
+    parser.add_argument("-p", "--pgn",
+                        help="file to write the games to as PGN")
+    args = parser.parse_args(argv)
+    if args.games < 1:
+        parser.error("need at least one game")
+    try:
+        fen.state_from_fen(args.fen)
+    except ValueError as error:
+        parser.error(str(error))
+    nodes = None if args.depth is not None else args.nodes
+
+    ais = [players.AI(colour, "search", args.depth, nodes, book_path=args.book, verbose=False)
+           for colour in ("white", "black")]
+    pgn_file = open(args.pgn, "w") if args.pgn else None
+    try:
+        for number in range(1, args.games + 1):
+            game = HeadlessGame(ais[0], ais[1], args.fen, args.max_plies)
+            start = time.perf_counter()
+            game.play()
+            elapsed = time.perf_counter() - start
+            plies = len(game.game_state.move_history)
+            print("game {}: {} ({}) in {} plies, {:.1f}s ({:.2f}s per move)".format(
+                number, game.result, game.reason, plies, elapsed, elapsed / max(plies, 1)))
+            if pgn_file is not None:
+                game.write_pgn(pgn_file, {"Event": "Headless game", "Round": number})
+    finally:
+        if pgn_file is not None:
+            pgn_file.close()
+        for ai in ais:
+            ai.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
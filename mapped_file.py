@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+
+import contextlib
+import mmap
+import os
+
+# The read-only memory-mapped files the engine looks things up in - position
+# stores, opening books and tablebases - all open the same way. The operating
+# system pages the file in as lookups touch it and shares one copy between
+# every process that maps it, so nothing is read up front and worker processes
+# can each open the file themselves for next to nothing.
+# They (and the attack table cache) are written with replacing, so a process
+# reading one never sees it half written.
+
+
+class MappedFile:
+    """A MappedFile opens a file and maps it read-only as map. Subclasses set
+    kind, to name the file in errors, and min_size, the fewest bytes it can
+    have, and check what's in it in read_header, which is given the file's size
+    once it's mapped and raises ValueError if the file is wrong. If anything
+    fails the file is closed again. Pickling a MappedFile sends only its path,
+    and the copy maps the file again."""
+    kind = "mapped file"
+    min_size = 1
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        try:
+            size = os.fstat(self.file.fileno()).st_size
+            if size < self.min_size:
+                raise ValueError("Not a {}: {}".format(self.kind, path))
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.read_header(size)
+        except Exception:
+            self.close()
+            raise
+
+    def read_header(self, size):
+        """Checks a newly mapped file, and reads anything needed from its start."""
+        pass
+
+    def close(self):
+        """Unmaps and closes the file."""
+        if getattr(self, "map", None) is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __getstate__(self):
+        # Worker processes get the path and map the file themselves
+        return self.path
+
+    def __setstate__(self, path):
+        self.__init__(path)
+
+
+@contextlib.contextmanager
+def replacing(path):
+    """Opens a temporary binary file for a with block to write a new version
+    of path into. When the block ends it takes path's place in one step, so a
+    reader sees either the old file or the whole new one. If the block raises,
+    the temporary file is removed and path is left as it was."""
+    temporary_path = path + ".{}".format(os.getpid())
+    try:
+        with open(temporary_path, "wb") as f:
+            yield f
+        os.replace(temporary_path, path)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
@@ -2,6 +2,9 @@
 
 import pieces
 import state
+import bitboard
+import zobrist
+import evaluation
 import copy
 
 
@@ -13,6 +16,230 @@ def square_str(position):
 
     return files[position[0]] + ranks[position[1]]
 
+def square_position(square):
+    """Gives the position (i,j) of chess co-ordinates like "e4"."""
+    if len(square) != 2 or square[0] not in "abcdefgh" or square[1] not in "12345678":
+        raise ValueError("Invalid square: {}".format(square))
+    return bitboard.POSITIONS[(ord(square[1]) - ord("1")) * 8 + ord(square[0]) - ord("a")]
+
+def promoted_piece(new_piece_name, position, colour):
+    """Creates the piece a pawn promotes into, given its one letter name."""
+    if new_piece_name == "Q":
+        return pieces.Queen(position, colour, True)
+    elif new_piece_name == "R":
+        return pieces.Rook(position, colour, True)
+    elif new_piece_name == "B":
+        return pieces.Bishop(position, colour, True)
+    elif new_piece_name == "N":
+        return pieces.Knight(position, colour, True)
+    else:
+        raise ValueError("Invalid new piece! Promotion routine went wrong- aborting...")
+
+# Moves can also be packed into 16-bit integers, which is how move generation,
+# make_move and the move history pass them around:
+#   bits 0-5    square the piece moves from (bit index, see bitboard.py)
+#   bits 6-11   square the piece moves to
+#   bits 12-15  flags, one of the values below
+# Any flag with the CAPTURE bit set takes a piece, and any flag with the
+# PROMOTION bit set promotes to PROMOTION_PIECES[flags & 3].
+QUIET = 0
+DOUBLE_PAWN_PUSH = 1
+KING_CASTLE = 2
+QUEEN_CASTLE = 3
+CAPTURE = 4
+EN_PASSANT = 5
+PROMOTION = 8
+PROMOTION_PIECES = ("N", "B", "R", "Q")
+
+def encode_move(from_index, to_index, flags=QUIET):
+    """Packs a move into an integer, given the bit indices of its squares."""
+    return from_index | (to_index << 6) | (flags << 12)
+
+def code_str(code):
+    """Gives an encoded move in long algebraic form (e2e4, e7e8q, e1g1)."""
+    move_string = (square_str(bitboard.POSITIONS[code & 0x3F])
+                   + square_str(bitboard.POSITIONS[(code >> 6) & 0x3F]))
+    if code >> 12 & PROMOTION:
+        move_string += PROMOTION_PIECES[(code >> 12) & 3].lower()
+    return move_string
+
+# The three helpers below are the only places a piece is put on, taken off or
+# moved around the board during a move, so the position lookups, bitboards,
+# position key and piece score can't drift apart. The piece list is left to
+# the caller.
+
+def add_piece(game_state, piece):
+    """Puts a piece on the board at its position."""
+    index = bitboard.square_index(piece.position)
+    game_state.pieces_by_position[piece.position] = piece
+    game_state.bitboards.add(piece.name, piece.colour, piece.position)
+    game_state.zobrist_key ^= zobrist.PIECE_KEYS[piece.colour][piece.name][index]
+    game_state.piece_score += evaluation.SQUARE_VALUES[piece.colour][piece.name][index]
+
+def remove_piece(game_state, piece):
+    """Takes a piece off the board. The piece keeps its position, so it can be
+    put back with add_piece."""
+    index = bitboard.square_index(piece.position)
+    del game_state.pieces_by_position[piece.position]
+    game_state.bitboards.remove(piece.name, piece.colour, piece.position)
+    game_state.zobrist_key ^= zobrist.PIECE_KEYS[piece.colour][piece.name][index]
+    game_state.piece_score -= evaluation.SQUARE_VALUES[piece.colour][piece.name][index]
+
+def relocate_piece(game_state, piece, new_position):
+    """Moves a piece from its position to a new, empty position."""
+    old_position = piece.position
+    del game_state.pieces_by_position[old_position]
+    piece.position = new_position
+    game_state.pieces_by_position[new_position] = piece
+    game_state.bitboards.move(piece.name, piece.colour, old_position, new_position)
+    old_index = bitboard.square_index(old_position)
+    new_index = bitboard.square_index(new_position)
+    keys = zobrist.PIECE_KEYS[piece.colour][piece.name]
+    game_state.zobrist_key ^= keys[old_index] ^ keys[new_index]
+    values = evaluation.SQUARE_VALUES[piece.colour][piece.name]
+    game_state.piece_score += values[new_index] - values[old_index]
+
+def make_move(game_state, code):
+    """Applies an encoded move to the GameState in place and hands the turn to
+    the other side. Returns an undo record which unmake_move uses to put the
+    GameState back exactly as it was.
+    This is the one place moves are made - the Move classes encode themselves
+    and come here."""
+    flags = code >> 12
+    old_position = bitboard.POSITIONS[code & 0x3F]
+    new_position = bitboard.POSITIONS[(code >> 6) & 0x3F]
+    pieces_by_position = game_state.pieces_by_position
+    moving_piece = pieces_by_position[old_position]
+    undo = (game_state.zobrist_key, game_state.en_passant, game_state.halfmove_clock,
+            moving_piece, moving_piece.moved)
+
+    # Castling rights can only change if a King or rook home square is involved
+    touches_castling = ((bitboard.square_mask(old_position) | bitboard.square_mask(new_position))
+                        & zobrist.CASTLING_SQUARES)
+    game_state.zobrist_key ^= zobrist.en_passant_key(game_state) ^ zobrist.SIDE_KEY
+    if touches_castling:
+        game_state.zobrist_key ^= zobrist.castling_key(game_state)
+    game_state.en_passant = None
+
+    # Captures and pawn moves can't be undone, so the fifty-move count restarts
+    if flags & CAPTURE or moving_piece.name == "Pawn":
+        game_state.halfmove_clock = 0
+    else:
+        game_state.halfmove_clock += 1
+    if game_state.whose_turn == "black":
+        game_state.fullmove_number += 1
+
+    # Remove captured piece
+    if flags & CAPTURE:
+        if flags == EN_PASSANT:
+            captured_piece = pieces_by_position[(new_position[0], old_position[1])]
+        else:
+            captured_piece = pieces_by_position[new_position]
+        captured_index = game_state.piece_list.index(captured_piece)
+        del game_state.piece_list[captured_index]
+        game_state.captured_pieces.append(captured_piece)
+        remove_piece(game_state, captured_piece)
+        undo += (captured_index,)
+    else:
+        undo += (None,)
+
+    if flags & PROMOTION:
+        # Swap new piece in for the old pawn
+        new_piece = promoted_piece(PROMOTION_PIECES[flags & 3], new_position, moving_piece.colour)
+        index = game_state.piece_list.index(moving_piece)
+        game_state.piece_list[index] = new_piece
+        remove_piece(game_state, moving_piece)
+        add_piece(game_state, new_piece)
+        undo += (index,)
+    else:
+        # Apply move
+        relocate_piece(game_state, moving_piece, new_position)
+        moving_piece.moved = True
+        if flags == DOUBLE_PAWN_PUSH:
+            # A pawn double move leaves the square it passed over open to en passant
+            game_state.en_passant = (old_position[0], (old_position[1] + new_position[1]) // 2)
+            undo += (None,)
+        elif flags == KING_CASTLE or flags == QUEEN_CASTLE:
+            rook_files = (7, 5) if flags == KING_CASTLE else (0, 3)
+            rook = pieces_by_position[(rook_files[0], old_position[1])]
+            undo += (rook.moved,)
+            relocate_piece(game_state, rook, (rook_files[1], old_position[1]))
+            rook.moved = True
+        else:
+            undo += (None,)
+
+    if touches_castling:
+        game_state.zobrist_key ^= zobrist.castling_key(game_state)
+    game_state.zobrist_key ^= zobrist.en_passant_key(game_state)
+
+    # Add to move list and pass the turn over
+    game_state.move_history.append(code)
+    game_state.whose_turn = "black" if game_state.whose_turn == "white" else "white"
+
+    return undo
+
+def unmake_move(game_state, code, undo):
+    """Takes back an encoded move applied by make_move, given the undo record
+    make_move returned."""
+    zobrist_key, en_passant, halfmove_clock, moving_piece, was_moved, captured_index, extra = undo
+    flags = code >> 12
+    old_position = bitboard.POSITIONS[code & 0x3F]
+    new_position = bitboard.POSITIONS[(code >> 6) & 0x3F]
+    game_state.move_history.pop()
+    game_state.whose_turn = "black" if game_state.whose_turn == "white" else "white"
+
+    if flags & PROMOTION:
+        # extra is the pawn's index in the piece list
+        remove_piece(game_state, game_state.pieces_by_position[new_position])
+        game_state.piece_list[extra] = moving_piece
+        add_piece(game_state, moving_piece)
+    else:
+        relocate_piece(game_state, moving_piece, old_position)
+        moving_piece.moved = was_moved
+        if flags == KING_CASTLE or flags == QUEEN_CASTLE:
+            # extra is the rook's old moved flag
+            rook_files = (7, 5) if flags == KING_CASTLE else (0, 3)
+            rook = game_state.pieces_by_position[(rook_files[1], old_position[1])]
+            relocate_piece(game_state, rook, (rook_files[0], old_position[1]))
+            rook.moved = extra
+
+    # Put captured piece back where it was
+    if captured_index is not None:
+        captured_piece = game_state.captured_pieces.pop()
+        game_state.piece_list.insert(captured_index, captured_piece)
+        add_piece(game_state, captured_piece)
+
+    game_state.zobrist_key = zobrist_key
+    game_state.en_passant = en_passant
+    game_state.halfmove_clock = halfmove_clock
+    if game_state.whose_turn == "black":
+        game_state.fullmove_number -= 1
+
+def decode_move(game_state, code):
+    """Builds the Move object for an encoded move in a given GameState, for the
+    parts of the program that work with Move objects, like the UI."""
+    flags = code >> 12
+    old_position = bitboard.POSITIONS[code & 0x3F]
+    new_position = bitboard.POSITIONS[(code >> 6) & 0x3F]
+    piece = game_state.pieces_by_position[old_position]
+    if flags == EN_PASSANT:
+        return EnPassant(piece, old_position, new_position,
+                         game_state.pieces_by_position[(new_position[0], old_position[1])])
+    elif flags == KING_CASTLE or flags == QUEEN_CASTLE:
+        rook_files = (7, 5) if flags == KING_CASTLE else (0, 3)
+        old_rook_position = (rook_files[0], old_position[1])
+        return Castle(piece, old_position, new_position, game_state.pieces_by_position[old_rook_position],
+                      old_rook_position, (rook_files[1], old_position[1]))
+    elif flags & PROMOTION and flags & CAPTURE:
+        return PromotionByCapture(piece, old_position, new_position,
+                                  game_state.pieces_by_position[new_position], PROMOTION_PIECES[flags & 3])
+    elif flags & PROMOTION:
+        return PromotionByTranslation(piece, old_position, new_position, PROMOTION_PIECES[flags & 3])
+    elif flags & CAPTURE:
+        return Capture(piece, old_position, new_position, game_state.pieces_by_position[new_position])
+    else:
+        return Translation(piece, old_position, new_position)
+
 class Move:
     def __init__(self, piece, old_position, new_position):
         self.piece = piece
@@ -25,9 +252,30 @@ class Move:
     def __repr__(self):
         pass
 
+    def encode(self):
+        """Gives the Move as a packed integer (see encode_move)."""
+        return encode_move(bitboard.square_index(self.old_position),
+                           bitboard.square_index(self.new_position), self.flags())
+
+    def flags(self):
+        """Gives the flags which tell make_move what kind of move this is."""
+        return QUIET
+
     def apply_move(self, game_state: state.GameState) -> state.GameState:
+        """Return the GameState object with the Move applied to it."""
+        self.make(game_state)
         return game_state
 
+    def make(self, game_state: state.GameState):
+        """Applies the Move to the GameState in place and hands the turn to the
+        other side. Returns an undo record which unmake uses to put the
+        GameState back exactly as it was."""
+        return make_move(game_state, self.encode())
+
+    def unmake(self, game_state: state.GameState, undo):
+        """Takes back a Move applied by make, given the undo record make returned."""
+        unmake_move(game_state, self.encode(), undo)
+
 class Translation(Move):
     def __init__(self, piece, old_position, new_position):
         super().__init__(piece, old_position, new_position)
@@ -39,18 +287,10 @@ class Translation(Move):
     def __repr__(self):
         return str(self)
 
-    def apply_move(self, game_state: state.GameState) -> state.GameState:
-        """Return a new GameState object with the Move applied to it."""
-        moving_piece = game_state.pieces_by_position[self.old_position]
-        
-        # Apply move
-        moving_piece.position = self.new_position
-        moving_piece.moved = True
-
-        # Add to move list
-        game_state.move_history.append(self)
-      
-        return game_state
+    def flags(self):
+        if self.piece.name == "Pawn" and abs(self.new_position[1] - self.old_position[1]) == 2:
+            return DOUBLE_PAWN_PUSH
+        return QUIET
 
 
 class PromotionByTranslation(Translation):
@@ -65,29 +305,8 @@ class PromotionByTranslation(Translation):
     def __repr__(self):
         return str(self)
 
-    def apply_move(self, game_state: state.GameState) -> state.GameState:
-        """Return a new GameState object with the Move applied to it."""
-        promoting_piece = game_state.pieces_by_position[self.old_position]
-
-        # Add new piece
-        if self.new_piece_name == "Q":
-            game_state.piece_list.append(pieces.Queen(self.new_position, self.piece.colour, True))
-        elif self.new_piece_name == "R":
-            game_state.piece_list.append(pieces.Rook(self.new_position, self.piece.colour, True))
-        elif self.new_piece_name == "B":
-            game_state.piece_list.append(pieces.Bishop(self.new_position, self.piece.colour, True))
-        elif self.new_piece_name == "N":
-            game_state.piece_list.append(pieces.Knight(self.new_position, self.piece.colour, True))
-        else:
-            raise ValueError("Invalid new piece! Promotion routine went wrong- aborting...")
-
-        # Delete old pawn
-        game_state.piece_list.remove(promoting_piece)
-
-        # Add to move list
-        game_state.move_history.append(self)
-
-        return game_state
+    def flags(self):
+        return PROMOTION | PROMOTION_PIECES.index(self.new_piece_name)
 
 
 class Capture(Move):
@@ -103,21 +322,8 @@ class Capture(Move):
     def __repr__(self):
         return str(self)
 
-    def apply_move(self, game_state: state.GameState) -> state.GameState:
-        """Return a new GameState object with the Move applied to it."""
-        attacking_piece = game_state.pieces_by_position[self.old_position]
-        captured_piece = game_state.pieces_by_position[self.captured_piece.position]
-
-        # Apply move
-        attacking_piece.position = self.new_position
-        attacking_piece.moved = True
-        game_state.captured_pieces.append(captured_piece)
-        game_state.piece_list.remove(captured_piece)
-
-        # Add to move list
-        game_state.move_history.append(self)
-
-        return game_state
+    def flags(self):
+        return CAPTURE
 
 
 class PromotionByCapture(Capture):
@@ -132,31 +338,8 @@ class PromotionByCapture(Capture):
     def __repr__(self):
         return str(self)
 
-    def apply_move(self, game_state: state.GameState) -> state.GameState:
-
-        promoting_piece = game_state.pieces_by_position[self.old_position]
-        captured_piece = game_state.pieces_by_position[self.captured_piece.position]
-
-        # Add new piece
-        if self.new_piece_name == "Q":
-            game_state.piece_list.append(pieces.Queen(self.new_position, self.piece.colour, True))
-        elif self.new_piece_name == "R":
-            game_state.piece_list.append(pieces.Rook(self.new_position, self.piece.colour, True))
-        elif self.new_piece_name == "B":
-            game_state.piece_list.append(pieces.Bishop(self.new_position, self.piece.colour, True))
-        elif self.new_piece_name == "N":
-            game_state.piece_list.append(pieces.Knight(self.new_position, self.piece.colour, True))
-        else:
-            raise ValueError("Invalid new piece! Promotion routine went wrong- aborting...")
-
-        # Delete old pawn and captured piece
-        game_state.piece_list.remove(promoting_piece)
-        game_state.piece_list.remove(captured_piece)
-
-        # Add to move list
-        game_state.move_history.append(self)
-
-        return game_state
+    def flags(self):
+        return PROMOTION | CAPTURE | PROMOTION_PIECES.index(self.new_piece_name)
 
 class EnPassant(Capture):
     def __init__(self, piece, old_position, new_position, captured_piece):
@@ -167,6 +350,9 @@ class EnPassant(Capture):
         return (square_str(self.old_position) + "x" 
                 + square_str(self.new_position) + "e.p.")
 
+    def flags(self):
+        return EN_PASSANT
+
 
 class Castle(Move):
     def __init__(self, piece, old_position, new_position, rook, old_rook_position, new_rook_position):
@@ -185,18 +371,5 @@ class Castle(Move):
     def __repr__(self):
         return str(self)
 
-    def apply_move(self, game_state: state.GameState) -> state.GameState:
-        # Create state
-        king = game_state.pieces_by_position[self.old_position]
-        rook = game_state.pieces_by_position[self.old_rook_position]
-
-        # Apply move
-        king.position = self.new_position
-        rook.position = self.new_rook_position
-        king.moved = True
-        rook.moved = True
-
-        # Add to move list
-        game_state.move_history.append(self)
-
-        return game_state
\ No newline at end of file
+    def flags(self):
+        return KING_CASTLE if self.new_position[0] == 6 else QUEEN_CASTLE
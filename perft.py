@@ -0,0 +1,117 @@
+#!/usr/bin/python3
+
+import argparse
+import sys
+import time
+import moves
+import state
+import fen
+
+# Standard perft positions, and the known leaf node counts from depth 1 upwards
+POSITIONS = {"start": (fen.START_FEN,
+                       [20, 400, 8902, 197281, 4865609, 119060324]),
+             "kiwipete": ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+                          [48, 2039, 97862, 4085603, 193690690]),
+             "position3": ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+                           [14, 191, 2812, 43238, 674624, 11030083]),
+             "position4": ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+                           [6, 264, 9467, 422333, 15833292]),
+             "position5": ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+                           [44, 1486, 62379, 2103487, 89941194]),
+             "position6": ("r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+                           [46, 2079, 89890, 3894594, 164075551])}
+
+
+def perft(game_state, depth):
+    """Counts the positions reached by every sequence of legal moves of a given
+    length from a GameState. The GameState is left as it was found."""
+    if depth == 0:
+        return 1
+    codes = state.all_legal_codes(game_state, game_state.whose_turn)
+    if depth == 1:
+        # Every legal move leads to exactly one leaf, so no need to make them
+        return len(codes)
+
+    nodes = 0
+    for code in codes:
+        undo = moves.make_move(game_state, code)
+        nodes += perft(game_state, depth - 1)
+        moves.unmake_move(game_state, code, undo)
+    return nodes
+
+
+def divide(game_state, depth):
+    """Splits a perft count by first move. Returns a list of (encoded move, count)
+    pairs, which can be compared line by line against another engine's."""
+    results = []
+    for code in state.all_legal_codes(game_state, game_state.whose_turn):
+        undo = moves.make_move(game_state, code)
+        results.append((code, perft(game_state, depth - 1)))
+        moves.unmake_move(game_state, code, undo)
+    return results
+
+
+def run(name, depth, show_divide=False):
+    """Runs perft on a standard position, or on the FEN given as name if it isn't
+    one, and prints the node count, speed and whether it matches the reference.
+    Returns True unless the count is wrong."""
+    fen_string, reference = POSITIONS.get(name, (name, []))
+    game_state = fen.state_from_fen(fen_string)
+
+    start = time.perf_counter()
+    if show_divide:
+        results = divide(game_state, depth)
+        for code, count in sorted(results, key=lambda result: moves.code_str(result[0])):
+            print("{}: {}".format(moves.code_str(code), count))
+        nodes = sum(count for code, count in results)
+    else:
+        nodes = perft(game_state, depth)
+    elapsed = time.perf_counter() - start
+
+    nodes_per_second = nodes / elapsed if elapsed > 0 else float("inf")
+    if depth <= len(reference):
+        expected = reference[depth - 1]
+        verdict = "ok" if nodes == expected else "MISMATCH (expected {})".format(expected)
+    else:
+        expected = None
+        verdict = "no reference"
+    print("{} depth {}: {} nodes in {:.2f}s ({:.0f} nodes/s) {}".format(
+        name, depth, nodes, elapsed, nodes_per_second, verdict))
+    return expected is None or nodes == expected
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Count leaf nodes of the move tree, to check move "
+                                                 "generation against known results and time it.")
+    parser.add_argument("depth", type=int, nargs="?", default=3,
+                        help="number of plies to search (default 3)")
+    parser.add_argument("-p", "--position", choices=sorted(POSITIONS), default="start",
+                        help="standard position to start from (default start)")
+    parser.add_argument("-d", "--divide", action="store_true",
+                        help="print the node count below each first move")
+    parser.add_argument("-f", "--fen",
+                        help="start from this FEN instead of a standard position")
+    parser.add_argument("-s", "--suite", action="store_true",
+                        help="run every standard position to the given depth")
+    args = parser.parse_args(argv)
+    if args.depth < 1:
+        parser.error("depth must be at least 1")
+
+    if args.suite:
+        names = sorted(POSITIONS)
+    elif args.fen:
+        try:
+            fen.state_from_fen(args.fen)
+        except ValueError as error:
+            parser.error(str(error))
+        names = [args.fen]
+    else:
+        names = [args.position]
+    passed = True
+    for name in names:
+        passed = run(name, args.depth, args.divide) and passed
+    return 0 if passed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,257 @@
+#!/usr/bin/python3
+
+import re
+import moves
+import state
+import fen
+import bitboard
+
+# PGN (Portable Game Notation) stores games as a block of [Tag "value"] pairs
+# followed by the moves in SAN (Standard Algebraic Notation), e.g.
+#   [White "Morphy"]
+#   [Result "1-0"]
+#
+#   1. e4 e5 2. Nf3 d6 {Philidor} 3. d4 Bg4 ... 1-0
+
+
+class IllegalMoveError(ValueError):
+    """Raised when a SAN move matches no legal move in the position."""
+
+
+class AmbiguousMoveError(ValueError):
+    """Raised when a SAN move matches more than one legal move in the position."""
+
+
+SAN_PATTERN = re.compile(r"^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$")
+SAN_PIECES = {"K": "King", "Q": "Queen", "R": "Rook", "B": "Bishop", "N": "Knight"}
+PIECE_LETTERS = {"King": "K", "Queen": "Q", "Rook": "R", "Bishop": "B", "Knight": "N", "Pawn": ""}
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+
+# The value runs to the last quote, so quotes some programs leave unescaped are kept
+TAG_PATTERN = re.compile(r'^\[\s*([A-Za-z0-9_]+)\s+"(.*)"\s*\]')
+# Comment and variation brackets, or a run of anything else
+TOKEN_PATTERN = re.compile(r"[{};()]|[^\s{};()]+")
+MOVE_NUMBER_PATTERN = re.compile(r"^\d+\.+")
+# Tags every exported game has, in the order PGN lists them
+SEVEN_TAG_ROSTER = (("Event", "?"), ("Site", "?"), ("Date", "????.??.??"), ("Round", "?"),
+                    ("White", "?"), ("Black", "?"), ("Result", "*"))
+
+
+def parse_san(game_state, san):
+    """Finds the legal move a SAN string stands for in a GameState, and returns
+    it as an encoded move. Check marks and annotations like ! and ? are ignored.
+    Raises IllegalMoveError or AmbiguousMoveError if there isn't exactly one."""
+    text = san.rstrip("+#!?")
+    if text.endswith("e.p."):
+        text = text[:-4]
+    legal_codes = state.all_legal_codes(game_state, game_state.whose_turn)
+
+    if text in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        castle = moves.KING_CASTLE if len(text) == 3 else moves.QUEEN_CASTLE
+        matches = [code for code in legal_codes if code >> 12 == castle]
+    else:
+        match = SAN_PATTERN.match(text)
+        if match is None:
+            raise IllegalMoveError("Can't read SAN move '{}'".format(san))
+        piece_letter, from_file, from_rank, target, promotion = match.groups()
+        piece_name = SAN_PIECES[piece_letter] if piece_letter else "Pawn"
+        to_index = bitboard.square_index(moves.square_position(target))
+        matches = []
+        for code in legal_codes:
+            if (code >> 6) & 0x3F != to_index:
+                continue
+            from_index = code & 0x3F
+            if from_file and from_index & 7 != ord(from_file) - ord("a"):
+                continue
+            if from_rank and from_index >> 3 != ord(from_rank) - ord("1"):
+                continue
+            flags = code >> 12
+            if flags & moves.PROMOTION:
+                if moves.PROMOTION_PIECES[flags & 3] != promotion:
+                    continue
+            elif promotion:
+                continue
+            if game_state.pieces_by_position[bitboard.POSITIONS[from_index]].name != piece_name:
+                continue
+            matches.append(code)
+
+    if not matches:
+        raise IllegalMoveError("Illegal move '{}' in {}".format(san, fen.fen_from_state(game_state)))
+    if len(matches) > 1:
+        raise AmbiguousMoveError("Ambiguous move '{}' in {}".format(san, fen.fen_from_state(game_state)))
+    return matches[0]
+
+
+def move_san(game_state, code):
+    """Gives the SAN for an encoded legal move in a GameState, including the +
+    or # for a move that checks or mates. The GameState is left as it was."""
+    flags = code >> 12
+    from_index = code & 0x3F
+    to_index = (code >> 6) & 0x3F
+    if flags == moves.KING_CASTLE:
+        san = "O-O"
+    elif flags == moves.QUEEN_CASTLE:
+        san = "O-O-O"
+    else:
+        piece = game_state.pieces_by_position[bitboard.POSITIONS[from_index]]
+        san = PIECE_LETTERS[piece.name]
+        if piece.name == "Pawn":
+            if flags & moves.CAPTURE:
+                san += "abcdefgh"[from_index & 7]
+        else:
+            # Other pieces of the same type that could also move to the target
+            rivals = [other_code & 0x3F for other_code in state.all_legal_codes(game_state, game_state.whose_turn)
+                      if (other_code >> 6) & 0x3F == to_index and other_code & 0x3F != from_index
+                      and game_state.pieces_by_position[bitboard.POSITIONS[other_code & 0x3F]].name == piece.name]
+            if rivals:
+                if all(rival & 7 != from_index & 7 for rival in rivals):
+                    san += "abcdefgh"[from_index & 7]
+                elif all(rival >> 3 != from_index >> 3 for rival in rivals):
+                    san += "12345678"[from_index >> 3]
+                else:
+                    san += moves.square_str(bitboard.POSITIONS[from_index])
+        if flags & moves.CAPTURE:
+            san += "x"
+        san += moves.square_str(bitboard.POSITIONS[to_index])
+        if flags & moves.PROMOTION:
+            san += "=" + moves.PROMOTION_PIECES[flags & 3]
+
+    undo = moves.make_move(game_state, code)
+    if state.in_check(game_state, game_state.whose_turn):
+        san += "#" if not state.all_legal_codes(game_state, game_state.whose_turn) else "+"
+    moves.unmake_move(game_state, code, undo)
+    return san
+
+
+class PGNGame:
+    """A PGNGame is one game read from a PGN file: its tags, its moves (both
+    encoded and as the SAN they were read from) and its result.
+    A game whose moves can't all be read keeps the moves up to the bad one, and
+    the exception raised for it in error, along with the ply it happened on."""
+    def __init__(self):
+        self.tags = {}
+        self.moves = []
+        self.sans = []
+        self.result = None
+        self.error = None
+        self.error_ply = None
+        # Position after the moves read so far, set up by the first move
+        self.game_state = None
+
+    def starting_fen(self):
+        """Gives the FEN the game starts from - the FEN tag if it has one."""
+        return self.tags.get("FEN", fen.START_FEN)
+
+    def play(self, san):
+        """Reads the next SAN move of the game and makes it."""
+        if self.error is not None:
+            # Nothing after a bad move can be read
+            return
+        try:
+            if self.game_state is None:
+                self.game_state = fen.state_from_fen(self.starting_fen())
+            code = parse_san(self.game_state, san)
+        except ValueError as error:
+            self.error = error
+            self.error_ply = len(self.moves) + 1
+            return
+        moves.make_move(self.game_state, code)
+        self.moves.append(code)
+        self.sans.append(san)
+
+
+def read_games(lines):
+    """Yields the games in a PGN file one at a time, as PGNGame objects. lines can
+    be an open file or any other iterable of lines. Only the game being read is
+    held in memory, so files of any size can be read.
+    Comments, variations and NAGs are skipped."""
+    game = None
+    in_movetext = False
+    in_comment = False
+    variation_depth = 0
+    for line in lines:
+        if not in_comment and line.startswith("["):
+            if in_movetext:
+                # Tags after moves start the next game, even without a result
+                yield game
+                game = None
+                in_movetext = False
+                variation_depth = 0
+            match = TAG_PATTERN.match(line)
+            if match:
+                if game is None:
+                    game = PGNGame()
+                game.tags[match.group(1)] = match.group(2).replace('\\"', '"').replace("\\\\", "\\")
+            continue
+        if line.startswith("%"):
+            # Escaped line, for other programs to use
+            continue
+
+        for token in TOKEN_PATTERN.findall(line):
+            if in_comment:
+                if token == "}":
+                    in_comment = False
+                continue
+            if token == "{":
+                in_comment = True
+            elif token == ";":
+                # Comment runs to the end of the line
+                break
+            elif token == "(":
+                variation_depth += 1
+            elif token == ")":
+                variation_depth = max(variation_depth - 1, 0)
+            elif variation_depth == 0 and not token.startswith("$"):
+                if game is None:
+                    game = PGNGame()
+                in_movetext = True
+                if token in RESULTS:
+                    game.result = token
+                    yield game
+                    game = None
+                    in_movetext = False
+                    continue
+                token = MOVE_NUMBER_PATTERN.sub("", token)
+                # "e.p." can also be written apart from the move
+                if token and token != "e.p.":
+                    game.play(token)
+
+    if game is not None:
+        yield game
+
+
+def write_game(f, move_history, tags=None, starting_fen=fen.START_FEN, result="*"):
+    """Writes a game to an open text file as PGN, given the encoded moves it was
+    played with (like GameState.move_history), any tags to add to the seven
+    every game has, the FEN the game started from and its result."""
+    game_state = fen.state_from_fen(starting_fen)
+    all_tags = dict(SEVEN_TAG_ROSTER)
+    all_tags["Result"] = result
+    if starting_fen != fen.START_FEN:
+        all_tags["SetUp"] = "1"
+        all_tags["FEN"] = starting_fen
+    if tags:
+        all_tags.update(tags)
+    for name, value in all_tags.items():
+        f.write('[{} "{}"]\n'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"')))
+    f.write("\n")
+
+    # Movetext lines are kept under 80 characters
+    words = []
+    for ply, code in enumerate(move_history):
+        if game_state.whose_turn == "white":
+            words.append("{}.".format(game_state.fullmove_number))
+        elif ply == 0:
+            words.append("{}...".format(game_state.fullmove_number))
+        words.append(move_san(game_state, code))
+        moves.make_move(game_state, code)
+    words.append(result)
+
+    line = ""
+    for word in words:
+        if line and len(line) + 1 + len(word) > 79:
+            f.write(line + "\n")
+            line = word
+        else:
+            line = line + " " + word if line else word
+    f.write(line + "\n\n")
@@ -1,14 +1,30 @@
 #!/usr/bin/python3
 
 import moves
+import bitboard
 
 class Piece:
-    """Class representing a Piece on the board."""
+    """Class representing a Piece on the board.
+    A piece only stores what can differ between two pieces of the same type:
+    its position, colour and whether it has moved. The name and image paths
+    belong to the type, and are shared by every piece of that type."""
+    __slots__ = ("position", "colour", "moved")
+    name = ""
+    paths = {"white": "", "black": ""}
+
     def __init__(self, position, colour, moved=False):
         self.position = position
         self.colour = colour
         self.moved = moved
-        self.path = ""
+
+    @property
+    def path(self):
+        """Gives the path to the image of this piece."""
+        return self.paths[self.colour]
+
+    def __deepcopy__(self, memo):
+        # Every field is immutable, so a fresh piece with the same fields is a deep copy
+        return type(self)(self.position, self.colour, self.moved)
     
     def __str__(self):
         return ""
@@ -16,15 +32,30 @@ class Piece:
     def possible_moves(self, game_state):
         return []
 
+    def moves_to(self, targets, game_state):
+        """Turns a bitboard of target squares into a list of Move objects from
+        this piece's position. Targets on occupied squares become Captures, and
+        the rest become Translations."""
+        move_list = []
+        occupied = game_state.bitboards.all
+        while targets:
+            lowest_bit = targets & -targets
+            targets ^= lowest_bit
+            new_position = bitboard.POSITIONS[lowest_bit.bit_length() - 1]
+            if occupied & lowest_bit:
+                # Square is occupied by enemy piece, can capture
+                move_list.append(moves.Capture(self, self.position, new_position,
+                                               game_state.pieces_by_position[new_position]))
+            else:
+                # Square is empty, can move there
+                move_list.append(moves.Translation(self, self.position, new_position))
+        return move_list
+
 
 class King(Piece):
-    def __init__(self, position, colour, moved=False):
-        super().__init__(position, colour, moved)
-        if self.colour == "white":
-            self.path = "pieces/white_king.png"
-        elif self.colour == "black":
-            self.path = "pieces/black_king.png"
-        self.name = "King"
+    __slots__ = ()
+    name = "King"
+    paths = {"white": "pieces/white_king.png", "black": "pieces/black_king.png"}
     
     def __str__(self):
         return "K"
@@ -35,25 +66,12 @@ class King(Piece):
     def possible_moves(self, game_state):
         possible_moves = []
         other_pieces = game_state.pieces_by_position
-        offsets = [[-1,-1],[-1,0],[-1,1],
-                   [0,-1], [0,1],
-                   [1,-1], [1,0], [1,1]]
-        
-        for offset in offsets:
-            new_position = (self.position[0] + offset[0], 
-                          self.position[1] + offset[1])
-            
-            # Check if new square is on the board
-            if 0 <= new_position[0] <= 7 and 0 <= new_position[1] <= 7:
-                if new_position not in other_pieces:
-                    # Square is empty, add to possible_moves
-                    possible_moves.append(moves.Translation(self, self.position, new_position))
-                elif other_pieces[new_position].colour == self.colour:
-                    # Square is occupied by friendly piece, can't do anything
-                    pass
-                else:
-                    # Square is occupied by enemy piece, can capture
-                    possible_moves.append(moves.Capture(self, self.position, new_position, other_pieces[new_position]))
+        bitboards = game_state.bitboards
+
+        # Every square the king steps to, minus those held by friendly pieces
+        targets = (bitboard.KING_ATTACKS[bitboard.square_index(self.position)]
+                   & ~bitboards.occupied[self.colour])
+        possible_moves += self.moves_to(targets, game_state)
             
         # Handle castling
         can_castle = game_state.can_castle[self.colour]
@@ -81,13 +99,9 @@ class King(Piece):
            
 
 class Queen(Piece):
-    def __init__(self, position, colour, moved=False):
-        super().__init__(position, colour, moved)
-        if self.colour == "white":
-            self.path = "pieces/white_queen.png"
-        elif self.colour == "black":
-            self.path = "pieces/black_queen.png"
-        self.name = "Queen"
+    __slots__ = ()
+    name = "Queen"
+    paths = {"white": "pieces/white_queen.png", "black": "pieces/black_queen.png"}
     
     def __str__(self):
         return "Q"
@@ -96,148 +110,19 @@ class Queen(Piece):
         return str(self)
     
     def possible_moves(self, game_state):
-        possible_moves = []
-        other_pieces = game_state.pieces_by_position
+        bitboards = game_state.bitboards
 
-        # Moving left
-        k = 1
-        while self.position[0] - k >= 0:
-            new_position = self.position[0] - k, self.position[1]
-            if new_position not in other_pieces:
-                # Square is empty, add to possible_moves
-                possible_moves.append(moves.Translation(self, self.position, new_position))
-                k += 1
-            elif other_pieces[new_position].colour == self.colour:
-                # Square is occupied by friendly piece, stop
-                break
-            else:
-                # Square is occupied by enemy piece, can capture
-                possible_moves.append(moves.Capture(self, self.position, new_position, other_pieces[new_position]))
-                break
-        
-        # Moving right
-        k = 1
-        while self.position[0] + k <= 7:
-            new_position = self.position[0] + k, self.position[1]
-            if new_position not in other_pieces:
-                # Square is empty, add to possible_moves
-                possible_moves.append(moves.Translation(self, self.position, new_position))
-                k += 1
-            elif other_pieces[new_position].colour == self.colour:
-                # Square is occupied by friendly piece, stop
-                break
-            else:
-                # Square is occupied by enemy piece, can capture
-                possible_moves.append(moves.Capture(self, self.position, new_position, other_pieces[new_position]))
-                break
-        
-        # Moving up
-        k = 1
-        while self.position[1] + k <= 7:
-            new_position = self.position[0], self.position[1] + k
-            if new_position not in other_pieces:
-                # Square is empty, add to possible_moves
-                possible_moves.append(moves.Translation(self, self.position, new_position))
-                k += 1
-            elif other_pieces[new_position].colour == self.colour:
-                # Square is occupied by friendly piece, stop
-                break
-            else:
-                # Square is occupied by enemy piece, can capture
-                possible_moves.append(moves.Capture(self, self.position, new_position, other_pieces[new_position]))
-                break
-        
-        # Moving down
-        k = 1
-        while self.position[1] - k >= 0:
-            new_position = self.position[0], self.position[1] - k
-            if new_position not in other_pieces:
-                # Square is empty, add to possible_moves
-                possible_moves.append(moves.Translation(self, self.position, new_position))
-                k += 1
-            elif other_pieces[new_position].colour == self.colour:
-                # Square is occupied by friendly piece, stop
-                break
-            else:
-                # Square is occupied by enemy piece, can capture
-                possible_moves.append(moves.Capture(self, self.position, new_position, other_pieces[new_position]))
-                break
-        
-        # Moving up-left
-        k = 1
-        while self.position[0] - k >= 0 and self.position[1] + k <= 7:
-            new_position = self.position[0] - k, self.position[1] + k
-            if new_position not in other_pieces:
-                # Square is empty, add to possible_moves
-                possible_moves.append(moves.Translation(self, self.position, new_position))
-                k += 1
-            elif other_pieces[new_position].colour == self.colour:
-                # Square is occupied by friendly piece, stop
-                break
-            else:
-                # Square is occupied by enemy piece, can capture
-                possible_moves.append(moves.Capture(self, self.position, new_position, other_pieces[new_position]))
-                break
-        
-        # Moving up-right
-        k = 1
-        while self.position[0] + k <= 7 and self.position[1] + k <= 7:
-            new_position = self.position[0] + k, self.position[1] + k
-            if new_position not in other_pieces:
-                # Square is empty, add to possible_moves
-                possible_moves.append(moves.Translation(self, self.position, new_position))
-                k += 1
-            elif other_pieces[new_position].colour == self.colour:
-                # Square is occupied by friendly piece, stop
-                break
-            else:
-                # Square is occupied by enemy piece, can capture
-                possible_moves.append(moves.Capture(self, self.position, new_position, other_pieces[new_position]))
-                break
-        
-        # Moving down-left
-        k = 1
-        while self.position[0] - k >= 0 and self.position[1] - k >= 0:
-            new_position = self.position[0] - k, self.position[1] - k
-            if new_position not in other_pieces:
-                # Square is empty, add to possible_moves
-                possible_moves.append(moves.Translation(self, self.position, new_position))
-                k += 1
-            elif other_pieces[new_position].colour == self.colour:
-                # Square is occupied by friendly piece, stop
-                break
-            else:
-                # Square is occupied by enemy piece, can capture
-                possible_moves.append(moves.Capture(self, self.position, new_position, other_pieces[new_position]))
-                break
-        
-        # Moving down-right
-        k = 1
-        while self.position[0] + k <= 7 and self.position[1] - k >= 0:
-            new_position = self.position[0] + k, self.position[1] - k
-            if new_position not in other_pieces:
-                # Square is empty, add to possible_moves
-                possible_moves.append(moves.Translation(self, self.position, new_position))
-                k += 1
-            elif other_pieces[new_position].colour == self.colour:
-                # Square is occupied by friendly piece, stop
-                break
-            else:
-                # Square is occupied by enemy piece, can capture
-                possible_moves.append(moves.Capture(self, self.position, new_position, other_pieces[new_position]))
-                break
-            
-        return possible_moves
+        # Slide along all eight directions, stopping at the first piece hit
+        targets = (bitboard.queen_lookup(bitboard.square_index(self.position), bitboards.all)
+                   & ~bitboards.occupied[self.colour])
+
+        return self.moves_to(targets, game_state)
 
 
 class Rook(Piece):
-    def __init__(self, position, colour, moved=False):
-        super().__init__(position, colour, moved)
-        if self.colour == "white":
-            self.path = "pieces/white_rook.png"
-        elif self.colour == "black":
-            self.path = "pieces/black_rook.png"
-        self.name = "Rook"
+    __slots__ = ()
+    name = "Rook"
+    paths = {"white": "pieces/white_rook.png", "black": "pieces/black_rook.png"}
     
     def __str__(self):
         return "R"
@@ -246,84 +131,19 @@ class Rook(Piece):
         return str(self)
     
     def possible_moves(self, game_state):
-        possible_moves = []
-        other_pieces = game_state.pieces_by_position
+        bitboards = game_state.bitboards
 
-        # Moving left
-        k = 1
-        while self.position[0] - k >= 0:
-            new_position = self.position[0] - k, self.position[1]
-            if new_position not in other_pieces:
-                # Square is empty, add to possible_moves
-                possible_moves.append(moves.Translation(self, self.position, new_position))
-                k += 1
-            elif other_pieces[new_position].colour == self.colour:
-                # Square is occupied by friendly piece, stop
-                break
-            else:
-                # Square is occupied by enemy piece, can capture
-                possible_moves.append(moves.Capture(self, self.position, new_position, other_pieces[new_position]))
-                break
-        
-        # Moving right
-        k = 1
-        while self.position[0] + k <= 7:
-            new_position = self.position[0] + k, self.position[1]
-            if new_position not in other_pieces:
-                # Square is empty, add to possible_moves
-                possible_moves.append(moves.Translation(self, self.position, new_position))
-                k += 1
-            elif other_pieces[new_position].colour == self.colour:
-                # Square is occupied by friendly piece, stop
-                break
-            else:
-                # Square is occupied by enemy piece, can capture
-                possible_moves.append(moves.Capture(self, self.position, new_position, other_pieces[new_position]))
-                break
-        
-        # Moving up
-        k = 1
-        while self.position[1] + k <= 7:
-            new_position = self.position[0], self.position[1] + k
-            if new_position not in other_pieces:
-                # Square is empty, add to possible_moves
-                possible_moves.append(moves.Translation(self, self.position, new_position))
-                k += 1
-            elif other_pieces[new_position].colour == self.colour:
-                # Square is occupied by friendly piece, stop
-                break
-            else:
-                # Square is occupied by enemy piece, can capture
-                possible_moves.append(moves.Capture(self, self.position, new_position, other_pieces[new_position]))
-                break
-        
-        # Moving down
-        k = 1
-        while self.position[1] - k >= 0:
-            new_position = self.position[0], self.position[1] - k
-            if new_position not in other_pieces:
-                # Square is empty, add to possible_moves
-                possible_moves.append(moves.Translation(self, self.position, new_position))
-                k += 1
-            elif other_pieces[new_position].colour == self.colour:
-                # Square is occupied by friendly piece, stop
-                break
-            else:
-                # Square is occupied by enemy piece, can capture
-                possible_moves.append(moves.Capture(self, self.position, new_position, other_pieces[new_position]))
-                break
-            
-        return possible_moves
+        # Slide along the ranks and files, stopping at the first piece hit
+        targets = (bitboard.rook_lookup(bitboard.square_index(self.position), bitboards.all)
+                   & ~bitboards.occupied[self.colour])
+
+        return self.moves_to(targets, game_state)
 
 
 class Bishop(Piece):
-    def __init__(self, position, colour, moved=False):
-        super().__init__(position, colour, moved)
-        if self.colour == "white":
-            self.path = "pieces/white_bishop.png"
-        elif self.colour == "black":
-            self.path = "pieces/black_bishop.png"
-        self.name = "Bishop"
+    __slots__ = ()
+    name = "Bishop"
+    paths = {"white": "pieces/white_bishop.png", "black": "pieces/black_bishop.png"}
     
     def __str__(self):
         return "B"
@@ -332,84 +152,19 @@ class Bishop(Piece):
         return str(self)
     
     def possible_moves(self, game_state):
-        possible_moves = []
-        other_pieces = game_state.pieces_by_position
-        
-        # Moving up-left
-        k = 1
-        while self.position[0] - k >= 0 and self.position[1] + k <= 7:
-            new_position = self.position[0] - k, self.position[1] + k
-            if new_position not in other_pieces:
-                # Square is empty, add to possible_moves
-                possible_moves.append(moves.Translation(self, self.position, new_position))
-                k += 1
-            elif other_pieces[new_position].colour == self.colour:
-                # Square is occupied by friendly piece, stop
-                break
-            else:
-                # Square is occupied by enemy piece, can capture
-                possible_moves.append(moves.Capture(self, self.position, new_position, other_pieces[new_position]))
-                break
-        
-        # Moving up-right
-        k = 1
-        while self.position[0] + k <= 7 and self.position[1] + k <= 7:
-            new_position = self.position[0] + k, self.position[1] + k
-            if new_position not in other_pieces:
-                # Square is empty, add to possible_moves
-                possible_moves.append(moves.Translation(self, self.position, new_position))
-                k += 1
-            elif other_pieces[new_position].colour == self.colour:
-                # Square is occupied by friendly piece, stop
-                break
-            else:
-                # Square is occupied by enemy piece, can capture
-                possible_moves.append(moves.Capture(self, self.position, new_position, other_pieces[new_position]))
-                break
-        
-        # Moving down-left
-        k = 1
-        while self.position[0] - k >= 0 and self.position[1] - k >= 0:
-            new_position = self.position[0] - k, self.position[1] - k
-            if new_position not in other_pieces:
-                # Square is empty, add to possible_moves
-                possible_moves.append(moves.Translation(self, self.position, new_position))
-                k += 1
-            elif other_pieces[new_position].colour == self.colour:
-                # Square is occupied by friendly piece, stop
-                break
-            else:
-                # Square is occupied by enemy piece, can capture
-                possible_moves.append(moves.Capture(self, self.position, new_position, other_pieces[new_position]))
-                break
-        
-        # Moving down-right
-        k = 1
-        while self.position[0] + k <= 7 and self.position[1] - k >= 0:
-            new_position = self.position[0] + k, self.position[1] - k
-            if new_position not in other_pieces:
-                # Square is empty, add to possible_moves
-                possible_moves.append(moves.Translation(self, self.position, new_position))
-                k += 1
-            elif other_pieces[new_position].colour == self.colour:
-                # Square is occupied by friendly piece, stop
-                break
-            else:
-                # Square is occupied by enemy piece, can capture
-                possible_moves.append(moves.Capture(self, self.position, new_position, other_pieces[new_position]))
-                break
-            
-        return possible_moves
+        bitboards = game_state.bitboards
+
+        # Slide along the diagonals, stopping at the first piece hit
+        targets = (bitboard.bishop_lookup(bitboard.square_index(self.position), bitboards.all)
+                   & ~bitboards.occupied[self.colour])
+
+        return self.moves_to(targets, game_state)
     
 
 class Knight(Piece):
-    def __init__(self, position, colour, moved=False):
-        super().__init__(position, colour, moved)
-        if self.colour == "white":
-            self.path = "pieces/white_knight.png"
-        elif self.colour == "black":
-            self.path = "pieces/black_knight.png"
-        self.name = "Knight"
+    __slots__ = ()
+    name = "Knight"
+    paths = {"white": "pieces/white_knight.png", "black": "pieces/black_knight.png"}
     
     def __str__(self):
         return "N"
@@ -418,41 +173,19 @@ class Knight(Piece):
         return str(self)
     
     def possible_moves(self, game_state):
-        possible_moves = []
-        other_pieces = game_state.pieces_by_position
+        bitboards = game_state.bitboards
 
-        offsets = [[-2, -1], [-2, 1],
-                   [-1, -2], [-1, 2],
-                   [1, -2], [1, 2],
-                   [2, -1], [2, 1]]
-        
-        for offset in offsets:
-            new_position = (self.position[0] + offset[0],
-                          self.position[1] + offset[1])
-            
-            # check if new square is on the board...
-            if 0 <= new_position[0] <= 7 and 0 <= new_position[1] <= 7:
-                if new_position not in other_pieces:
-                    # Square is empty, add to possible_moves
-                    possible_moves.append(moves.Translation(self, self.position, new_position))
-                elif other_pieces[new_position].colour == self.colour:
-                    # Square is occupied by friendly piece, do nothing
-                    pass
-                else:
-                    # Square is occupied by enemy piece, can capture
-                    possible_moves.append(moves.Capture(self, self.position, new_position, other_pieces[new_position]))
+        # Every square the knight jumps to, minus those held by friendly pieces
+        targets = (bitboard.KNIGHT_ATTACKS[bitboard.square_index(self.position)]
+                   & ~bitboards.occupied[self.colour])
 
-        return possible_moves
+        return self.moves_to(targets, game_state)
     
 
 class Pawn(Piece):
-    def __init__(self, position, colour, moved=False):
-        super().__init__(position, colour, moved)
-        if self.colour == "white":
-            self.path = "pieces/white_pawn.png"
-        elif self.colour == "black":
-            self.path = "pieces/black_pawn.png"
-        self.name = "Pawn"
+    __slots__ = ()
+    name = "Pawn"
+    paths = {"white": "pieces/white_pawn.png", "black": "pieces/black_pawn.png"}
     
     def __str__(self):
         return ""
@@ -462,131 +195,36 @@ class Pawn(Piece):
     
     def possible_moves(self, game_state):
         possible_moves = []
-        other_pieces = game_state.pieces_by_position
+        bitboards = game_state.bitboards
+        empty = bitboard.FULL_BOARD ^ bitboards.all
+        index = bitboard.square_index(self.position)
+        square = 1 << index
 
         if self.colour == "white":
-            # can only move upwards
-            if self.moved:
-                possible_squares = [(self.position[0], self.position[1] + 1)]
-                for square in possible_squares:
-                    if not (0 <= square[0] <= 7 and 0 <= square[1] <= 7):
-                        # Square not on board, can't go further
-                        break
-                    elif square not in other_pieces:
-                        # Space is empty, add to possible_moves
-                        possible_moves.append(moves.Translation(self, self.position, square))
-                    elif other_pieces[square].colour == self.colour:
-                        # Space is occupied by friendly piece, stop
-                        break
-                    else:
-                        # Space is occupied by enemy piece, stop
-                        break
-            else:
-                possible_squares = [(self.position[0], self.position[1] + 1),
-                                    (self.position[0], self.position[1] + 2)]
-                for square in possible_squares:
-                    if not (0 <= square[0] <= 7 and 0 <= square[1] <= 7):
-                        # Square not on board, can't go further
-                        break
-                    elif square not in other_pieces:
-                        # Space is empty, add to possible_moves
-                        possible_moves.append(moves.Translation(self, self.position, square))
-                    elif other_pieces[square].colour == self.colour:
-                        # Space is occupied by friendly piece, stop
-                        break
-                    else:
-                        # Space is occupied by enemy piece, stop
-                        break
-            
-            # now deal with standard captures
-            possible_capture_squares = [(self.position[0] - 1, self.position[1] + 1),
-                                        (self.position[0] + 1, self.position[1] + 1)]
-            for square in possible_capture_squares:
-                # if square is on the board...
-                if 0 <= square[0] <= 7 and 0 <= square[1] <= 7:
-                    # if square is occupied by an enemy piece
-                    if square in other_pieces and other_pieces[square].colour != self.colour:
-                        possible_moves.append(moves.Capture(self, self.position, square, other_pieces[square]))
-            
-            # now deal with en passant
-            # we make sure we have a last made move; i.e. this isn't the first turn
-            if len(game_state.move_history) > 0:
-                if self.position[1] == 4:
-                    # white pawn must be on its fifth rank
-                    adjacent_squares = [(self.position[0] - 1, self.position[1]),
-                                        (self.position[0] + 1, self.position[1])]
-                    last_move_made = game_state.move_history[-1]
-                    # need to check:
-                    # - the last move was a pawn double move
-                    # - into an adjacent square
-                    conditions = (isinstance(last_move_made, moves.Translation) and
-                                isinstance(last_move_made.piece, Pawn) and
-                                last_move_made.piece.position in adjacent_squares and
-                                abs(last_move_made.old_position[1] - last_move_made.new_position[1]) == 2)
-                    if conditions:
-                        square = (last_move_made.piece.position[0], last_move_made.piece.position[1] + 1)
-                        possible_moves.append(moves.EnPassant(self, self.position, square, last_move_made.piece)) 
+            # can only move upwards, one square or two if the pawn hasn't moved
+            # yet. Either step is blocked by any piece in the way.
+            targets = (square << 8) & empty
+            if not self.moved:
+                targets |= (targets << 8) & empty
         else:
             # handle black pawns- they can only move down
-            if self.moved:
-                possible_squares = [(self.position[0], self.position[1] - 1)]
-                for square in possible_squares:
-                    if not (0 <= square[0] <= 7 and 0 <= square[1] <= 7):
-                        # Square not on board, can't go further
-                        break
-                    elif square not in other_pieces:
-                        # Space is empty, add to possible_moves
-                        possible_moves.append(moves.Translation(self, self.position, square))
-                    elif other_pieces[square].colour == self.colour:
-                        # Space is occupied by friendly piece, stop
-                        break
-                    else:
-                        # Space is occupied by enemy piece, stop
-                        break
-            else:
-                possible_squares = [(self.position[0], self.position[1] - 1),
-                                    (self.position[0], self.position[1] - 2)]
-                for square in possible_squares:
-                    if not (0 <= square[0] <= 7 and 0 <= square[1] <= 7):
-                        # Square not on board, can't go further
-                        break
-                    elif square not in other_pieces:
-                        # Space is empty, add to possible_moves
-                        possible_moves.append(moves.Translation(self, self.position, square))
-                    elif other_pieces[square].colour == self.colour:
-                        # Space is occupied by friendly piece, stop
-                        break
-                    else:
-                        # Space is occupied by enemy piece, stop
-                        break
-            
-            # now deal with standard captures
-            possible_capture_squares = [(self.position[0] - 1, self.position[1] - 1),
-                                        (self.position[0] + 1, self.position[1] - 1)]
-            for square in possible_capture_squares:
-                # if square is on the board...
-                if 0 <= square[0] <= 7 and 0 <= square[1] <= 7:
-                    # if square is occupied by an enemy piece
-                    if square in other_pieces and other_pieces[square].colour != self.colour:
-                        possible_moves.append(moves.Capture(self, self.position, square, other_pieces[square]))
+            targets = (square >> 8) & empty
+            if not self.moved:
+                targets |= (targets >> 8) & empty
+
+        # now deal with standard captures onto enemy pieces
+        targets |= (bitboard.PAWN_ATTACKS[self.colour][index]
+                    & bitboards.occupied["black" if self.colour == "white" else "white"])
+        possible_moves += self.moves_to(targets, game_state)
+
+        # now deal with en passant
+        # the last move must have been a pawn double move, passing over a square
+        # this pawn attacks from its fifth rank
+        fifth_rank = 4 if self.colour == "white" else 3
+        en_passant = game_state.en_passant
+        if en_passant and self.position[1] == fifth_rank:
+            if bitboard.PAWN_ATTACKS[self.colour][index] & bitboard.square_mask(en_passant):
+                captured_piece = game_state.pieces_by_position[(en_passant[0], self.position[1])]
+                possible_moves.append(moves.EnPassant(self, self.position, en_passant, captured_piece))
             
-            # now deal with en passant
-            # we make sure we have a last made move; i.e. this isn't the first turn
-            if len(game_state.move_history) > 0:
-                if self.position[1] == 3:
-                    # black pawn must be on its fifth rank
-                    adjacent_squares = [(self.position[0] - 1, self.position[1]),
-                                        (self.position[0] + 1, self.position[1])]
-                    last_move_made = game_state.move_history[-1]
-                    # need to check:
-                    # - the last move was a pawn double move
-                    # - into an adjacent square
-                    conditions = (isinstance(last_move_made, moves.Translation) and
-                                isinstance(last_move_made.piece, Pawn) and
-                                last_move_made.piece.position in adjacent_squares and
-                                abs(last_move_made.old_position[1] - last_move_made.new_position[1]) == 2)
-                    if conditions:
-                        square = (last_move_made.piece.position[0], last_move_made.piece.position[1] - 1)
-                        possible_moves.append(moves.EnPassant(self, self.position, square, other_pieces[square]))
-            
-        return possible_moves
\ No newline at end of file
+        return possible_moves
@@ -1,6 +1,12 @@
-import pygame
+import os
 import random
+import copy
+import threading
 import moves
+import search
+import transposition
+import book
+import tablebases
 
 class Player:
     def __init__(self, colour):
@@ -24,6 +30,8 @@ class Human(Player):
             print("Promote your pawn!")
             print("Press Q for a Queen, R for a Rook,")
             print("B for a Bishop or N for a Knight.")
+            # Only a Human needs pygame, so games between AIs can run without it
+            import pygame
             while not new_piece_name:
                 for event in pygame.event.get():
                     if event.type == pygame.QUIT:
@@ -53,10 +61,82 @@ class Human(Player):
 
 
 class AI(Player):
-    def __init__(self, colour, mode):
+    def __init__(self, colour, mode, depth=None, nodes=None, workers=1,
+                 table_size=transposition.DEFAULT_SIZE, book_path=None,
+                 tablebase_path=tablebases.DEFAULT_PATH, verbose=True):
         super().__init__(colour)
         self.my_turn = False
-        self.mode = mode # difficulty, personality etc?
+        self.mode = mode # "random" or "search"
+        # Limits for the search mode - how many plies deep to look, and how
+        # many positions to look at before settling for the last full depth
+        self.depth = depth
+        self.nodes = nodes
+        # Number of processes searching together, each on its own core
+        self.workers = workers
+        # Bytes of memory for remembering positions searched. The table is
+        # kept from move to move, as the next search sees many of the same
+        # positions (a parallel search shares a new one between its processes)
+        self.table_size = table_size
+        self.table = None
+        # Polyglot opening book to play from for as long as the game is in it
+        self.book = book.OpeningBook(book_path) if book_path else None
+        # Endgame tables to play from once few enough pieces are left, if
+        # they've been generated (see tablebases.py)
+        self.tablebases = None
+        if tablebase_path and os.path.isfile(tablebase_path):
+            self.tablebases = tablebases.Tablebases(tablebase_path)
+        # Whether to print what the AI is thinking
+        self.verbose = verbose
+        if mode == "search" and depth is None and nodes is None:
+            raise ValueError("The search AI needs a depth or node limit.")
+
+    def choose_move(self, game_state, stop=None, history=()):
+        """Picks the AI's move in a GameState, as a Move object ready to apply,
+        or None if it has no legal moves. Setting the threading.Event stop from
+        another thread makes the search give up, also returning None. history
+        gives the position keys of the game so far, oldest first, so the search
+        can steer towards or away from repetitions."""
+        if self.book is not None:
+            code = self.book.choose_move(game_state)
+            if code is not None:
+                if self.verbose:
+                    print("{} plays {} from the book".format(self.colour.capitalize(), moves.code_str(code)))
+                return moves.decode_move(game_state, code)
+
+        if self.mode == "search":
+            if self.workers > 1:
+                ai_search = search.ParallelSearch(game_state, self.depth, self.nodes, stop, self.workers,
+                                                  self.table_size, self.tablebases, history)
+            else:
+                if self.table is None:
+                    self.table = transposition.TranspositionTable(self.table_size)
+                ai_search = search.Search(game_state, self.depth, self.nodes, stop, self.table, self.tablebases,
+                                          history)
+            code = ai_search.run()
+            if code is None or (stop is not None and stop.is_set()):
+                return None
+            if self.verbose and ai_search.depth == 0:
+                print("{} plays {} from the tablebases: {}".format(
+                    self.colour.capitalize(), moves.code_str(code), search.score_str(ai_search.score)))
+            elif self.verbose:
+                print("{} searched {} plies ({} nodes): {} {}".format(
+                    self.colour.capitalize(), ai_search.depth, ai_search.nodes,
+                    search.score_str(ai_search.score), " ".join(moves.code_str(move) for move in ai_search.pv)))
+            # Promotions come out of the search already chosen
+            return moves.decode_move(game_state, code)
+
+        # Make a random choice of legal move
+        legal_moves = game_state.legal_moves[self.colour]
+        if not legal_moves:
+            return None
+        move = legal_moves[random.randrange(0, len(legal_moves))]
+        # Check for promotion
+        return self.promotion_handler(move)
+
+    def think(self, game_state, history=()):
+        """Starts choosing a move in the background, and returns a Thinking
+        handle to wait on or cancel."""
+        return Thinking(self, game_state, history)
     
     def promotion_handler(self, move):
         back_rank = 7 if move.piece.colour == "white" else 0
@@ -86,4 +166,53 @@ class AI(Player):
             # No promotion detected; return move
             return move
 
-            
+    def close(self):
+        """Closes the opening book and tablebases, if the AI has them open."""
+        for lookup in (self.book, self.tablebases):
+            if lookup is not None:
+                lookup.close()
+        self.book = None
+        self.tablebases = None
+
+
+class Thinking:
+    """A Thinking object runs an AI's choose_move in a worker thread, so the
+    window can keep being drawn and handle events meanwhile. The worker has a
+    copy of the GameState, as the search makes and unmakes moves on the board
+    it's given; the chosen move is rebuilt on the real GameState afterwards."""
+    def __init__(self, player, game_state, history=()):
+        self.game_state = game_state
+        self.stop = threading.Event()
+        # Encoded move chosen, or exception raised, by the worker
+        self.code = None
+        self.error = None
+        self.thread = threading.Thread(target=self.work, args=(player, copy.deepcopy(game_state), history),
+                                       daemon=True)
+        self.thread.start()
+
+    def work(self, player, game_state, history):
+        try:
+            move = player.choose_move(game_state, self.stop, history)
+            if move is not None:
+                self.code = move.encode()
+        except Exception as error:
+            self.error = error
+
+    def done(self):
+        """Checks whether the move has been chosen, without waiting."""
+        return not self.thread.is_alive()
+
+    def cancel(self):
+        """Stops the search and waits for the worker to finish."""
+        self.stop.set()
+        self.thread.join()
+
+    def move(self):
+        """Gives the chosen move on the real GameState, or None if there wasn't
+        one. Waits for it if need be, and raises anything the worker raised."""
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        if self.code is None:
+            return None
+        return moves.decode_move(self.game_state, self.code)
@@ -0,0 +1,149 @@
+#!/usr/bin/python3
+
+import struct
+import pieces
+import state
+import bitboard
+import fen
+import mapped_file
+
+# Each position packs into a fixed-size 32 byte record:
+#   8 bytes  occupancy bitboard - which squares have a piece on them
+#   16 bytes one 4-bit piece code per set bit of the occupancy, lowest bit
+#            first, so up to 32 pieces
+#   1 byte   flags: bit 0 set for black to move, bits 1-4 for the castling
+#            rights K, Q, k and q
+#   1 byte   en passant file plus one, or 0 for no en passant square (the rank
+#            follows from whose turn it is)
+#   1 byte   halfmove clock
+#   2 bytes  fullmove number
+#   1 byte   padding
+# A position store file is a 16 byte header followed by nothing but records,
+# so record n always starts at HEADER_SIZE + n * RECORD_SIZE.
+
+RECORD = struct.Struct("<Q16sBBBHx")
+RECORD_SIZE = RECORD.size
+HEADER = struct.Struct("<4sHH8x")
+HEADER_SIZE = HEADER.size
+MAGIC = b"PCPS"
+VERSION = 1
+
+# Piece codes: the low three bits give the type, and 8 is added for black. 0
+# is never used, so a record with too few pieces for its occupancy is caught.
+PIECE_CODES = {"King": 1, "Queen": 2, "Rook": 3, "Bishop": 4, "Knight": 5, "Pawn": 6}
+PIECE_TYPES = {1: pieces.King, 2: pieces.Queen, 3: pieces.Rook,
+               4: pieces.Bishop, 5: pieces.Knight, 6: pieces.Pawn}
+CASTLING_BITS = (("K", "white", "o-o"), ("Q", "white", "o-o-o"),
+                 ("k", "black", "o-o"), ("q", "black", "o-o-o"))
+
+
+def pack_state(game_state):
+    """Packs a GameState into a RECORD_SIZE byte record."""
+    occupied = game_state.bitboards.all
+    if bin(occupied).count("1") > 32:
+        raise ValueError("Only positions with at most 32 pieces can be packed.")
+    if not 0 <= game_state.halfmove_clock <= 0xFF or not 0 <= game_state.fullmove_number <= 0xFFFF:
+        raise ValueError("Move clocks are too large to pack.")
+
+    piece_codes = 0
+    shift = 0
+    for index in bitboard.indices(occupied):
+        piece = game_state.pieces_by_position[bitboard.POSITIONS[index]]
+        code = PIECE_CODES[piece.name] | (8 if piece.colour == "black" else 0)
+        piece_codes |= code << shift
+        shift += 4
+
+    flags = 1 if game_state.whose_turn == "black" else 0
+    rights = state.castling_rights(game_state)
+    for bit, (letter, colour, castle) in enumerate(CASTLING_BITS):
+        if rights[colour][castle]:
+            flags |= 2 << bit
+    en_passant = game_state.en_passant[0] + 1 if game_state.en_passant else 0
+
+    return RECORD.pack(occupied, piece_codes.to_bytes(16, "little"), flags, en_passant,
+                       game_state.halfmove_clock, game_state.fullmove_number)
+
+
+def unpack_state(buffer, offset=0):
+    """Builds a GameState from the record starting at offset in a buffer, which
+    can be bytes or a memory map."""
+    occupied, packed_codes, flags, en_passant, halfmove_clock, fullmove_number = RECORD.unpack_from(buffer, offset)
+    piece_codes = int.from_bytes(packed_codes, "little")
+
+    piece_list = []
+    for index in bitboard.indices(occupied):
+        code = piece_codes & 0xF
+        piece_codes >>= 4
+        piece_type = PIECE_TYPES.get(code & 7)
+        if piece_type is None:
+            raise ValueError("Corrupt position record: bad piece code {}".format(code))
+        colour = "black" if code & 8 else "white"
+        position = bitboard.POSITIONS[index]
+        if piece_type is pieces.Pawn:
+            moved = position[1] != (1 if colour == "white" else 6)
+        else:
+            moved = piece_type is pieces.King or piece_type is pieces.Rook
+        piece_list.append(piece_type(position, colour, moved))
+
+    whose_turn = "black" if flags & 1 else "white"
+    castling = "".join(letter for bit, (letter, colour, castle) in enumerate(CASTLING_BITS)
+                       if flags & (2 << bit))
+    if en_passant:
+        en_passant = (en_passant - 1, 5 if whose_turn == "white" else 2)
+    else:
+        en_passant = None
+
+    return fen.state_from_parts(piece_list, whose_turn, castling, en_passant, halfmove_clock, fullmove_number)
+
+
+def write_store(path, game_states):
+    """Writes GameStates to a new position store file, one record each, and
+    returns how many were written. Any iterable of GameStates will do, so
+    positions can be streamed to disk as they're made."""
+    count = 0
+    with mapped_file.replacing(path) as f:
+        f.write(HEADER.pack(MAGIC, VERSION, RECORD_SIZE))
+        for game_state in game_states:
+            f.write(pack_state(game_state))
+            count += 1
+    return count
+
+
+class PositionStore(mapped_file.MappedFile):
+    """A PositionStore reads a position store file through a read-only memory
+    map. Nothing is read up front: indexing the store decodes just that record
+    into a new GameState, so any number of processes can open the same file and
+    share the operating system's copy of it."""
+    kind = "position store"
+    min_size = HEADER_SIZE
+
+    def read_header(self, size):
+        magic, version, record_size = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION or record_size != RECORD_SIZE:
+            raise ValueError("Not a version {} position store: {}".format(VERSION, self.path))
+        if (size - HEADER_SIZE) % RECORD_SIZE:
+            raise ValueError("Position store has a partial record: {}".format(self.path))
+        self.length = (size - HEADER_SIZE) // RECORD_SIZE
+
+    def __len__(self):
+        return self.length
+
+    def offset(self, index):
+        """Gives where record number index starts in the file."""
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("Position store index out of range")
+        return HEADER_SIZE + index * RECORD_SIZE
+
+    def __getitem__(self, index):
+        return unpack_state(self.map, self.offset(index))
+
+    def __iter__(self):
+        for index in range(self.length):
+            yield unpack_state(self.map, HEADER_SIZE + index * RECORD_SIZE)
+
+    def record(self, index):
+        """Gives the raw bytes of a record, without decoding it."""
+        offset = self.offset(index)
+        return self.map[offset:offset + RECORD_SIZE]
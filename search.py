@@ -0,0 +1,371 @@
+#!/usr/bin/python3
+
+import multiprocessing
+import moves
+import state
+import bitboard
+import evaluation
+import transposition
+import tablebases
+import fen
+
+# Scores are centipawns from the point of view of the side to move (negamax),
+# so a child's score is negated on the way back up. A side that is mated at
+# ply p from the root scores -(MATE - p): quicker mates score further from
+# zero, and any score beyond MATE_BOUND is a forced mate.
+MATE = 100000
+MATE_BOUND = MATE - 1000
+INFINITY = MATE + 1
+
+# Moves are searched in order of a sort key: the best move stored for the
+# position in the transposition table, or else the move from the last
+# principal variation, first, then captures and queen promotions (most valuable victim,
+# then least valuable attacker), then the two killer moves of the ply (quiet
+# moves which caused a cutoff in a sibling position), then the other quiet
+# moves by how often they've caused cutoffs anywhere (the history table).
+PV_ORDER = 1 << 30
+CAPTURE_ORDER = 1 << 20
+KILLER_ORDER = 1 << 19
+# History scores are halved when one gets this big, so they stay below the
+# killers and recent cutoffs count for more than old ones
+HISTORY_LIMIT = 1 << 18
+# A King never gets captured, but as an attacker it should come last
+ATTACKER_VALUES = dict(evaluation.PIECE_VALUES, King=1000)
+QUEEN_PROMOTION = moves.PROMOTION | 3
+MAX_PLY = 128
+
+
+class SearchAborted(Exception):
+    """Raised inside the search when it runs out of nodes or is stopped, to
+    unwind it."""
+
+
+class Search:
+    """A Search object finds the best move in a GameState by negamax alpha-beta
+    search, one ply deeper at a time (iterative deepening). The principal
+    variation (the line both sides are expected to play) from each iteration is
+    searched first in the next, and the other moves are ordered as described
+    above, which makes the cutoffs come sooner. Past the last ply, captures are
+    followed by a quiescence search.
+    The search stops after max_depth plies, or once max_nodes positions have
+    been visited, whichever comes first. At least one ply is always searched,
+    unless the search is stopped from another thread by setting stop (a
+    threading.Event), which ends it straight away.
+    history gives the position keys of the game before the root, oldest
+    first, so repetitions of positions already played are seen as draws.
+    Given tablebases (a tablebases.Tablebases), positions they cover aren't
+    searched at all: at the root the move comes straight from the tables, and
+    anywhere else in the tree their score is used as it is.
+    The GameState is made and unmade in place, and left as it was found."""
+    def __init__(self, game_state, max_depth=None, max_nodes=None, stop=None, table=None, tablebases=None,
+                 history=()):
+        if max_depth is None and max_nodes is None:
+            raise ValueError("A search needs a depth or node limit.")
+        self.game_state = game_state
+        self.max_depth = max_depth if max_depth is not None else 64
+        self.max_nodes = max_nodes
+        self.stop = stop
+        # transposition.TranspositionTable to share results between the
+        # branches of the search (and other searches), if any
+        self.table = table
+        self.tablebases = tablebases
+        self.nodes = 0
+        # Results of the last iteration to finish
+        self.depth = 0
+        self.score = 0
+        self.pv = []
+        # Keys of the positions played and on the line being searched, for
+        # repetitions
+        self.keys = list(history)
+        # Two killer moves per ply, and a history score for each side's
+        # from-to square pair (the low 12 bits of an encoded move)
+        self.killers = [[None, None] for ply in range(MAX_PLY)]
+        self.history = {"white": [0] * 4096, "black": [0] * 4096}
+
+    def run(self, start_depth=1):
+        """Searches to the limits, and returns the best move (encoded), or None
+        if there are no legal moves or the search was stopped before it had one."""
+        game_state = self.game_state
+        if not state.all_legal_codes(game_state, game_state.whose_turn):
+            return None
+        if self.tablebases is not None:
+            entry = self.tablebases.best_move(game_state)
+            if entry is not None:
+                # Known result - no need to search, and depth stays 0
+                code, result, plies = entry
+                self.score, self.pv = tablebase_score(result, plies, 0), [code]
+                return code
+        if self.table is not None:
+            self.table.new_search()
+        for depth in range(start_depth, self.max_depth + 1):
+            try:
+                score, pv = self.negamax(depth, 0, -INFINITY, INFINITY)
+            except SearchAborted:
+                break
+            self.depth, self.score, self.pv = depth, score, pv
+            if abs(score) > MATE_BOUND:
+                # Mate found - searching deeper won't find a better one
+                break
+        return self.pv[0] if self.pv else None
+
+    def negamax(self, depth, ply, alpha, beta):
+        """Gives the score of the position to the given depth, and the line of
+        moves leading to it, within the window alpha to beta. A score at or
+        below alpha, or at or above beta, only says which side of the window
+        the true score is on."""
+        game_state = self.game_state
+        self.nodes += 1
+        self.check_limits()
+
+        if ply > 0:
+            # Fifty-move rule, or a repetition on the line searched so far
+            if game_state.halfmove_clock >= 100:
+                return 0, []
+            key = game_state.zobrist_key
+            if key in self.keys[max(len(self.keys) - game_state.halfmove_clock, 0):]:
+                return 0, []
+            if self.tablebases is not None:
+                entry = self.tablebases.probe(game_state)
+                if entry is not None:
+                    return tablebase_score(*entry, ply), []
+
+        hash_code = 0
+        if self.table is not None and depth > 0:
+            entry = self.table.probe(game_state.zobrist_key)
+            if entry is not None:
+                hash_code, score, entry_depth, bound = entry
+                if ply > 0 and entry_depth >= depth:
+                    # Searched at least this deep before - use the score if
+                    # it's good enough for this window
+                    score = score_from_table(score, ply)
+                    if (bound == transposition.EXACT or (bound == transposition.LOWER and score >= beta)
+                            or (bound == transposition.UPPER and score <= alpha)):
+                        return score, [hash_code] if hash_code else []
+
+        codes = state.all_legal_codes(game_state, game_state.whose_turn)
+        if not codes:
+            if state.in_check(game_state, game_state.whose_turn):
+                return -(MATE - ply), []
+            return 0, []
+        if depth <= 0 or ply >= MAX_PLY - 1:
+            return self.quiescence(ply, alpha, beta, codes), []
+
+        if not hash_code and ply < len(self.pv):
+            hash_code = self.pv[ply]
+        self.order_moves(codes, ply, hash_code)
+
+        original_alpha = alpha
+        best_line = []
+        self.keys.append(game_state.zobrist_key)
+        try:
+            for code in codes:
+                undo = moves.make_move(game_state, code)
+                try:
+                    score, line = self.negamax(depth - 1, ply + 1, -beta, -alpha)
+                finally:
+                    moves.unmake_move(game_state, code, undo)
+                score = -score
+                if score > alpha:
+                    alpha = score
+                    best_line = [code] + line
+                    if alpha >= beta:
+                        # The opponent won't allow this position
+                        if not code >> 12 & (moves.CAPTURE | moves.PROMOTION):
+                            self.add_cutoff(code, depth, ply)
+                        break
+        finally:
+            self.keys.pop()
+
+        if self.table is not None:
+            if alpha >= beta:
+                bound = transposition.LOWER
+            elif alpha > original_alpha:
+                bound = transposition.EXACT
+            else:
+                bound = transposition.UPPER
+            self.table.store(game_state.zobrist_key, best_line[0] if best_line else hash_code,
+                             score_to_table(alpha, ply), depth, bound)
+        return alpha, best_line
+
+    def quiescence(self, ply, alpha, beta, codes=None):
+        """Searches captures (and queen promotions) only, until the position is
+        quiet, so the evaluation is never made in the middle of an exchange.
+        The side to move can always "stand pat" and take the evaluation instead
+        of capturing - except in check, where every way out is searched.
+        codes are the legal moves, if the caller has worked them out already."""
+        game_state = self.game_state
+        if codes is None:
+            self.nodes += 1
+            self.check_limits()
+            if self.tablebases is not None:
+                # Captures often run down into an ending the tables cover
+                entry = self.tablebases.probe(game_state)
+                if entry is not None:
+                    return tablebase_score(*entry, ply)
+            codes = state.all_legal_codes(game_state, game_state.whose_turn)
+            if not codes:
+                if state.in_check(game_state, game_state.whose_turn):
+                    return -(MATE - ply)
+                return 0
+
+        if ply < MAX_PLY - 1 and state.in_check(game_state, game_state.whose_turn):
+            candidates = codes
+        else:
+            stand_pat = evaluation.evaluate(game_state)
+            if stand_pat >= beta or ply >= MAX_PLY - 1:
+                return stand_pat if stand_pat < beta else beta
+            if stand_pat > alpha:
+                alpha = stand_pat
+            candidates = [code for code in codes
+                          if code >> 12 & moves.CAPTURE and not code >> 12 & moves.PROMOTION
+                          or code >> 12 & QUEEN_PROMOTION == QUEEN_PROMOTION]
+        self.order_moves(candidates, ply, None)
+
+        for code in candidates:
+            undo = moves.make_move(game_state, code)
+            try:
+                score = -self.quiescence(ply + 1, -beta, -alpha)
+            finally:
+                moves.unmake_move(game_state, code, undo)
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    return beta
+        return alpha
+
+    def check_limits(self):
+        """Raises SearchAborted if the search has been stopped, or has used up
+        its nodes and has a move to fall back on."""
+        if self.stop is not None and self.stop.is_set():
+            raise SearchAborted()
+        if self.max_nodes is not None and self.nodes > self.max_nodes and self.depth > 0:
+            raise SearchAborted()
+
+    def order_moves(self, codes, ply, pv_code):
+        """Sorts encoded moves in place, the ones most likely to cause a cutoff
+        first."""
+        pieces_by_position = self.game_state.pieces_by_position
+        killers = self.killers[ply]
+        history = self.history[self.game_state.whose_turn]
+        positions = bitboard.POSITIONS
+
+        def order_key(code):
+            if code == pv_code:
+                return PV_ORDER
+            flags = code >> 12
+            if flags & moves.PROMOTION:
+                if flags & 3 != 3:
+                    # Underpromotions are hardly ever best
+                    return -1
+                key = CAPTURE_ORDER + 10 * evaluation.PIECE_VALUES["Queen"]
+                if flags & moves.CAPTURE:
+                    key += 10 * evaluation.PIECE_VALUES[pieces_by_position[positions[(code >> 6) & 0x3F]].name]
+                return key
+            if flags & moves.CAPTURE:
+                # An en passant capture has no piece on the target square
+                victim = pieces_by_position.get(positions[(code >> 6) & 0x3F])
+                victim_value = evaluation.PIECE_VALUES[victim.name] if victim else evaluation.PIECE_VALUES["Pawn"]
+                return (CAPTURE_ORDER + 10 * victim_value
+                        - ATTACKER_VALUES[pieces_by_position[positions[code & 0x3F]].name])
+            if code == killers[0]:
+                return KILLER_ORDER + 1
+            if code == killers[1]:
+                return KILLER_ORDER
+            return history[code & 0xFFF]
+
+        codes.sort(key=order_key, reverse=True)
+
+    def add_cutoff(self, code, depth, ply):
+        """Remembers a quiet move which caused a cutoff, as a killer for its ply
+        and in the history table."""
+        killers = self.killers[ply]
+        if killers[0] != code:
+            killers[1] = killers[0]
+            killers[0] = code
+        history = self.history[self.game_state.whose_turn]
+        history[code & 0xFFF] += depth * depth
+        if history[code & 0xFFF] > HISTORY_LIMIT:
+            for index in range(4096):
+                history[index] //= 2
+
+
+class ParallelSearch(Search):
+    """A ParallelSearch is a Search helped by worker processes (Lazy SMP). The
+    workers search the same position with no limits, odd numbered ones a ply
+    ahead, until the main search is done. They all share one transposition
+    table in shared memory, so what any of them finds speeds up the others,
+    and the main search gets deeper in the same time. workers counts the main
+    search, so 1 means no helpers."""
+    def __init__(self, game_state, max_depth=None, max_nodes=None, stop=None, workers=2,
+                 table_size=transposition.DEFAULT_SIZE, tablebases=None, history=()):
+        super().__init__(game_state, max_depth, max_nodes, stop, tablebases=tablebases, history=history)
+        self.workers = workers
+        self.table_size = table_size
+
+    def run(self, start_depth=1):
+        self.table = transposition.TranspositionTable(self.table_size, shared=True)
+        helpers_stop = multiprocessing.Event()
+        helpers = [multiprocessing.Process(target=search_worker, daemon=True,
+                                           args=(fen.fen_from_state(self.game_state), self.table,
+                                                 start_depth + number % 2, helpers_stop, self.tablebases,
+                                                 self.keys))
+                   for number in range(1, self.workers)]
+        try:
+            for helper in helpers:
+                helper.start()
+            return super().run(start_depth)
+        finally:
+            helpers_stop.set()
+            for helper in helpers:
+                helper.join()
+            self.table.close()
+            self.table.unlink()
+            self.table = None
+
+
+def search_worker(fen_string, table, start_depth, stop, tablebases=None, history=()):
+    """Searches a position for a ParallelSearch until told to stop. Runs in a
+    worker process."""
+    try:
+        Search(fen.state_from_fen(fen_string), MAX_PLY // 2, None, stop, table, tablebases,
+               history).run(start_depth)
+    finally:
+        table.close()
+
+
+def score_to_table(score, ply):
+    """Turns a mate score counted from the root into one counted from the
+    position, for storing in the transposition table."""
+    if score > MATE_BOUND:
+        return score + ply
+    if score < -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def score_from_table(score, ply):
+    """Turns a mate score from the transposition table back into one counted
+    from the root."""
+    if score > MATE_BOUND:
+        return score - ply
+    if score < -MATE_BOUND:
+        return score + ply
+    return score
+
+
+def tablebase_score(result, plies, ply):
+    """Turns a tablebase result a number of plies from mate into a score for a
+    position ply plies from the root."""
+    if result == tablebases.WIN:
+        return MATE - ply - plies
+    if result == tablebases.LOSS:
+        return -(MATE - ply - plies)
+    return 0
+
+
+def score_str(score):
+    """Gives a score as pawns, or as mate in a number of moves."""
+    if abs(score) > MATE_BOUND:
+        moves_to_mate = (MATE - abs(score) + 1) // 2
+        return "mate {}".format(moves_to_mate if score > 0 else -moves_to_mate)
+    return "{:+.2f}".format(score / 100)
@@ -0,0 +1,65 @@
+#!/usr/bin/python3
+
+import argparse
+import os
+import sys
+import time
+import moves
+import search
+import transposition
+import fen
+import perft
+
+# Times the search to a fixed depth on the standard perft positions, once for
+# each number of workers asked for, to see how much a parallel search gains
+# from more cores. One worker is a plain Search with its own table; more is a
+# ParallelSearch, which starts its helper processes and shared table on every
+# search, as the AI does on every move - so that cost is in the times too.
+
+DEPTHS = {"start": 5, "kiwipete": 4, "position3": 6, "position4": 4, "position5": 4, "position6": 4}
+
+
+def time_search(fen_string, depth, workers, table_size=transposition.DEFAULT_SIZE):
+    """Searches a position to a depth with a number of workers. Gives the
+    seconds it took, and the search."""
+    game_state = fen.state_from_fen(fen_string)
+    start = time.perf_counter()
+    if workers == 1:
+        ai_search = search.Search(game_state, depth, table=transposition.TranspositionTable(table_size))
+    else:
+        ai_search = search.ParallelSearch(game_state, depth, workers=workers, table_size=table_size)
+    ai_search.run()
+    return time.perf_counter() - start, ai_search
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the search to a fixed depth with different numbers "
+                                                 "of worker processes.")
+    parser.add_argument("-w", "--workers", type=int, nargs="+", default=[1, 2, 4],
+                        help="numbers of workers to try (default 1 2 4)")
+    parser.add_argument("-d", "--depth", type=int,
+                        help="depth to search every position to (default one per position)")
+    args = parser.parse_args(argv)
+    if any(workers < 1 for workers in args.workers):
+        parser.error("need at least one worker")
+
+    print("{} cores".format(os.cpu_count()))
+    totals = {}
+    for workers in args.workers:
+        total = 0
+        for name in sorted(DEPTHS):
+            depth = args.depth or DEPTHS[name]
+            elapsed, ai_search = time_search(perft.POSITIONS[name][0], depth, workers)
+            total += elapsed
+            print("{} workers, {} depth {}: {:.2f}s, {} nodes, {} {}".format(
+                workers, name, depth, elapsed, ai_search.nodes, search.score_str(ai_search.score),
+                moves.code_str(ai_search.pv[0]) if ai_search.pv else "-"))
+        totals[workers] = total
+    for workers, total in totals.items():
+        print("{} workers: {:.2f}s in all, {:.2f}x the speed of {} workers".format(
+            workers, total, totals[args.workers[0]] / total, args.workers[0]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,32 @@
 import pieces
 import moves
-import copy
+import bitboard
+import zobrist
+import evaluation
 from typing import List
 
+class MoveCache:
+    """A MoveCache looks like a dictionary from colour to a list of moves, but
+    only works out a colour's moves the first time they're asked for. They are
+    kept until the position changes, which the position key tells us about."""
+    def __init__(self, game_state, generator):
+        self.game_state = game_state
+        # Function of (game_state, colour) which works out the moves
+        self.generator = generator
+        # colour -> (position key the moves were worked out for, moves)
+        self.cache = {}
+
+    def __getitem__(self, colour):
+        entry = self.cache.get(colour)
+        if entry is None or entry[0] != self.game_state.zobrist_key:
+            entry = (self.game_state.zobrist_key, self.generator(self.game_state, colour))
+            self.cache[colour] = entry
+        return entry[1]
+
+    def clear(self):
+        """Forgets every cached move list."""
+        self.cache = {}
+
 class GameState:
     """A GameState object contains all the information necessary to encode the 
     state of a game of chess."""
@@ -10,20 +34,32 @@ class GameState:
         self.piece_list = piece_list
         self.pieces_by_position = dict(zip([piece.position 
                                 for piece in self.piece_list], self.piece_list))
+        self.bitboards = bitboard.Bitboards(self.piece_list)
         self.captured_pieces = []
         self.whose_turn = whose_turn
+        # Moves made so far, as encoded moves (see moves.encode_move)
         self.move_history = []
-        self.can_castle = {"white": {"o-o": True, "o-o-o": True},
-                           "black": {"o-o": True, "o-o-o": True}}
-        self.possible_moves = {"white": all_possible_moves(self, "white"),
-                               "black": all_possible_moves(self, "black")}
+        # Square passed over by a pawn double move on the last turn, if any
+        self.en_passant = None
+        # Plies since the last capture or pawn move, for the fifty-move rule,
+        # and the number of the move being played, going up after black moves
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        self.zobrist_key = zobrist.full_key(self)
+        # Material plus piece-square score from white's point of view, kept up
+        # to date by moves as they're made and unmade
+        self.piece_score = evaluation.evaluate_white(self)
         self.can_castle = can_castle(self)
-        self.legal_moves = {"white": all_legal_moves(self, "white"),
-                            "black": all_legal_moves(self, "black")}
+        # Move lists are only worked out when read, and only for the colour read
+        self.possible_moves = MoveCache(self, all_possible_moves)
+        self.legal_moves = MoveCache(self, all_legal_moves)
         self.game_over = False
     
     def __str__(self):
+        # fen builds on this module, so is only imported once it's needed
+        import fen
         output_string = "Game state dump\n"
+        output_string += "FEN: " + fen.fen_from_state(self) + "\n"
         # Print piece list
         output_string += "---Piece list---\n"
         piece_list_string = ""
@@ -67,7 +103,7 @@ class GameState:
         output_string += "---Moves made---\n"
         move_history_string = ""
         for move in self.move_history:
-            move_history_string += (str(move) +"\n")
+            move_history_string += (moves.code_str(move) +"\n")
         output_string += move_history_string
         # Print all 'possible' moves for white
         output_string += "---'Possible' moves for white---\n"
@@ -104,16 +140,21 @@ def update_state(game_state: GameState) -> GameState:
     game state data is up to date."""
     game_state.pieces_by_position = dict(zip([piece.position 
                             for piece in game_state.piece_list], game_state.piece_list))
-    game_state.possible_moves = {"white": all_possible_moves(game_state, "white"),
-                                 "black": all_possible_moves(game_state, "black")}
+    game_state.bitboards = bitboard.Bitboards(game_state.piece_list)
+    game_state.zobrist_key = zobrist.full_key(game_state)
+    game_state.piece_score = evaluation.evaluate_white(game_state)
     game_state.can_castle = can_castle(game_state)
-    game_state.legal_moves = {"white": all_legal_moves(game_state, "white"),
-                              "black": all_legal_moves(game_state, "black")}
+    # The pieces may have been swapped for new ones in the same places, which
+    # leaves the position key alone, so the move lists are thrown away here
+    game_state.possible_moves.clear()
+    game_state.legal_moves.clear()
     return game_state
-    
+
 def all_possible_moves(game_state, colour):
     """This method runs through all pieces of a given colour and returns a list 
     of all possible Move objects, whether they're legal or not."""
+    # Castling rights must be current before the King generates its castles
+    game_state.can_castle = can_castle(game_state)
     move_list = []
     pieces = []
     if colour == "white":
@@ -131,13 +172,279 @@ def all_possible_moves(game_state, colour):
 
 def all_legal_moves(game_state, colour):
     """This method run through all pieces of a given colour and returns a list of
-    all legal moves."""
+    all legal moves.
+    Pins and checks are worked out once from the King's square, after which each
+    possible move is accepted or rejected with a couple of mask tests, so no move
+    has to be tried out on the board."""
     possible_moves_list = game_state.possible_moves[colour]
+    bitboards = game_state.bitboards
+    king_bitboard = bitboards.pieces[colour]["King"]
+    # No kings failsafe- will never happen in normal games
+    if not king_bitboard:
+        # no friendly king - every possible move is legal
+        return list(possible_moves_list)
+    other_colour = "black" if colour == "white" else "white"
+
+    checkers, check_mask, pins = pins_and_checks(game_state, colour)
+    # Squares the King can't step onto. The King is lifted off the board first,
+    # so it can't shelter behind itself from a slider that is checking it
+    danger = attacked_squares(game_state, other_colour, bitboards.all ^ king_bitboard)
+
     legal_moves_list = []
     for move in possible_moves_list:
-        if valid_move(game_state, move, colour):
+        origin = bitboard.square_mask(move.old_position)
+        target = bitboard.square_mask(move.new_position)
+        if origin == king_bitboard:
+            if move.move_type == "Castle":
+                # Conditions 4 and 5 of can_castle - the King can't castle out of
+                # check, or through or into an attacked square
+                path = target | bitboard.square_mask(move.new_rook_position)
+                if not checkers and not danger & path:
+                    legal_moves_list.append(move)
+            elif not danger & target:
+                legal_moves_list.append(move)
+        elif move.move_type == "EnPassant":
+            # Two pawns leave the same rank at once, which can uncover the King
+            # in ways a pin can't describe, so look again from the King
+            if en_passant_safe(game_state, origin, target, colour):
+                legal_moves_list.append(move)
+        elif target & check_mask and target & pins.get(origin, bitboard.FULL_BOARD):
+            # Move deals with any check, and keeps a pinned piece on its pin
             legal_moves_list.append(move)
-    return legal_moves_list   
+    return legal_moves_list
+
+def add_codes(codes, from_index, targets, enemies):
+    """This method adds an encoded move to a list for every square in the bitboard
+    targets, flagging the ones onto enemy pieces as captures."""
+    while targets:
+        target = targets & -targets
+        code = from_index | ((target.bit_length() - 1) << 6)
+        if target & enemies:
+            code |= moves.CAPTURE << 12
+        codes.append(code)
+        targets ^= target
+
+def add_pawn_codes(codes, targets, offset, flags, promotion_rank):
+    """This method adds encoded Pawn moves for every square in the bitboard targets,
+    where each Pawn came from offset squares behind its target. Moves onto the
+    promotion rank are added once for each piece the Pawn could promote to."""
+    while targets:
+        target = targets & -targets
+        to_index = target.bit_length() - 1
+        code = (to_index - offset) | (to_index << 6)
+        if target & promotion_rank:
+            for promotion in range(4):
+                codes.append(code | ((flags | moves.PROMOTION | promotion) << 12))
+        else:
+            codes.append(code | (flags << 12))
+        targets ^= target
+
+def all_possible_codes(game_state, colour):
+    """This method works out all possible moves of a given colour straight from the
+    bitboards, whether they're legal or not, and returns them as encoded moves (see
+    moves.encode_move). Unlike all_possible_moves, no Move or Piece objects are
+    touched, and Pawn moves to the back rank come as their four promotions."""
+    bitboards = game_state.bitboards
+    own_pieces = bitboards.pieces[colour]
+    other_colour = "black" if colour == "white" else "white"
+    enemies = bitboards.occupied[other_colour]
+    occupied = bitboards.all
+    empty = bitboard.FULL_BOARD ^ occupied
+    not_own = bitboard.FULL_BOARD ^ bitboards.occupied[colour]
+    codes = []
+
+    for from_index in bitboard.indices(own_pieces["Knight"]):
+        add_codes(codes, from_index, bitboard.KNIGHT_ATTACKS[from_index] & not_own, enemies)
+    for from_index in bitboard.indices(own_pieces["Bishop"]):
+        add_codes(codes, from_index, bitboard.bishop_lookup(from_index, occupied) & not_own, enemies)
+    for from_index in bitboard.indices(own_pieces["Rook"]):
+        add_codes(codes, from_index, bitboard.rook_lookup(from_index, occupied) & not_own, enemies)
+    for from_index in bitboard.indices(own_pieces["Queen"]):
+        add_codes(codes, from_index, bitboard.queen_lookup(from_index, occupied) & not_own, enemies)
+    for from_index in bitboard.indices(own_pieces["King"]):
+        add_codes(codes, from_index, bitboard.KING_ATTACKS[from_index] & not_own, enemies)
+        # Castles are generated as King moves two squares towards the rook
+        castles = can_castle(game_state)[colour]
+        if castles["o-o"]:
+            codes.append(moves.encode_move(from_index, from_index + 2, moves.KING_CASTLE))
+        if castles["o-o-o"]:
+            codes.append(moves.encode_move(from_index, from_index - 2, moves.QUEEN_CASTLE))
+
+    # Pawns all move the same way, so each kind of Pawn move is one shift of
+    # the whole Pawn bitboard. A Pawn still on its starting rank has never moved,
+    # so single steps landing on the rank beyond it can step again.
+    pawns = own_pieces["Pawn"]
+    if colour == "white":
+        single_steps = (pawns << 8) & empty
+        double_steps = ((single_steps & (bitboard.RANK_1 << 16)) << 8) & empty
+        add_pawn_codes(codes, single_steps, 8, moves.QUIET, bitboard.RANK_8)
+        add_pawn_codes(codes, double_steps, 16, moves.DOUBLE_PAWN_PUSH, 0)
+        add_pawn_codes(codes, (pawns << 7) & bitboard.NOT_FILE_H & enemies, 7, moves.CAPTURE, bitboard.RANK_8)
+        add_pawn_codes(codes, (pawns << 9) & bitboard.NOT_FILE_A & enemies, 9, moves.CAPTURE, bitboard.RANK_8)
+    else:
+        single_steps = (pawns >> 8) & empty
+        double_steps = ((single_steps & (bitboard.RANK_1 << 40)) >> 8) & empty
+        add_pawn_codes(codes, single_steps, -8, moves.QUIET, bitboard.RANK_1)
+        add_pawn_codes(codes, double_steps, -16, moves.DOUBLE_PAWN_PUSH, 0)
+        add_pawn_codes(codes, (pawns >> 9) & bitboard.NOT_FILE_H & enemies, -9, moves.CAPTURE, bitboard.RANK_1)
+        add_pawn_codes(codes, (pawns >> 7) & bitboard.NOT_FILE_A & enemies, -7, moves.CAPTURE, bitboard.RANK_1)
+
+    en_passant = game_state.en_passant
+    if en_passant:
+        to_index = bitboard.square_index(en_passant)
+        # Pawns that could capture onto the square are the ones an enemy Pawn
+        # standing there would attack
+        for from_index in bitboard.indices(bitboard.PAWN_ATTACKS[other_colour][to_index] & pawns):
+            codes.append(moves.encode_move(from_index, to_index, moves.EN_PASSANT))
+
+    return codes
+
+def all_legal_codes(game_state, colour):
+    """This method returns all legal moves of a given colour as encoded moves. It
+    is all_legal_moves for the list from all_possible_codes."""
+    possible_codes = all_possible_codes(game_state, colour)
+    bitboards = game_state.bitboards
+    king_bitboard = bitboards.pieces[colour]["King"]
+    # No kings failsafe- will never happen in normal games
+    if not king_bitboard:
+        return possible_codes
+    other_colour = "black" if colour == "white" else "white"
+
+    checkers, check_mask, pins = pins_and_checks(game_state, colour)
+    danger = attacked_squares(game_state, other_colour, bitboards.all ^ king_bitboard)
+
+    legal_codes = []
+    for code in possible_codes:
+        origin = 1 << (code & 0x3F)
+        target = 1 << ((code >> 6) & 0x3F)
+        flags = code >> 12
+        if origin == king_bitboard:
+            if flags == moves.KING_CASTLE or flags == moves.QUEEN_CASTLE:
+                # The rook lands on the square the King passes through
+                path = target | (target >> 1 if flags == moves.KING_CASTLE else target << 1)
+                if not checkers and not danger & path:
+                    legal_codes.append(code)
+            elif not danger & target:
+                legal_codes.append(code)
+        elif flags == moves.EN_PASSANT:
+            if en_passant_safe(game_state, origin, target, colour):
+                legal_codes.append(code)
+        elif target & check_mask and target & pins.get(origin, bitboard.FULL_BOARD):
+            legal_codes.append(code)
+    return legal_codes
+
+def attacked_squares(game_state, colour, occupied=None):
+    """This method returns a bitboard of every square the pieces of a given colour
+    attack. Sliding pieces are blocked by the squares set in occupied, which is the
+    whole board by default."""
+    bitboards = game_state.bitboards
+    if occupied is None:
+        occupied = bitboards.all
+    own_pieces = bitboards.pieces[colour]
+    # Pawns all attack the same way, so one shift-and-mask covers all of them
+    attacks = bitboard.pawn_attacks(own_pieces["Pawn"], colour)
+    for index in bitboard.indices(own_pieces["Knight"]):
+        attacks |= bitboard.KNIGHT_ATTACKS[index]
+    for index in bitboard.indices(own_pieces["King"]):
+        attacks |= bitboard.KING_ATTACKS[index]
+    for index in bitboard.indices(own_pieces["Rook"] | own_pieces["Queen"]):
+        attacks |= bitboard.rook_lookup(index, occupied)
+    for index in bitboard.indices(own_pieces["Bishop"] | own_pieces["Queen"]):
+        attacks |= bitboard.bishop_lookup(index, occupied)
+    return attacks
+
+def pins_and_checks(game_state, colour):
+    """This method looks outwards from the King of a given colour and returns a
+    tuple (checkers, check_mask, pins), where:
+    - checkers is a bitboard of the enemy pieces giving check
+    - check_mask is a bitboard of the squares a move other than a King move has to
+      land on to deal with the check: the checking piece and the squares between it
+      and the King. It's the whole board when not in check, and empty in double
+      check, where only the King can move.
+    - pins is a dictionary from the bitboard of each pinned piece to the squares it
+      can still move to without uncovering the King."""
+    bitboards = game_state.bitboards
+    king_index = bitboards.pieces[colour]["King"].bit_length() - 1
+    other_colour = "black" if colour == "white" else "white"
+    enemy_pieces = bitboards.pieces[other_colour]
+    own = bitboards.occupied[colour]
+    # Only enemy pieces block the rays, so each ray stops on the first enemy piece
+    # and passes over any friendly piece that might be pinned
+    enemies = bitboards.occupied[other_colour]
+
+    checkers = ((bitboard.KNIGHT_ATTACKS[king_index] & enemy_pieces["Knight"])
+                | (bitboard.PAWN_ATTACKS[colour][king_index] & enemy_pieces["Pawn"]))
+    check_mask = checkers
+    pins = {}
+    for directions, sliders in ((("north", "south", "east", "west"),
+                                 enemy_pieces["Rook"] | enemy_pieces["Queen"]),
+                                (("north_east", "north_west", "south_east", "south_west"),
+                                 enemy_pieces["Bishop"] | enemy_pieces["Queen"])):
+        if not sliders:
+            continue
+        for direction in directions:
+            ray = bitboard.ray_lookup(direction, king_index, enemies)
+            if not ray & sliders:
+                # Ray ends on the board edge or a piece that can't move this way
+                continue
+            blockers = ray & own
+            if not blockers:
+                # Nothing in the way - the slider is giving check
+                checkers |= ray & sliders
+                check_mask |= ray
+            elif blockers & (blockers - 1) == 0:
+                # Exactly one friendly piece in the way - it's pinned, and can
+                # only move along the ray or capture the slider
+                pins[blockers] = ray
+
+    if not checkers:
+        check_mask = bitboard.FULL_BOARD
+    elif checkers & (checkers - 1):
+        # Double check - no single move blocks or captures both checkers
+        check_mask = 0
+    return checkers, check_mask, pins
+
+def en_passant_safe(game_state, origin, target, colour):
+    """This method checks an en passant capture from the square in bitboard origin
+    to the square in bitboard target leaves the King of a given colour out of
+    check. The moving pawn and the captured pawn both leave the board before the
+    moving pawn lands, so the King is looked at with that occupancy."""
+    bitboards = game_state.bitboards
+    king_index = bitboards.pieces[colour]["King"].bit_length() - 1
+    enemy_pieces = bitboards.pieces["black" if colour == "white" else "white"]
+    # The captured pawn is one square behind the target, from the mover's side
+    captured = target >> 8 if colour == "white" else target << 8
+    occupied = (bitboards.all ^ origin ^ captured) | target
+    return not ((bitboard.rook_lookup(king_index, occupied)
+                 & (enemy_pieces["Rook"] | enemy_pieces["Queen"]))
+                | (bitboard.bishop_lookup(king_index, occupied)
+                   & (enemy_pieces["Bishop"] | enemy_pieces["Queen"]))
+                | (bitboard.KNIGHT_ATTACKS[king_index] & enemy_pieces["Knight"])
+                | (bitboard.PAWN_ATTACKS[colour][king_index] & enemy_pieces["Pawn"] & ~captured))
+
+def castling_rights(game_state):
+    """This method checks which castles white and black still have the right to
+    make, and returns a dictionary of the same form as can_castle.
+    A side keeps the right to castle with a rook for as long as its king and that
+    rook both stay unmoved on their home squares (conditions 1 and 2 of
+    can_castle), whatever is between them or attacking them right now."""
+
+    castling_rights = {"white": {"o-o": False, "o-o-o": False},
+                       "black": {"o-o": False, "o-o-o": False}}
+
+    for colour in ("white", "black"):
+        back_rank = 0 if colour == "white" else 7
+        king = game_state.pieces_by_position.get((4, back_rank))
+        if not king or king.name != "King" or king.colour != colour or king.moved:
+            # Condition 1 - the king has moved
+            continue
+        for castle, rook_file in (("o-o", 7), ("o-o-o", 0)):
+            rook = game_state.pieces_by_position.get((rook_file, back_rank))
+            # Condition 2 - the rook hasn't moved (or been captured)
+            castling_rights[colour][castle] = bool(rook and rook.name == "Rook"
+                                                   and rook.colour == colour and not rook.moved)
+
+    return castling_rights
 
 def can_castle(game_state):
     """This method checks whether white or black can castle, and returns
@@ -152,78 +459,51 @@ def can_castle(game_state):
     4. The king isn't in check
     5. The two spaces the king will move through during the castle are not threatened.
     
-    Conditions 4 and 5 is checked by the valid_move function. All other conditions are
-    checked here."""
+    Conditions 1 and 2 are checked by the castling_rights function, and conditions
+    4 and 5 by all_legal_moves. Condition 3 is checked here."""
 
-    can_castle = {"white": {"o-o": False, "o-o-o": False}, 
-                  "black": {"o-o": False, "o-o-o": False}}
+    can_castle = castling_rights(game_state)
 
-    colours = ("white", "black")
-    for colour in colours:
-        ### Find king
-        king_list = [piece for piece in game_state.piece_list if str(piece) == "K" 
-                    and piece.colour == colour and piece.moved == False]
-
-        if len(king_list) == 0:
-            # Condition 1 - the king has moved
-            can_castle[colour]["o-o"] = False
-            can_castle[colour]["o-o-o"] = False
-            continue
-        
-        ### Find rooks
-        rook_list = [piece for piece in game_state.piece_list if str(piece) == "R"
-                    and piece.colour == colour and piece.moved == False]
+    for colour in ("white", "black"):
         back_rank = 0 if colour == "white" else 7
-        queenside_rook = game_state.pieces_by_position.get((0, back_rank))
-        kingside_rook = game_state.pieces_by_position.get((7, back_rank))
 
-        if len(rook_list) == 0:
-            # Condition 2 - rooks have moved (or have been captured)
-            can_castle[colour]["o-o"] = False
+        # Condition 3 - are there pieces in between the king and the rook?
+        if game_state.bitboards.all & (0b00001110 << (8 * back_rank)):
             can_castle[colour]["o-o-o"] = False
-            continue
-
-        # Check queenside castling:
-        if queenside_rook:
-            # Condition 3 - are there pieces in between the king and the rook?
-            condition3 = not (game_state.pieces_by_position.get((1, back_rank))
-                or game_state.pieces_by_position.get((2, back_rank))
-                or game_state.pieces_by_position.get((3, back_rank)))
-            if condition3:
-                can_castle[colour]["o-o-o"] = True
-            else:
-                can_castle[colour]["o-o-o"] = False
-        else:
-            # No suitable queenside rook
-            can_castle[colour]["o-o-o"] = False
-        
-        # Check kingside castling:
-        if kingside_rook:
-            # Condition 3 - are there pieces in between the king and the rook?
-            condition3 = not (game_state.pieces_by_position.get((5, back_rank))
-                or game_state.pieces_by_position.get((6, back_rank)))
-            if condition3:
-                can_castle[colour]["o-o"] = True
-            else:
-                can_castle[colour]["o-o"] = False
-        else:
-            # No suitable kingside rook
+        if game_state.bitboards.all & (0b01100000 << (8 * back_rank)):
             can_castle[colour]["o-o"] = False
     
     return can_castle
 
+def is_square_attacked(game_state, square, by_colour, occupied=None):
+    """This method checks whether any piece of a given colour attacks a square
+    (i,j). Rather than generating the other side's moves, it looks outwards from
+    the square: a knight a knight's jump away, a pawn or King a step away, or a
+    slider at the end of a clear line all attack it. Sliding pieces are blocked by
+    the squares set in occupied, which is the whole board by default."""
+    if by_colour == "white":
+        other_colour = "black"
+    elif by_colour == "black":
+        other_colour = "white"
+    else:
+        raise ValueError("Given colour must be white or black.")
+
+    bitboards = game_state.bitboards
+    if occupied is None:
+        occupied = bitboards.all
+    attackers = bitboards.pieces[by_colour]
+    index = bitboard.square_index(square)
+    # Pawns of by_colour attacking the square stand where a pawn of the other
+    # colour on the square would attack
+    return bool((bitboard.KNIGHT_ATTACKS[index] & attackers["Knight"])
+                or (bitboard.PAWN_ATTACKS[other_colour][index] & attackers["Pawn"])
+                or (bitboard.KING_ATTACKS[index] & attackers["King"])
+                or (bitboard.rook_lookup(index, occupied) & (attackers["Rook"] | attackers["Queen"]))
+                or (bitboard.bishop_lookup(index, occupied) & (attackers["Bishop"] | attackers["Queen"])))
+
 def in_check(game_state, colour):
     """This method checks whether a King of a given colour is in check."""
     
-    # Find king
-    king_list = [piece for piece in game_state.piece_list if str(piece) == "K" and piece.colour == colour]
-    # No kings failsafe- will never happen in normal games
-    if len(king_list) == 0:
-        # can't be in check if there's no king...
-        return False
-    else:
-        king = king_list[0] 
-    
     # Get the opposing side's colour
     if colour == "white":
         other_colour = "black"
@@ -232,21 +512,22 @@ def in_check(game_state, colour):
     else:
         raise ValueError("Given colour must be white or black.")
 
-    # Check all the possible enemy moves (disregarding whether they'd be in check) 
-    # and see if they can capture the king
-    for enemy_move in game_state.possible_moves[other_colour]:
-        if enemy_move.new_position == king.position:
-            return True
-    return False
+    # Find king
+    king_bitboard = game_state.bitboards.pieces[colour]["King"]
+    # No kings failsafe- will never happen in normal games
+    if not king_bitboard:
+        # can't be in check if there's no king...
+        return False
+
+    return is_square_attacked(game_state, bitboard.POSITIONS[king_bitboard.bit_length() - 1], other_colour)
 
 def valid_move(game_state, move, colour):
     """This method a given Move produces a valid GameState when applied
     to the given GameState.
     Regarding castling: conditions 4 and 5, as explained in the function 
-    can_castle, is dealt with here."""
-    
-    # Make temporary copy of GameState object for testing
-    test_state = copy.deepcopy(game_state)
+    can_castle, is dealt with here.
+    The Move is made on the GameState itself and then unmade again, so the
+    GameState is left as it was found."""
             
     # Get the opposing side's colour
     if colour == "white":
@@ -256,95 +537,74 @@ def valid_move(game_state, move, colour):
     else:
         raise ValueError("Given colour must be white or black.")
 
-    # Apply move to GameState
-    test_state = move.apply_move(test_state)
+    # Apply move to GameState, and see if the enemy could then capture the king
+    undo = move.make(game_state)
+    king_bitboard = game_state.bitboards.pieces[colour]["King"]
+    king_position = bitboard.POSITIONS[king_bitboard.bit_length() - 1] if king_bitboard else None
+    king_attacked = king_position is not None and is_square_attacked(game_state, king_position, other_colour)
 
-    # Update relevant GameState metadata
-    test_state.pieces_by_position = dict(zip([piece.position 
-                            for piece in test_state.piece_list], test_state.piece_list))
-    test_state.possible_moves = {"white": all_possible_moves(test_state, "white"),
-                                 "black": all_possible_moves(test_state, "black")}
-    test_state.can_castle = can_castle(test_state)
+    # Take the move back before deciding anything
+    move.unmake(game_state, undo)
 
-    # Find possible squares the enemy can move to
-    enemy_squares = [move.new_position for move in test_state.possible_moves[other_colour]]
-    
-    # Find king
-    king_list = [piece for piece in test_state.piece_list if str(piece) == "K" and piece.colour == colour]
     # No kings failsafe- will never happen in normal games
-    if len(king_list) == 0:
+    if king_position is None:
         # no friendly king - no need to worry about checking for check.
         # Given move can't be a Castle either, so no need to worry about that
         return True
-    else:
-        king = king_list[0]
     
-    # Deal with castling (conditions 1 and 5) here
+    # Deal with castling (conditions 4 and 5) here
     if move.move_type == "Castle":
         back_rank = 0 if colour == "white" else 7
         if in_check(game_state, colour):
-            # condition 1 - can't castle if king is in check
+            # condition 4 - can't castle if king is in check
             return False
         if move.old_rook_position[0] == 0:
             # Queenside castle
             king_movement_squares = [(2, back_rank), (3, back_rank)]
-            for square in king_movement_squares:
-                if square in enemy_squares:
-                    # Condition 5 - castling now would result in the king
-                    # passing through danger
-                    return False
-        if move.old_rook_position[0] == 7:
+        else:
             # Kingside castle
             king_movement_squares = [(5, back_rank), (6, back_rank)]
-            for square in king_movement_squares:
-                if square in enemy_squares:
-                    # Condition 5 - castling now would result in the king
-                    # passing through danger
-                    return False
-
-    # Check all the possible enemy squares and see if they can capture the king
-    for square in enemy_squares:
-        if square == king.position:
-            # Allied king will be in check after this move, so move is invalid
-            del test_state
-            return False
-    
-    del test_state
-    return True
+        for square in king_movement_squares:
+            if is_square_attacked(game_state, square, other_colour):
+                # Condition 5 - castling now would result in the king
+                # passing through danger
+                return False
+
+    # Allied king would be in check after this move, so move is invalid
+    return not king_attacked
 
 def in_checkmate(game_state, colour):
     """This method checks whether a King of a given colour is in checkmate."""
-    if len(game_state.legal_moves[colour]) == 0:
-        # King must be in check too, but in_checkmate will only be called if in_check is True
+    if in_check(game_state, colour) and len(game_state.legal_moves[colour]) == 0:
+        # King is in check and nothing gets it out
         return True
     
     # King has at least one legal move, not in checkmate
     return False
 
+def insufficient_material(game_state):
+    """Says whether neither side has enough left to mate: two bare Kings, or a
+    King and one Bishop or Knight against a bare King."""
+    boards = game_state.bitboards
+    count = bin(boards.all).count("1")
+    if count == 2:
+        return True
+    if count != 3:
+        return False
+    minors = 0
+    for colour in ("white", "black"):
+        minors |= boards.pieces[colour]["Bishop"] | boards.pieces[colour]["Knight"]
+    return minors != 0
+
 def in_stalemate(game_state, colour):
     """This method checks whether a given colour is in stalemate, i.e. they have no
-    legal moves to play."""
-    piece_names = [piece.name for piece in game_state.piece_list]
-
+    legal moves to play, or the game is drawn by insufficient material."""
     if len(game_state.legal_moves[colour]) == 0:
         # the pieces of this colour have no legal moves
-        print(f"{colour.capitalize()} has no legal moves- stalemate!")
         return True
-    elif len(piece_names) == 2 and piece_names.count("King") == 2:
-        # only kings left on the board
-        print("Insufficient material left on board- stalemate!")
-        return True
-    elif len(piece_names) == 3 and piece_names.count("King") == 2:
-        if "Bishop" or "Knight" in piece_names:
-            # there's two kings and a bishop/knight on the board; it's a draw by insufficient material
-            print("Insufficient material left on board- stalemate!")
-            return True
-        else:
-            # get rid of this later
-            return False
-    else:
-        # check move history at some point?
-        return False
+    # King and Queen, Rook or Pawn against King is still a game, so only
+    # minor pieces count as insufficient
+    return insufficient_material(game_state)
 
 if __name__ == "__main__":
     kingside_castle_test = [pieces.King((4,0), "white"), pieces.King((4,7), "black"),
@@ -0,0 +1,333 @@
+#!/usr/bin/python3
+
+import argparse
+import os
+import struct
+import sys
+import time
+import moves
+import state
+import bitboard
+import mapped_file
+
+# Endgame tablebases: the exact result of every position of a few small endings
+# (King and Queen, King and Rook, and King and Pawn against a lone King), with
+# how many plies it takes to mate, worked out backwards from the mates by
+# retrograde analysis.
+# Tables are made with the stronger side as white. A position is found at
+#   turn * 64**3 + white King * 64**2 + black King * 64 + other piece
+# by bit index, turn being 0 for white to move and 1 for black, and is one byte:
+# 0 for a draw (or a position that can't happen), otherwise the number of plies
+# to mate plus one. An even number of plies means the side to move gets mated,
+# an odd number that it mates. Positions with the stronger side as black are
+# looked up with the board turned round.
+# A tablebase file is an 8 byte header, a directory of 4 byte table names
+# and 4 byte offsets, then the tables, each TABLE_SIZE bytes.
+# The fifty-move rule is left out, as in most tablebases.
+
+HEADER = struct.Struct("<4sHH")
+DIRECTORY_ENTRY = struct.Struct("<4sI")
+MAGIC = b"PCTB"
+VERSION = 1
+TABLE_SIZE = 2 * 64 ** 3
+
+# Endings by name, with the stronger side's piece. KPK needs the tables of the
+# pieces its pawn can promote to, so it comes after them.
+ENDINGS = {"KQK": "Queen", "KRK": "Rook", "KPK": "Pawn"}
+# Promoting to a Bishop or Knight only draws, so those aren't tried
+PROMOTIONS = ("KQK", "KRK")
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tablebases.bin")
+
+WHITE_TO_MOVE = 0
+BLACK_TO_MOVE = 1
+
+# Results, for the side to move
+WIN = "win"
+DRAW = "draw"
+LOSS = "loss"
+
+
+def table_index(turn, white_king, black_king, piece):
+    """Gives where a position is in a table."""
+    return (turn << 18) | (white_king << 12) | (black_king << 6) | piece
+
+
+def attacks(name, index, occupied):
+    """Gives the squares the stronger side's piece attacks from a bit index."""
+    if name == "Queen":
+        return bitboard.queen_lookup(index, occupied)
+    if name == "Rook":
+        return bitboard.rook_lookup(index, occupied)
+    return bitboard.PAWN_ATTACKS["white"][index]
+
+
+def legal_position(name, turn, white_king, black_king, piece):
+    """Says whether a position could come up in a game: three different
+    squares, Kings not touching, no pawn on the first or last rank, and the
+    side which just moved not left in check."""
+    if white_king == black_king or piece == white_king or piece == black_king:
+        return False
+    if bitboard.KING_ATTACKS[white_king] >> black_king & 1:
+        return False
+    if name == "Pawn" and not 8 <= piece < 56:
+        return False
+    if turn == WHITE_TO_MOVE:
+        occupied = (1 << white_king) | (1 << black_king)
+        return not attacks(name, piece, occupied) >> black_king & 1
+    # The lone King can never give check
+    return True
+
+
+def generate(name, tables):
+    """Works out the table for the ending of the given name, by retrograde
+    analysis: starting from the mates, every position one move before a known
+    one is settled in turn, so positions are found in order of how far they
+    are from mate. tables holds the finished tables of the endings a pawn can
+    promote into. Returns the table as a bytearray."""
+    piece_name = ENDINGS[name]
+    king_attacks = bitboard.KING_ATTACKS
+    table = bytearray(TABLE_SIZE)
+    # Black to move: how many of the black King's moves are yet to be shown
+    # lost, or -1 once the position is settled. It's lost when none are left.
+    moves_left = [-1] * (TABLE_SIZE // 2)
+    # Positions found to be this many plies from mate, to look back from
+    found = [[]]
+
+    for white_king in range(64):
+        for black_king in range(64):
+            for piece in range(64):
+                if not legal_position(piece_name, BLACK_TO_MOVE, white_king, black_king, piece):
+                    continue
+                index = table_index(BLACK_TO_MOVE, white_king, black_king, piece)
+                # The black King can't go next to the white one, or anywhere the
+                # piece attacks once the King is out of its way
+                guarded = (king_attacks[white_king] | (1 << white_king)
+                           | attacks(piece_name, piece, 1 << white_king))
+                targets = king_attacks[black_king] & ~guarded
+                if targets >> piece & 1:
+                    # It can take the piece, which draws
+                    continue
+                if targets:
+                    moves_left[index - (TABLE_SIZE // 2)] = bin(targets).count("1")
+                elif attacks(piece_name, piece, 1 << white_king) >> black_king & 1:
+                    table[index] = 1
+                    found[0].append(index)
+                # Otherwise stalemate
+
+    if piece_name == "Pawn":
+        # A pawn on the seventh rank can promote into a position already known
+        for white_king in range(64):
+            for black_king in range(64):
+                for piece in range(48, 56):
+                    if (not legal_position(piece_name, WHITE_TO_MOVE, white_king, black_king, piece)
+                            or piece + 8 in (white_king, black_king)):
+                        continue
+                    best = None
+                    for promotion in PROMOTIONS:
+                        value = tables[promotion][table_index(BLACK_TO_MOVE, white_king, black_king, piece + 8)]
+                        if value and value % 2 and (best is None or value < best):
+                            best = value
+                    if best is not None:
+                        index = table_index(WHITE_TO_MOVE, white_king, black_king, piece)
+                        table[index] = best + 1
+                        add_found(found, best, index)
+
+    plies = 0
+    while plies < len(found):
+        for index in found[plies]:
+            if table[index] != plies + 1:
+                # Settled nearer to mate since
+                continue
+            turn, white_king, black_king, piece = index >> 18, (index >> 12) & 63, (index >> 6) & 63, index & 63
+            occupied = (1 << white_king) | (1 << black_king) | (1 << piece)
+            if turn == BLACK_TO_MOVE:
+                # Black is lost here, so white wins one ply earlier from every
+                # position that can move into it
+                for earlier in white_unmoves(piece_name, white_king, black_king, piece, occupied):
+                    value = table[earlier]
+                    if value == 0 or value > plies + 2:
+                        table[earlier] = plies + 2
+                        add_found(found, plies + 1, earlier)
+            else:
+                # White wins here, so one more of black's moves is lost from
+                # every position that can move into it
+                for black_from in bitboard.indices(king_attacks[black_king] & ~occupied
+                                                   & ~king_attacks[white_king]):
+                    earlier = table_index(BLACK_TO_MOVE, white_king, black_from, piece)
+                    left = moves_left[earlier - (TABLE_SIZE // 2)]
+                    if left > 0:
+                        left -= 1
+                        moves_left[earlier - (TABLE_SIZE // 2)] = left
+                        if left == 0:
+                            # That was its last move, and the one furthest from mate
+                            moves_left[earlier - (TABLE_SIZE // 2)] = -1
+                            table[earlier] = plies + 2
+                            add_found(found, plies + 1, earlier)
+        plies += 1
+    return table
+
+
+def add_found(found, plies, index):
+    """Adds a position to the ones found a number of plies from mate."""
+    while len(found) <= plies:
+        found.append([])
+    found[plies].append(index)
+
+
+def white_unmoves(piece_name, white_king, black_king, piece, occupied):
+    """Gives the white to move positions which can move into a black to move
+    one, by taking back each of white's moves."""
+    king_attacks = bitboard.KING_ATTACKS
+    for king_from in bitboard.indices(king_attacks[white_king] & ~occupied & ~king_attacks[black_king]):
+        if legal_position(piece_name, WHITE_TO_MOVE, king_from, black_king, piece):
+            yield table_index(WHITE_TO_MOVE, king_from, black_king, piece)
+
+    if piece_name == "Pawn":
+        piece_froms = []
+        if piece >= 16 and not occupied >> (piece - 8) & 1:
+            piece_froms.append(piece - 8)
+            if piece >> 3 == 3 and not occupied >> (piece - 16) & 1:
+                piece_froms.append(piece - 16)
+    else:
+        # Sliding moves go both ways
+        piece_froms = bitboard.indices(attacks(piece_name, piece, occupied) & ~occupied)
+    for piece_from in piece_froms:
+        if legal_position(piece_name, WHITE_TO_MOVE, white_king, black_king, piece_from):
+            yield table_index(WHITE_TO_MOVE, white_king, black_king, piece_from)
+
+
+def write_tablebases(path, names=tuple(ENDINGS), out=sys.stdout):
+    """Generates the tables of the named endings (and any they need) and writes
+    them to a new tablebase file. Returns the tables by name."""
+    tables = {}
+    for name in ENDINGS:
+        if name not in names and not (name in PROMOTIONS and "KPK" in names):
+            continue
+        start = time.perf_counter()
+        tables[name] = generate(name, tables)
+        wins = sum(1 for value in tables[name] if value % 2 == 0 and value)
+        longest = max(tables[name]) - 1
+        print("{}: {} positions won, longest mate {} plies, in {:.1f}s".format(
+            name, wins, longest, time.perf_counter() - start), file=out)
+
+    written = [name for name in ENDINGS if name in names]
+    # Readers never see a half written file
+    with mapped_file.replacing(path) as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(written)))
+        offset = HEADER.size + len(written) * DIRECTORY_ENTRY.size
+        for name in written:
+            f.write(DIRECTORY_ENTRY.pack(name.encode(), offset))
+            offset += TABLE_SIZE
+        for name in written:
+            f.write(tables[name])
+    return tables
+
+
+class Tablebases(mapped_file.MappedFile):
+    """A Tablebases object looks positions up in a tablebase file through a
+    read-only memory map, so a probe reads one byte and nothing is loaded up
+    front."""
+    kind = "tablebase file"
+    min_size = HEADER.size
+
+    def __init__(self, path=DEFAULT_PATH):
+        super().__init__(path)
+
+    def read_header(self, size):
+        magic, version, count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a version {} tablebase file: {}".format(VERSION, self.path))
+        # Offset of each table, by the stronger side's piece
+        self.offsets = {}
+        for number in range(count):
+            name, offset = DIRECTORY_ENTRY.unpack_from(self.map, HEADER.size + number * DIRECTORY_ENTRY.size)
+            name = name.rstrip(b"\0").decode()
+            if name not in ENDINGS or offset + TABLE_SIZE > size:
+                raise ValueError("Corrupt tablebase file: {}".format(self.path))
+            self.offsets[ENDINGS[name]] = offset
+
+    def probe(self, game_state):
+        """Looks a GameState up. Gives (result, plies) - WIN, DRAW or LOSS for
+        the side to move and how many plies it is from mate (0 for a draw) - or
+        None if the position isn't in the tables. Two Kings, or two Kings and a
+        Bishop or Knight, are always a draw."""
+        boards = game_state.bitboards
+        occupied = boards.all
+        count = bin(occupied).count("1")
+        if count > 3:
+            return None
+        if count == 2:
+            return DRAW, 0
+
+        colour, name, board = next((colour, name, board) for colour in ("white", "black")
+                                   for name, board in boards.pieces[colour].items() if board and name != "King")
+        if name in ("Bishop", "Knight"):
+            return DRAW, 0
+        offset = self.offsets.get(name)
+        if offset is None:
+            return None
+        if name == "Rook" and any(state.castling_rights(game_state)[colour].values()):
+            return None
+
+        strong_king = boards.pieces[colour]["King"].bit_length() - 1
+        weak_king = occupied ^ boards.pieces[colour]["King"] ^ board
+        weak_king = weak_king.bit_length() - 1
+        piece = board.bit_length() - 1
+        if colour == "black":
+            # Turn the board round, so the stronger side is white
+            strong_king, weak_king, piece = strong_king ^ 56, weak_king ^ 56, piece ^ 56
+        turn = WHITE_TO_MOVE if game_state.whose_turn == colour else BLACK_TO_MOVE
+        value = self.map[offset + table_index(turn, strong_king, weak_king, piece)]
+        if value == 0:
+            return DRAW, 0
+        plies = value - 1
+        return (WIN if plies % 2 else LOSS), plies
+
+    def best_move(self, game_state):
+        """Picks the move the tables say is best in a GameState: the quickest
+        mate when winning, one that keeps the draw when drawing, and the longest
+        way to be mated when losing. Gives (encoded move, result, plies) with
+        the result as probe gives it, or None if the position isn't in the
+        tables or has no legal moves."""
+        if self.probe(game_state) is None:
+            return None
+        best = None
+        best_order = None
+        for code in state.all_legal_codes(game_state, game_state.whose_turn):
+            undo = moves.make_move(game_state, code)
+            try:
+                reply = self.probe(game_state)
+            finally:
+                moves.unmake_move(game_state, code, undo)
+            if reply is None:
+                # Promotes into an ending that wasn't generated
+                continue
+            result, plies = reply
+            # Best for the mover is the opponent lost soonest, then drawn,
+            # then won as late as possible
+            if result == LOSS:
+                order = (2, -plies)
+            elif result == DRAW:
+                order = (1, 0)
+            else:
+                order = (0, plies)
+            if best_order is None or order > best_order:
+                best_order = order
+                best = code, {LOSS: WIN, DRAW: DRAW, WIN: LOSS}[result], plies + 1 if result != DRAW else 0
+        return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate endgame tablebases by retrograde analysis.")
+    parser.add_argument("path", nargs="?", default=DEFAULT_PATH,
+                        help="file to write (default tablebases.bin next to this file, where the AI looks)")
+    parser.add_argument("-e", "--ending", action="append", choices=list(ENDINGS),
+                        help="ending to generate, can be given more than once (default all)")
+    args = parser.parse_args(argv)
+
+    write_tablebases(args.path, args.ending or tuple(ENDINGS))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
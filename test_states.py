@@ -5,15 +5,13 @@ import moves
 def state_maker(piece_list):
     output_state = state.GameState([])
     output_state.piece_list = piece_list
-    output_state.pieces_by_position = dict(zip([piece.position 
-                                for piece in output_state.piece_list], 
-                                output_state.piece_list))
     output_state.captured_pieces = []
     output_state.whose_turn = "white"
-    output_state.can_castle = state.can_castle(output_state)
     output_state.move_history = []
-
-    return output_state   
+    output_state.en_passant = None
+    # update_state works out everything that follows from the pieces (lookups,
+    # bitboards, key, score, castling), so new GameState fields get set here too
+    return state.update_state(output_state)
 
 new_game_pieces = [pieces.Rook((0,7), "black"),
                    pieces.Knight((1,7), "black"),
@@ -97,6 +95,7 @@ promotion_test = [pieces.King((4,0), "white", True), pieces.Pawn((4,6), "white",
                   pieces.King((0,7), "black", True)]
 stalemate_test = [pieces.King((0,5), "white", True), pieces.Bishop((1,5), "white", True), pieces.King((0,7), "black", True)]
 
+
 if __name__ == "__main__":
     test_state = state_maker(castle_test_black)
     print(state.can_castle(test_state))
\ No newline at end of file
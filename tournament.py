@@ -0,0 +1,230 @@
+#!/usr/bin/python3
+
+import argparse
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+import moves
+import state
+import fen
+import pgn
+import book
+import players
+import headless
+
+# Plays two AI configurations against each other many times over, on every
+# core, to see which is stronger. Games are played in pairs from the same
+# opening - a few random moves, or book moves if there's a book - with the
+# players swapping colours between the two, so neither gains from the opening
+# or from having white. Each game is a headless.HeadlessGame, so nothing is
+# drawn and nothing waits.
+# An AI configuration is written as its mode, then any settings as name=value,
+# all separated by commas: "search,nodes=20000", "search,depth=3,book=a.bin"
+# or "random".
+
+SETTINGS = {"depth": ("depth", int), "nodes": ("nodes", int), "table_size": ("table_size", int),
+            "book": ("book_path", str)}
+# Two standard errors either side, for a 95% interval
+CONFIDENCE_Z = 1.96
+
+
+def parse_player(spec):
+    """Turns an AI configuration string into keyword arguments for players.AI,
+    besides the colour."""
+    mode, *settings = spec.split(",")
+    if mode not in ("search", "random"):
+        raise ValueError("Unknown AI mode: {}".format(mode))
+    arguments = {"mode": mode}
+    for setting in settings:
+        name, equals, value = setting.partition("=")
+        if name not in SETTINGS or not equals:
+            raise ValueError("Bad AI setting: {}".format(setting))
+        argument, kind = SETTINGS[name]
+        try:
+            arguments[argument] = kind(value)
+        except ValueError:
+            raise ValueError("Bad AI setting: {}".format(setting))
+    if mode == "search" and "depth" not in arguments and "nodes" not in arguments:
+        arguments["nodes"] = 20000
+    return arguments
+
+
+def random_opening(generator, plies, opening_book=None):
+    """Gives the FEN of a position a number of plies from the start, reached by
+    book moves while the book has any, and random legal moves after that. The
+    side to move always has a move."""
+    while True:
+        game_state = fen.state_from_fen(fen.START_FEN)
+        for ply in range(plies):
+            code = opening_book.choose_move(game_state, generator) if opening_book is not None else None
+            if code is None:
+                codes = state.all_legal_codes(game_state, game_state.whose_turn)
+                if not codes:
+                    break
+                code = generator.choice(codes)
+            moves.make_move(game_state, code)
+        if state.all_legal_codes(game_state, game_state.whose_turn):
+            return fen.fen_from_state(game_state)
+
+
+def play_game(job):
+    """Plays one tournament game in a worker process. Gives the game number,
+    the first player's colour, the result, why the game ended, the moves and
+    the total seconds and number of moves each player took."""
+    number, first, second, opening_fen, max_plies = job
+    first_colour = "white" if number % 2 == 0 else "black"
+    second_colour = "black" if first_colour == "white" else "white"
+    ais = {first_colour: players.AI(first_colour, verbose=False, **first),
+           second_colour: players.AI(second_colour, verbose=False, **second)}
+    try:
+        game = headless.HeadlessGame(ais["white"], ais["black"], opening_fen, max_plies)
+        game.play()
+    finally:
+        for ai in ais.values():
+            ai.close()
+    times = tuple((sum(game.times[colour]), len(game.times[colour])) for colour in (first_colour, second_colour))
+    return number, first_colour, game.result, game.reason, game.game_state.move_history, times
+
+
+def elo_estimate(wins, draws, losses):
+    """Gives the Elo difference the score of wins, draws and losses points to,
+    and how far either side of it the true difference could be with 95%
+    confidence. Either can be infinite when one side scored everything."""
+    games = wins + draws + losses
+    score = (wins + draws / 2) / games
+    if score in (0, 1):
+        return elo_difference(score), math.inf
+    # Spread of a single game's score around the mean
+    deviation = math.sqrt((wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games)
+    margin = CONFIDENCE_Z * deviation / math.sqrt(games)
+    low = elo_difference(score - margin)
+    high = elo_difference(score + margin)
+    return elo_difference(score), (high - low) / 2
+
+
+def elo_difference(score):
+    """Gives the Elo difference at which a player is expected to score a
+    fraction of the points."""
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return 400 * math.log10(score / (1 - score))
+
+
+def run_tournament(first_spec, second_spec, games, processes=None, opening_plies=4, book_path=None,
+                   max_plies=300, seed=None, pgn_path=None, verbose=False, out=sys.stdout):
+    """Plays games between two AI configurations across a pool of worker
+    processes, one per core by default, and prints the first one's wins, draws
+    and losses against the second, the Elo difference and time per move.
+    Returns the counts as a dict of "wins", "draws" and "losses"."""
+    first = parse_player(first_spec)
+    second = parse_player(second_spec)
+    processes = processes or os.cpu_count() or 1
+    generator = random.Random(seed)
+    opening_book = book.OpeningBook(book_path) if book_path else None
+    try:
+        # Each opening is played twice, the first player having white once
+        openings = [random_opening(generator, opening_plies, opening_book) for pair in range((games + 1) // 2)]
+    finally:
+        if opening_book is not None:
+            opening_book.close()
+    jobs = [(number, first, second, openings[number // 2], max_plies) for number in range(games)]
+
+    counts = {"wins": 0, "draws": 0, "losses": 0}
+    reasons = {}
+    times = [[0, 0], [0, 0]]
+    pgn_file = open(pgn_path, "w") if pgn_path else None
+    names = [headless.player_name(arguments["mode"], arguments.get("depth"), arguments.get("nodes"))
+             for arguments in (first, second)]
+    start_time = time.perf_counter()
+    try:
+        with multiprocessing.Pool(processes) as pool:
+            # Games are reported as they finish, in whatever order that is
+            results = pool.imap_unordered(play_game, jobs)
+            for number, first_colour, result, reason, move_history, game_times in results:
+                if result == "1/2-1/2" or result == "*":
+                    outcome = "draws"
+                elif (result == "1-0") == (first_colour == "white"):
+                    outcome = "wins"
+                else:
+                    outcome = "losses"
+                counts[outcome] += 1
+                reasons[reason] = reasons.get(reason, 0) + 1
+                for player, (seconds, move_count) in enumerate(game_times):
+                    times[player][0] += seconds
+                    times[player][1] += move_count
+                if verbose:
+                    print("game {}: first player {}, {} ({}) in {} plies".format(
+                        number + 1, first_colour, result, reason, len(move_history)), file=out)
+                if pgn_file is not None:
+                    white, black = names if first_colour == "white" else names[::-1]
+                    pgn.write_game(pgn_file, move_history,
+                                   {"Event": "Tournament", "Round": number + 1, "White": white,
+                                    "Black": black, "Termination": reason},
+                                   openings[number // 2], result)
+    finally:
+        if pgn_file is not None:
+            pgn_file.close()
+    elapsed = time.perf_counter() - start_time
+
+    wins, draws, losses = counts["wins"], counts["draws"], counts["losses"]
+    elo, margin = elo_estimate(wins, draws, losses)
+    print("first: {}".format(names[0]), file=out)
+    print("second: {}".format(names[1]), file=out)
+    print("{} games in {:.1f}s with {} processes ({:.2f} games/s)".format(
+        games, elapsed, processes, games / elapsed if elapsed > 0 else float("inf")), file=out)
+    print("first scored +{} ={} -{} ({:.1f}%)".format(
+        wins, draws, losses, 100 * (wins + draws / 2) / games), file=out)
+    print("Elo difference {:+.1f} +/- {:.1f}".format(elo, margin), file=out)
+    print("time per move: first {:.3f}s, second {:.3f}s".format(
+        *(seconds / move_count if move_count else 0 for seconds, move_count in times)), file=out)
+    print("endings: " + ", ".join("{} {}".format(reason, count) for reason, count in sorted(reasons.items())),
+          file=out)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play two AI configurations against each other and "
+                                                 "estimate the Elo difference between them.")
+    parser.add_argument("first", help='AI configuration, e.g. "search,nodes=20000"')
+    parser.add_argument("second", help='AI configuration to compare against, e.g. "random"')
+    parser.add_argument("-g", "--games", type=int, default=100,
+                        help="number of games (default 100)")
+    parser.add_argument("-j", "--processes", type=int,
+                        help="number of worker processes (default one per core)")
+    parser.add_argument("-o", "--opening-plies", type=int, default=4,
+                        help="random (or book) plies to start each pair of games from (default 4)")
+    parser.add_argument("-b", "--book",
+                        help="Polyglot opening book to draw the openings from")
+    parser.add_argument("-m", "--max-plies", type=int, default=300,
+                        help="call a game drawn after this many plies (default 300)")
+    parser.add_argument("-s", "--seed", type=int,
+                        help="seed for the openings, to replay a tournament")
+    parser.add_argument("-p", "--pgn",
+                        help="file to write the games to as PGN")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="report every game as it finishes")
+    args = parser.parse_args(argv)
+    if args.games < 1:
+        parser.error("need at least one game")
+    if args.processes is not None and args.processes < 1:
+        parser.error("need at least one process")
+    if args.opening_plies < 0:
+        parser.error("opening plies can't be negative")
+    for spec in (args.first, args.second):
+        try:
+            parse_player(spec)
+        except ValueError as error:
+            parser.error(str(error))
+
+    run_tournament(args.first, args.second, args.games, args.processes, args.opening_plies, args.book,
+                   args.max_plies, args.seed, args.pgn, args.verbose)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+#!/usr/bin/python3
+
+import struct
+from multiprocessing import shared_memory
+
+# A transposition table remembers what the search found out about positions it
+# has already searched, by their zobrist key, since the same position is often
+# reached by different move orders. Each entry is 16 bytes:
+#   8 bytes  the position key XORed with the data below
+#   8 bytes  data: score + SCORE_OFFSET (bits 0-23), the search it was stored
+#            by (bits 24-31), best move (bits 32-47), depth (bits 48-55) and
+#            bound (bits 56-63)
+# Storing key ^ data rather than the key means an entry that was half written
+# by one process while another read it fails the key check, instead of giving
+# a score from one position with the move of another, so processes can share
+# a table without locking it.
+
+ENTRY = struct.Struct("<QQ")
+ENTRY_SIZE = ENTRY.size
+SCORE_OFFSET = 1 << 23
+
+# What a stored score says about the true score
+EXACT = 0
+LOWER = 1 # at least the score - the search cut off
+UPPER = 2 # at most the score - no move reached alpha
+
+DEFAULT_SIZE = 16 * 1024 * 1024
+
+# Replacement policies, for when a position's entry is taken by another one.
+# Always replacing keeps the table full of recent positions. Preferring depth
+# keeps the entry which took the most work to find, unless it's left over from
+# an earlier search.
+ALWAYS_REPLACE = "always"
+DEPTH_PREFERRED = "depth"
+
+
+class TranspositionTable:
+    """A TranspositionTable is a fixed number of entries in a buffer made when
+    the table is, indexed by position key, so looking a position up takes the
+    same time however full it is, and it never takes more than size bytes.
+    With shared=True the buffer is a multiprocessing.shared_memory block which
+    other processes can open by name, which they do when the table is pickled
+    over to them."""
+    def __init__(self, size=DEFAULT_SIZE, shared=False, name=None, policy=DEPTH_PREFERRED):
+        # size is in bytes
+        if policy not in (ALWAYS_REPLACE, DEPTH_PREFERRED):
+            raise ValueError("Unknown replacement policy: {}".format(policy))
+        self.policy = policy
+        # Number of the search storing entries, which new_search moves on
+        self.generation = 0
+        self.memory = None
+        if name is not None:
+            self.memory = shared_memory.SharedMemory(name=name)
+            self.buffer = self.memory.buf
+        elif shared:
+            self.memory = shared_memory.SharedMemory(create=True, size=size)
+            self.buffer = self.memory.buf
+        else:
+            self.buffer = bytearray(size)
+        self.length = len(self.buffer) // ENTRY_SIZE
+        if self.length == 0:
+            raise ValueError("A transposition table needs room for at least one entry.")
+
+    def probe(self, key):
+        """Gives the (best move, score, depth, bound) stored for a position key,
+        or None if there isn't an entry for it."""
+        check, data = ENTRY.unpack_from(self.buffer, (key % self.length) * ENTRY_SIZE)
+        if check ^ data != key or data == 0:
+            return None
+        return (data >> 32) & 0xFFFF, (data & 0xFFFFFF) - SCORE_OFFSET, (data >> 48) & 0xFF, data >> 56
+
+    def store(self, key, move, score, depth, bound):
+        """Stores what a search found for a position key, unless the replacement
+        policy keeps the entry already in its place."""
+        offset = (key % self.length) * ENTRY_SIZE
+        if self.policy == DEPTH_PREFERRED:
+            check, data = ENTRY.unpack_from(self.buffer, offset)
+            # Another position's entry from this search, searched deeper
+            if (data and check ^ data != key and (data >> 24) & 0xFF == self.generation
+                    and (data >> 48) & 0xFF > depth):
+                return
+        data = (score + SCORE_OFFSET) | (self.generation << 24) | (move << 32) | (depth << 48) | (bound << 56)
+        ENTRY.pack_into(self.buffer, offset, key ^ data, data)
+
+    def new_search(self):
+        """Marks the entries stored so far as old, so that with DEPTH_PREFERRED
+        they give way to the next search's."""
+        self.generation = (self.generation + 1) & 0xFF
+
+    def usage(self):
+        """Gives roughly how full the table is, in thousandths, from its first
+        thousand entries."""
+        sample = min(self.length, 1000)
+        used = sum(1 for check, data in ENTRY.iter_unpack(self.buffer[:sample * ENTRY_SIZE]) if data)
+        return used * 1000 // sample
+
+    def clear(self):
+        """Empties the table."""
+        self.buffer[:] = bytes(len(self.buffer))
+
+    def close(self):
+        """Lets go of the table's memory. The process which made a shared table
+        should unlink it as well, once everyone has closed it."""
+        self.buffer = None
+        if self.memory is not None:
+            self.memory.close()
+
+    def unlink(self):
+        """Frees a shared table's memory for good."""
+        self.memory.unlink()
+
+    def __getstate__(self):
+        # Other processes open the same shared memory by name
+        if self.memory is None:
+            raise ValueError("Only a shared transposition table can be sent to another process.")
+        return self.memory.name, self.policy
+
+    def __setstate__(self, shared_state):
+        name, policy = shared_state
+        self.__init__(name=name, policy=policy)
@@ -0,0 +1,184 @@
+#!/usr/bin/python3
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+import pgn
+import state
+
+# The archive is split into chunks of whole games by byte range, in a single
+# quick pass over its lines. Each worker process opens the file itself and
+# replays just its own chunk, so only (start, end) offsets and short per-game
+# reports travel between processes, however large the archive is.
+
+OK = "ok"
+ILLEGAL = "illegal"
+AMBIGUOUS = "ambiguous"
+BAD_RESULT = "bad result"
+# The reader itself broke on the game, which is a bug here, not in the game
+ERROR = "error"
+
+
+def mark_game_starts(lines):
+    """Yields (line, starts_game) for each line of a PGN file, given as bytes or
+    text. A game starts at a tag line that follows a line which isn't a tag."""
+    after_tags = True
+    in_comment = False
+    for line in lines:
+        if isinstance(line, str):
+            line_bytes = line.encode("utf-8", errors="replace")
+        else:
+            line_bytes = line
+        starts_game = False
+        if line_bytes.startswith(b"[") and not in_comment:
+            starts_game = not after_tags
+            after_tags = True
+        elif line_bytes.strip():
+            after_tags = False
+            # A tag-like line inside a multi-line comment doesn't start a game
+            if not in_comment or b"}" in line_bytes:
+                in_comment = line_bytes.rfind(b"{") > line_bytes.rfind(b"}")
+        yield line, starts_game
+
+
+def game_chunks(path, games_per_chunk):
+    """Yields (start, end) byte offsets splitting a PGN file into chunks of about
+    games_per_chunk games each."""
+    start = 0
+    offset = 0
+    games = 0
+    with open(path, "rb") as f:
+        for line, starts_game in mark_game_starts(f):
+            if starts_game:
+                games += 1
+                if games > games_per_chunk:
+                    yield start, offset
+                    start = offset
+                    games = 1
+            offset += len(line)
+    if offset > start:
+        yield start, offset
+
+
+def split_games(lines):
+    """Yields the lines of a PGN file one game at a time, as lists."""
+    game_lines = []
+    for line, starts_game in mark_game_starts(lines):
+        if starts_game and game_lines:
+            yield game_lines
+            game_lines = []
+        game_lines.append(line)
+    if game_lines:
+        yield game_lines
+
+
+def final_status(game):
+    """Gives OK, ILLEGAL or AMBIGUOUS for a game that has been read, or BAD_RESULT
+    if it ends in checkmate or stalemate and its result says otherwise."""
+    if isinstance(game.error, pgn.AmbiguousMoveError):
+        return AMBIGUOUS
+    if game.error is not None:
+        return ILLEGAL
+    game_state = game.game_state
+    if game_state is None or game.result is None:
+        return OK
+    if state.all_legal_codes(game_state, game_state.whose_turn):
+        return OK
+    if state.in_check(game_state, game_state.whose_turn):
+        expected = "0-1" if game_state.whose_turn == "white" else "1-0"
+    else:
+        expected = "1/2-1/2"
+    return OK if game.result == expected else BAD_RESULT
+
+
+def validate_chunk(job):
+    """Replays the games in one chunk of a PGN file. Returns a list with one
+    (tags, plies, result, status, error) report per game."""
+    path, start, end = job
+    with open(path, "rb") as f:
+        f.seek(start)
+        text = f.read(end - start).decode("utf-8", errors="replace")
+
+    reports = []
+    # Games are read one by one, so a game the reader can't cope with is
+    # reported on its own instead of ending the whole run. A ValueError is the
+    # parser turning the game down (a bad FEN tag, say), so the game is
+    # illegal; anything else is a crash in the reader, reported as an error
+    for game_lines in split_games(text.splitlines(keepends=True)):
+        try:
+            game_reports = []
+            for game in pgn.read_games(game_lines):
+                # Fall back on the Result tag if the movetext doesn't end with one
+                result = game.result or game.tags.get("Result", "*")
+                error = str(game.error) if game.error is not None else None
+                game_reports.append(({name: game.tags.get(name, "?") for name in ("Event", "White", "Black")},
+                                     len(game.moves), result, final_status(game), error))
+        except Exception as error:
+            status = ILLEGAL if isinstance(error, ValueError) else ERROR
+            tags = dict(match.groups() for match in map(pgn.TAG_PATTERN.match, game_lines) if match)
+            game_reports = [({name: tags.get(name, "?") for name in ("Event", "White", "Black")},
+                             0, tags.get("Result", "*"), status, "{}: {}".format(type(error).__name__, error))]
+        reports.extend(game_reports)
+    return reports
+
+
+def validate(path, processes=None, games_per_chunk=200, verbose=False, out=sys.stdout):
+    """Validates every game in a PGN file across a pool of worker processes, one
+    per core by default. Games with a problem are printed as they're found (all
+    games if verbose), then a summary. Returns a dict of counts by status."""
+    counts = {OK: 0, ILLEGAL: 0, AMBIGUOUS: 0, BAD_RESULT: 0, ERROR: 0}
+    plies = 0
+    game_number = 0
+    processes = processes or os.cpu_count() or 1
+    jobs = ((path, start, end) for start, end in game_chunks(path, games_per_chunk))
+
+    start_time = time.perf_counter()
+    with multiprocessing.Pool(processes) as pool:
+        # imap keeps the chunks in file order without reading them all first
+        for reports in pool.imap(validate_chunk, jobs):
+            for tags, game_plies, result, status, error in reports:
+                game_number += 1
+                counts[status] += 1
+                plies += game_plies
+                if verbose or status != OK:
+                    line = "game {} ({} - {}, {}): {} plies, {} {}".format(
+                        game_number, tags["White"], tags["Black"], tags["Event"], game_plies, result, status)
+                    if error:
+                        line += ": " + error
+                    print(line, file=out)
+    elapsed = time.perf_counter() - start_time
+
+    rate = 1 / elapsed if elapsed > 0 else float("inf")
+    print("{} games, {} plies in {:.2f}s with {} processes ({:.0f} games/s, {:.0f} plies/s)".format(
+        game_number, plies, elapsed, processes, game_number * rate, plies * rate), file=out)
+    print("{} ok, {} illegal, {} ambiguous, {} bad result, {} error".format(
+        counts[OK], counts[ILLEGAL], counts[AMBIGUOUS], counts[BAD_RESULT], counts[ERROR]), file=out)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay every game in a PGN file with this project's "
+                                                 "rules and report the ones that break them.")
+    parser.add_argument("path", help="PGN file to validate")
+    parser.add_argument("-j", "--processes", type=int,
+                        help="number of worker processes (default one per core)")
+    parser.add_argument("-c", "--chunk", type=int, default=200,
+                        help="games given to a worker at a time (default 200)")
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="report every game, not just the bad ones")
+    args = parser.parse_args(argv)
+    if args.processes is not None and args.processes < 1:
+        parser.error("need at least one process")
+    if args.chunk < 1:
+        parser.error("chunks need at least one game")
+    if not os.path.isfile(args.path):
+        parser.error("no such file: {}".format(args.path))
+
+    counts = validate(args.path, args.processes, args.chunk, args.verbose)
+    return 0 if counts[OK] == sum(counts.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+#!/usr/bin/python3
+
+import random
+import bitboard
+import state
+
+# Zobrist keys give every position a 64-bit identity. Each feature of a
+# position (a piece on a square, a castling right, an en passant file, black
+# to move) has a random key, and a position's key is all its features' keys
+# XORed together. Moves then update the key by XORing features in and out.
+
+# The generator is seeded, so every process and every run agrees on the keys
+generator = random.Random(0x5EED)
+PIECE_KEYS = {colour: {name: [generator.getrandbits(64) for index in range(64)]
+                       for name in bitboard.PIECE_NAMES}
+              for colour in ("white", "black")}
+CASTLING_KEYS = {colour: {"o-o": generator.getrandbits(64), "o-o-o": generator.getrandbits(64)}
+                 for colour in ("white", "black")}
+EN_PASSANT_KEYS = [generator.getrandbits(64) for file in range(8)]
+SIDE_KEY = generator.getrandbits(64)
+del generator
+
+# Home squares of the kings and rooks. Only moves touching these can change
+# castling rights.
+CASTLING_SQUARES = (bitboard.square_mask((0, 0)) | bitboard.square_mask((4, 0))
+                    | bitboard.square_mask((7, 0)) | bitboard.square_mask((0, 7))
+                    | bitboard.square_mask((4, 7)) | bitboard.square_mask((7, 7)))
+
+
+def castling_key(game_state):
+    """Gives the part of a position's key made up by the castling rights."""
+    key = 0
+    rights = state.castling_rights(game_state)
+    for colour in ("white", "black"):
+        for castle in ("o-o", "o-o-o"):
+            if rights[colour][castle]:
+                key ^= CASTLING_KEYS[colour][castle]
+    return key
+
+
+def en_passant_key(game_state):
+    """Gives the part of a position's key made up by the en passant square.
+    The file only counts when a pawn stands ready to make the capture, so a
+    double move with no pawn next to it doesn't make the position different."""
+    square = game_state.en_passant
+    if square is None:
+        return 0
+    # A square on the third rank was passed over by a white pawn, so black
+    # pawns on the fourth rank could capture, and the other way round
+    if square[1] == 2:
+        capturers = game_state.bitboards.pieces["black"]["Pawn"]
+        pawn_rank = 3
+    else:
+        capturers = game_state.bitboards.pieces["white"]["Pawn"]
+        pawn_rank = 4
+    neighbours = bitboard.KING_ATTACKS[bitboard.square_index((square[0], pawn_rank))] & (0xFF << (8 * pawn_rank))
+    if capturers & neighbours:
+        return EN_PASSANT_KEYS[square[0]]
+    return 0
+
+
+def full_key(game_state):
+    """Works out a position's key from scratch. Moves keep the key up to date
+    as they are made, so this is only needed for new positions, and as a
+    debugging cross-check on the incremental key."""
+    key = 0
+    for piece in game_state.piece_list:
+        position = piece.position
+        key ^= PIECE_KEYS[piece.colour][piece.name][position[1] * 8 + position[0]]
+    key ^= castling_key(game_state)
+    key ^= en_passant_key(game_state)
+    if game_state.whose_turn == "black":
+        key ^= SIDE_KEY
+    return key